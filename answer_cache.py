@@ -0,0 +1,123 @@
+import re
+import copy
+import threading
+from collections import OrderedDict
+import numpy as np
+from tools import loaded_index
+
+ANSWER_CACHE_SIZE = 256
+
+
+def normalize_question(question):
+    """Case-, whitespace- and trailing-punctuation-insensitive form of a question."""
+    return re.sub(r"\s+", " ", question).strip().lower().rstrip("?!. ")
+
+
+class AnswerCache:
+    """
+    LRU cache of handle_chat results keyed on the normalized question, valid for one index
+    fingerprint: the whole cache is dropped as soon as the fingerprint changes. The default,
+    tools.loaded_index, changes once a hot reload has swapped in a newly published version.
+    With a similarity_threshold and an `embed` function, a miss is also matched against the
+    cached questions by cosine similarity, so near-duplicate wording reuses an answer.
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_SIZE, similarity_threshold=None, embed=None,
+                 fingerprint=loaded_index):
+        if similarity_threshold is not None and embed is None:
+            raise ValueError("similarity_threshold needs an embed function")
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.embed = embed
+        self.fingerprint = fingerprint
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._vectors = {}
+        self._pending = {}
+        self._current = None
+        self._lock = threading.Lock()
+
+    def _check_fingerprint(self):
+        current = self.fingerprint()
+        if current != self._current:
+            self._entries.clear()
+            self._vectors.clear()
+            self._pending.clear()
+            self._current = current
+
+    def _nearest(self, vector):
+        keys = list(self._vectors)
+        if not keys:
+            return None
+        matrix = np.array([self._vectors[key] for key in keys])
+        scores = matrix @ vector
+        best = int(np.argmax(scores))
+        return keys[best] if scores[best] >= self.similarity_threshold else None
+
+    def get(self, question):
+        """Cached result for a question, or None. Returns a copy the caller may modify."""
+        key = normalize_question(question)
+        with self._lock:
+            self._check_fingerprint()
+            if key in self._entries:
+                return self._hit(key)
+            if self.similarity_threshold is None or not self._vectors:
+                self.misses += 1
+                return None
+
+        # Embed outside the lock; the vector is kept for the put() that follows a miss
+        vector = self._unit_vector(key)
+        with self._lock:
+            self._pending[key] = vector
+            match = self._nearest(vector)
+            if match is not None and match in self._entries:
+                return self._hit(match)
+            self.misses += 1
+            return None
+
+    def put(self, question, result):
+        key = normalize_question(question)
+        vector = None
+        if self.similarity_threshold is not None:
+            with self._lock:
+                vector = self._pending.pop(key, None)
+            if vector is None:
+                vector = self._unit_vector(key)
+        with self._lock:
+            self._check_fingerprint()
+            self._entries[key] = copy.deepcopy(result)
+            self._entries.move_to_end(key)
+            if vector is not None:
+                self._vectors[key] = vector
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._vectors.pop(evicted, None)
+            while len(self._pending) > self.max_entries:
+                self._pending.pop(next(iter(self._pending)))
+
+    def __contains__(self, question):
+        """Whether the exact (normalized) question is cached, without counting a hit or miss."""
+        key = normalize_question(question)
+        with self._lock:
+            self._check_fingerprint()
+            return key in self._entries
+
+    def _hit(self, key):
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(self._entries[key])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._vectors.clear()
+            self._pending.clear()
+
+    def _unit_vector(self, text):
+        vector = np.asarray(self.embed(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def __len__(self):
+        return len(self._entries)
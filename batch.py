@@ -0,0 +1,155 @@
+import sys
+import json
+import time
+import asyncio
+import argparse
+from contextlib import ExitStack, contextmanager
+import numpy as np
+import main
+from tools import get_vectorstore
+from retrieval import retrieval_settings
+from fakes import FakeAgent
+from embedding_cache import PrefetchedQueryEmbeddings
+
+BATCH_CONCURRENCY = 8
+
+
+def load_questions(path):
+    """
+    Read questions from a JSONL file. Each line is either a JSON string or an object with a
+    "question" key; any other keys (an "id", expected answers, ...) are carried into the results.
+    """
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"question": item}
+            if not isinstance(item, dict) or not isinstance(item.get("question"), str):
+                raise ValueError(f"{path}:{line_number}: expected a string or an object with a 'question' key")
+            items.append(item)
+    return items
+
+
+def questions_to_prefetch(questions):
+    """
+    The questions whose query embedding the batch will need: none in lexical retrieval mode,
+    which never embeds, and none the answer cache already holds, since those never retrieve.
+    """
+    if retrieval_settings()["mode"] == "lexical":
+        return []
+    cache = main.get_answer_cache()
+    if cache.max_entries <= 0:
+        return list(questions)
+    return [question for question in questions if question not in cache]
+
+
+@contextmanager
+def query_prefetch(vectorstore, questions):
+    """
+    Embed the batch's questions in one call and serve the retriever's embed_query from them
+    while the block runs. The vectorstore is unwrapped afterwards, so the vectors go with it;
+    a wrapper another batch already installed is reused and left to that batch.
+    """
+    prefetch = vectorstore.embedding_function
+    owner = not isinstance(prefetch, PrefetchedQueryEmbeddings)
+    if owner:
+        prefetch = PrefetchedQueryEmbeddings(prefetch)
+        vectorstore.embedding_function = prefetch
+    try:
+        prefetch.prefetch(questions)
+        yield prefetch
+    finally:
+        if owner:
+            vectorstore.embedding_function = prefetch.underlying
+            prefetch.clear()
+
+
+async def run_batch(questions, concurrency=BATCH_CONCURRENCY, agent=None):
+    """
+    Answer many questions concurrently through handle_chat_async, at most `concurrency` at a time.
+    questions is a list of strings or of {"question": ...} dicts. Yields one result per question
+    in input order as soon as it and every earlier question are answered; each result carries
+    the input fields plus answer, sources and latency, or error if that question failed.
+    Query embeddings are prefetched for the batch's duration only (see query_prefetch).
+    """
+    items = [{"question": q} if isinstance(q, str) else dict(q) for q in questions]
+    slots = asyncio.Semaphore(concurrency)
+
+    async def answer(item):
+        async with slots:
+            start = time.perf_counter()
+            try:
+                response = await main.handle_chat_async(item["question"], agent=agent)
+            except Exception as e:
+                response = {"error": str(e)}
+            return dict(item, **response, latency=round(time.perf_counter() - start, 4))
+
+    with ExitStack() as stack:
+        prefetch = questions_to_prefetch([item["question"] for item in items]) if agent is None else []
+        if prefetch:
+            # One embedding call for the whole batch instead of one per retriever query
+            await asyncio.to_thread(stack.enter_context, query_prefetch(get_vectorstore(), prefetch))
+
+        tasks = [asyncio.create_task(answer(item)) for item in items]
+        try:
+            for task in tasks:
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def answer_questions(questions, concurrency=BATCH_CONCURRENCY, agent=None):
+    """Blocking helper around run_batch that returns every result as a list, in input order."""
+    async def collect():
+        return [result async for result in run_batch(questions, concurrency, agent)]
+    return asyncio.run(collect())
+
+
+async def write_results(questions, out, concurrency=BATCH_CONCURRENCY, agent=None):
+    """Stream results to out as JSONL and print a latency summary to stderr."""
+    start = time.perf_counter()
+    latencies = []
+    errors = 0
+    async for result in run_batch(questions, concurrency, agent):
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+        latencies.append(result["latency"])
+        errors += "error" in result
+    elapsed = time.perf_counter() - start
+
+    if latencies:
+        p50, p95 = np.percentile(latencies, [50, 95])
+        print(
+            f"Answered {len(latencies)} questions in {elapsed:.2f}s ({len(latencies) / elapsed:.2f} questions/s, "
+            f"p50 {p50:.2f}s, p95 {p95:.2f}s, {errors} errors)",
+            file=sys.stderr
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions concurrently.")
+    parser.add_argument("questions", help="JSONL file: one question string or {\"question\": ...} object per line.")
+    parser.add_argument("--output", default="-", help="Where to write JSONL results (default: stdout).")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY,
+                        help="Questions answered at the same time.")
+    parser.add_argument("--fake-llm", type=float, metavar="SECONDS", default=None,
+                        help="Answer with a fake agent after this delay instead of calling OpenAI.")
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    questions = load_questions(args.questions)
+    agent = FakeAgent(args.fake_llm) if args.fake_llm is not None else None
+    if args.output == "-":
+        asyncio.run(write_results(questions, sys.stdout, args.concurrency, agent))
+    else:
+        with open(args.output, "w", encoding="utf-8") as out:
+            asyncio.run(write_results(questions, out, args.concurrency, agent))
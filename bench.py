@@ -0,0 +1,350 @@
+import os
+import sys
+import json
+import time
+import random
+import zipfile
+import platform
+import argparse
+import tempfile
+import subprocess
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from unittest.mock import patch
+from xml.sax.saxutils import escape
+import faiss
+import numpy as np
+from bench_loaders import make_workbook
+from index_versions import resolve_index
+
+# main builds its ChatOpenAI client on import; the benchmark never calls OpenAI, but the client needs a key
+os.environ.setdefault("OPENAI_API_KEY", "sk-offline-benchmark")
+
+BENCH_DOCUMENTS = 20
+BENCH_PAGES = 5
+BENCH_ROWS = 500
+BENCH_QUERIES = 50
+EMBED_LATENCY = 0.0
+LLM_LATENCY = 0.0
+PARAGRAPHS_PER_PAGE = 6
+SEED = 7
+
+TOPICS = [
+    "invoice", "interview", "salary", "offer", "contract", "budget", "roadmap", "hiring", "security",
+    "migration", "launch", "deadline", "vendor", "benefits", "relocation", "onboarding", "review", "travel",
+]
+WORDS = [
+    "the", "team", "agreed", "to", "review", "quarterly", "numbers", "before", "sending", "final", "draft",
+    "customer", "asked", "for", "updated", "terms", "manager", "approved", "plan", "with", "minor", "changes",
+    "project", "schedule", "moved", "because", "of", "holiday", "notes", "include", "action", "items", "owner",
+]
+
+# Metrics compared by --compare, and whether a higher value is better
+COMPARED = {
+    ("ingest", "files_per_second"): True,
+    ("ingest", "chunks_per_second"): True,
+    ("ingest", "index_bytes"): False,
+    ("ingest", "peak_rss_mb"): False,
+    ("query", "p50_seconds"): False,
+    ("query", "p99_seconds"): False,
+    ("query", "queries_per_second"): True,
+    ("query", "peak_rss_mb"): False,
+}
+
+
+def paragraph(rng, topic, number):
+    """One deterministic sentence group mentioning a topic and an identifier retrieval can match."""
+    words = " ".join(rng.choice(WORDS) for _ in range(40))
+    return f"Note {number} about the {topic}: {words}. Reference {topic.upper()}-{number:05d}."
+
+
+def make_pdf(path, pages):
+    """A minimal PDF with one text page per entry of `pages` (lists of lines), readable by pypdf."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        text = "".join(
+            "(" + line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ") Tj T* " for line in lines
+        )
+        stream = f"BT /F1 9 Tf 11 TL 40 800 Td {text}ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Contents {len(objects)} 0 R "
+            "/Resources << /Font << /F1 3 0 R >> >> >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    data += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def make_docx(path, paragraphs):
+    """A minimal .docx package holding the given paragraphs."""
+    body = "".join(f"<w:p><w:r><w:t>{escape(text)}</w:t></w:r></w:p>" for text in paragraphs)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", (
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/word/document.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/></Types>'
+        ))
+        archive.writestr("_rels/.rels", (
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Target="word/document.xml" Type="http://schemas.openxmlformats.org/'
+            'officeDocument/2006/relationships/officeDocument"/></Relationships>'
+        ))
+        archive.writestr("word/document.xml", (
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f"<w:body>{body}</w:body></w:document>"
+        ))
+
+
+def make_corpus(folder, documents=BENCH_DOCUMENTS, pages=BENCH_PAGES, rows=BENCH_ROWS, seed=SEED):
+    """
+    Write `documents` files into folder, cycling through PDF, DOCX and XLSX. PDFs have `pages`
+    pages and DOCX files as many paragraphs; workbooks have `rows` rows. The same arguments
+    always produce the same corpus. Returns the questions the corpus can answer.
+    """
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    questions = []
+    for i in range(documents):
+        topic = TOPICS[i % len(TOPICS)]
+        kind = ("pdf", "docx", "xlsx")[i % 3]
+        path = os.path.join(folder, f"{kind}_{i:04d}_{topic}.{kind}")
+        if kind == "pdf":
+            make_pdf(path, [
+                [paragraph(rng, topic, i * 1000 + page * 10 + n) for n in range(PARAGRAPHS_PER_PAGE)]
+                for page in range(pages)
+            ])
+        elif kind == "docx":
+            make_docx(path, [paragraph(rng, topic, i * 1000 + n) for n in range(pages * PARAGRAPHS_PER_PAGE)])
+        else:
+            make_workbook(path, rows)
+        questions.append(f"What did the {topic} notes in document {i} say about reference {topic.upper()}-{i * 1000:05d}?")
+    return questions
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, or None where `resource` is missing (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def folder_bytes(folder):
+    return sum(
+        os.path.getsize(os.path.join(dirpath, name)) for dirpath, _, names in os.walk(folder) for name in names
+    )
+
+
+@contextlib.contextmanager
+def workspace(folder, embed_latency, llm_latency):
+    """
+    Run inside folder (ingest and chat use paths relative to the working directory) with the
+    OpenAI embeddings and chat model replaced by the deterministic stand-ins from fakes.py.
+    """
+    import ingest
+    import main
+    import tools
+    from fakes import FakeEmbeddings, FakeChatModel
+
+    def fake_embeddings(name=None, client_options=None):
+        return FakeEmbeddings(embed_latency)
+
+    previous = os.getcwd()
+    os.chdir(folder)
+    try:
+        with patch.object(ingest, "create_embeddings", fake_embeddings), \
+                patch.object(tools, "create_embeddings", fake_embeddings), \
+                patch.object(main, "model", FakeChatModel(llm_latency)), \
+                patch.dict(os.environ, {"CHAT_MODE": "direct", "ANSWER_CACHE_SIZE": "0"}):
+            tools.reset_vectorstore()
+            main._answer_cache = None
+            yield
+    finally:
+        tools.reset_vectorstore()
+        main._answer_cache = None
+        os.chdir(previous)
+
+
+def run_ingest(folder, embed_latency=EMBED_LATENCY, workers=1, stream=False):
+    """Ingest folder/data into folder/db with build_vector_db; returns throughput, index size and peak RSS."""
+    import ingest
+
+    with open(os.devnull, "w") as devnull, workspace(folder, embed_latency, 0.0), contextlib.redirect_stdout(devnull):
+        files = len(os.listdir(ingest.SOURCE_DIR))
+        start = time.perf_counter()
+        ingest.build_vector_db(workers=workers, stream=stream)
+        seconds = time.perf_counter() - start
+        manifest = ingest.load_manifest()
+        chunks = sum(len(entry.get("ids", [])) for entry in manifest.values())
+        published = resolve_index(ingest.FAISS_INDEX_PATH)
+        vectors = faiss.read_index(os.path.join(published, "index.faiss")).ntotal
+        stages = {}
+        if os.path.isfile(ingest.INGEST_METRICS_FILE):
+            with open(ingest.INGEST_METRICS_FILE) as f:
+                stages = json.loads(f.readlines()[-1]).get("stages", {})
+        index_bytes = folder_bytes(published)
+    return {
+        "files": files,
+        "chunks": chunks,
+        "vectors": vectors,
+        "seconds": round(seconds, 3),
+        "files_per_second": round(files / seconds, 2),
+        "chunks_per_second": round(chunks / seconds, 1),
+        "index_bytes": index_bytes,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": {name: stats["seconds"] for name, stats in stages.items()},
+    }
+
+
+def run_queries(folder, questions, embed_latency=EMBED_LATENCY, llm_latency=LLM_LATENCY):
+    """Answer every question with handle_chat against the index in folder/db; returns latency percentiles."""
+    import main
+    from tools import get_vectorstore
+
+    with open(os.devnull, "w") as devnull, workspace(folder, embed_latency, llm_latency), \
+            contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        get_vectorstore()
+        load_seconds = time.perf_counter() - start
+        latencies = []
+        start = time.perf_counter()
+        for question in questions:
+            query_start = time.perf_counter()
+            main.handle_chat(question)
+            latencies.append(time.perf_counter() - query_start)
+        seconds = time.perf_counter() - start
+    latencies = np.asarray(latencies)
+    return {
+        "queries": len(questions),
+        "index_load_seconds": round(load_seconds, 4),
+        "p50_seconds": round(float(np.percentile(latencies, 50)), 5),
+        "p99_seconds": round(float(np.percentile(latencies, 99)), 5),
+        "mean_seconds": round(float(latencies.mean()), 5),
+        "queries_per_second": round(len(questions) / seconds, 2),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(folder, documents=BENCH_DOCUMENTS, pages=BENCH_PAGES, rows=BENCH_ROWS, queries=BENCH_QUERIES,
+                  embed_latency=EMBED_LATENCY, llm_latency=LLM_LATENCY, workers=1, stream=False, isolate=True):
+    """
+    Generate the corpus in folder/data, ingest it, then answer `queries` questions about it.
+    With isolate=True each phase runs in a fresh process, so its peak RSS is its own.
+    """
+    questions = make_corpus(os.path.join(folder, "data"), documents, pages, rows)
+    questions = [questions[i % len(questions)] for i in range(queries)]
+
+    def call(fn, *args):
+        if not isolate:
+            return fn(*args)
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            return pool.submit(fn, *args).result()
+
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "settings": {
+            "documents": documents, "pages": pages, "rows": rows, "queries": queries,
+            "embed_latency": embed_latency, "llm_latency": llm_latency, "workers": workers, "stream": stream,
+        },
+        "ingest": call(run_ingest, folder, embed_latency, workers, stream),
+        "query": call(run_queries, folder, questions, embed_latency, llm_latency),
+    }
+
+
+def compare(previous, current):
+    """Lines describing how each compared metric moved, flagging regressions."""
+    lines = []
+    for (phase, name), higher_is_better in COMPARED.items():
+        old, new = previous.get(phase, {}).get(name), current.get(phase, {}).get(name)
+        if not old or new is None:
+            continue
+        change = (new - old) / old * 100
+        worse = change < 0 if higher_is_better else change > 0
+        flag = "  <- regression" if worse and abs(change) >= 10 else ""
+        lines.append(f"{phase + '.' + name:<26} {old:>12} -> {new:<12} ({change:+.1f}%){flag}")
+    return lines
+
+
+def _rss(megabytes):
+    return "n/a" if megabytes is None else f"{megabytes:.1f} MB"
+
+
+def print_results(results):
+    ingest, query = results["ingest"], results["query"]
+    print(f"Ingest: {ingest['files']} files, {ingest['chunks']} chunks in {ingest['seconds']:.2f}s "
+          f"({ingest['files_per_second']:.2f} docs/s, {ingest['chunks_per_second']:.1f} chunks/s), "
+          f"index {ingest['index_bytes'] / (1 << 20):.2f} MB, peak RSS {_rss(ingest['peak_rss_mb'])}")
+    if ingest["stages"]:
+        print("  " + ", ".join(f"{name[len('ingest.'):]} {seconds:.2f}s" for name, seconds in ingest["stages"].items()))
+    print(f"Query: {query['queries']} questions, p50 {query['p50_seconds'] * 1000:.1f} ms, "
+          f"p99 {query['p99_seconds'] * 1000:.1f} ms, {query['queries_per_second']:.1f} q/s, "
+          f"peak RSS {_rss(query['peak_rss_mb'])}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Offline ingest and chat benchmark on a synthetic corpus with local stand-in models."
+    )
+    parser.add_argument("--documents", type=int, default=BENCH_DOCUMENTS, help="Files in the corpus (PDF, DOCX, XLSX).")
+    parser.add_argument("--pages", type=int, default=BENCH_PAGES, help="Pages per PDF (and page-equivalents per DOCX).")
+    parser.add_argument("--rows", type=int, default=BENCH_ROWS, help="Rows per workbook.")
+    parser.add_argument("--queries", type=int, default=BENCH_QUERIES, help="Questions answered with handle_chat.")
+    parser.add_argument("--embed-latency", type=float, default=EMBED_LATENCY,
+                        help="Seconds each stand-in embedding call waits.")
+    parser.add_argument("--llm-latency", type=float, default=LLM_LATENCY, help="Seconds each stand-in LLM call waits.")
+    parser.add_argument("--workers", type=int, default=1, help="Ingest worker processes.")
+    parser.add_argument("--stream", action="store_true", help="Ingest in streaming mode.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", metavar="JSON", help="Results of an earlier run to compare against.")
+    args = parser.parse_args(argv)
+    if args.documents < 1 or args.queries < 1:
+        parser.error("--documents and --queries must be at least 1")
+    if args.stream and args.workers > 1:
+        parser.error("--stream cannot be combined with --workers")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as folder:
+        results = run_benchmark(
+            folder, args.documents, args.pages, args.rows, args.queries, args.embed_latency, args.llm_latency,
+            args.workers, args.stream
+        )
+    print_results(results)
+    if args.compare:
+        with open(args.compare) as f:
+            print(f"Compared with {args.compare}:")
+            print("\n".join(compare(json.load(f), results)))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from openpyxl import Workbook
+from langchain_community.document_loaders import UnstructuredExcelLoader, UnstructuredPowerPointLoader
+from loaders import XlsxLoader, PptxLoader
+
+BENCH_ROWS = 20000
+BENCH_SLIDES = 200
+
+LOADERS = {
+    ".xlsx": {
+        "fast": lambda path: XlsxLoader(path),
+        "unstructured": lambda path: UnstructuredExcelLoader(path, mode="elements"),
+    },
+    ".pptx": {
+        "fast": lambda path: PptxLoader(path),
+        "unstructured": lambda path: UnstructuredPowerPointLoader(path, mode="elements"),
+    },
+}
+
+
+def make_workbook(path, rows):
+    """A job-tracker style workbook with two sheets, written in openpyxl's streaming mode."""
+    workbook = Workbook(write_only=True)
+    jobs = workbook.create_sheet("Jobs")
+    jobs.append(["Company", "Role", "Location", "Applied", "Salary", "Status", "Notes"])
+    for i in range(rows):
+        jobs.append([f"Company {i}", "Software Engineer", "Remote", "2025-01-01", 100000 + i,
+                     "Interview" if i % 3 else "Applied", f"Referral from contact {i % 97}"])
+    contacts = workbook.create_sheet("Contacts")
+    contacts.append(["Name", "Email", "Company"])
+    for i in range(rows // 10):
+        contacts.append([f"Person {i}", f"person{i}@example.com", f"Company {i}"])
+    workbook.save(path)
+
+
+def make_deck(path, slides):
+    """A text-and-table deck, if python-pptx (needed by the Unstructured loader anyway) is installed."""
+    from pptx import Presentation
+    from pptx.util import Inches
+    deck = Presentation()
+    for i in range(slides):
+        slide = deck.slides.add_slide(deck.slide_layouts[1])
+        slide.shapes.title.text = f"Pipeline review {i}"
+        slide.placeholders[1].text = f"Networking is the most likely avenue for interview {i}"
+        table = slide.shapes.add_table(3, 3, Inches(1), Inches(4), Inches(6), Inches(1)).table
+        for r in range(3):
+            for c in range(3):
+                table.cell(r, c).text = f"cell {r}.{c} of slide {i}"
+    deck.save(path)
+
+
+def measure(path, loader):
+    """Load one file in this (fresh) process; returns time, output size and peak memory growth."""
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    documents = characters = 0
+    for doc in LOADERS[os.path.splitext(path)[1].lower()][loader](path).lazy_load():
+        documents += 1
+        characters += len(doc.page_content)
+    seconds = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    return {"seconds": round(seconds, 3), "documents": documents, "characters": characters,
+            "peak_rss_mb": round(peak_mb, 1)}
+
+
+def run_benchmark(paths):
+    """Time every loader on every path, each run in its own process so memory peaks do not mix."""
+    results = []
+    for path in paths:
+        for loader in LOADERS[os.path.splitext(path)[1].lower()]:
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                try:
+                    result = pool.submit(measure, path, loader).result()
+                except Exception as e:
+                    result = {"error": repr(e)}
+            results.append(dict({"file": os.path.basename(path), "loader": loader}, **result))
+    return results
+
+
+def print_results(results):
+    print(f"{'file':<24} {'loader':<14} {'seconds':>9} {'docs':>7} {'chars':>10} {'peak MB':>8}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['file']:<24} {r['loader']:<14} failed: {r['error']}")
+        else:
+            print(f"{r['file']:<24} {r['loader']:<14} {r['seconds']:>9.3f} {r['documents']:>7} "
+                  f"{r['characters']:>10} {r['peak_rss_mb']:>8.1f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare the fast .xlsx/.pptx loaders with the Unstructured loaders."
+    )
+    parser.add_argument("files", nargs="*", help="Workbooks and decks to load (default: generate synthetic ones).")
+    parser.add_argument("--rows", type=int, default=BENCH_ROWS, help="Rows in the synthetic workbook.")
+    parser.add_argument("--slides", type=int, default=BENCH_SLIDES, help="Slides in the synthetic deck.")
+    parser.add_argument("--output", help="Also write the results to this JSON file.")
+    args = parser.parse_args(argv)
+    for path in args.files:
+        if os.path.splitext(path)[1].lower() not in LOADERS:
+            parser.error(f"{path}: only .xlsx and .pptx files are benchmarked")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as folder:
+        paths = args.files
+        if not paths:
+            paths = [os.path.join(folder, f"synthetic_{args.rows}_rows.xlsx")]
+            make_workbook(paths[0], args.rows)
+            try:
+                make_deck(os.path.join(folder, f"synthetic_{args.slides}_slides.pptx"), args.slides)
+                paths.append(os.path.join(folder, f"synthetic_{args.slides}_slides.pptx"))
+            except ImportError:
+                print("python-pptx is not installed; skipping the synthetic deck.")
+        results = run_benchmark(paths)
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
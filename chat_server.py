@@ -0,0 +1,245 @@
+import json
+import asyncio
+import argparse
+import contextlib
+from http import HTTPStatus
+import main
+import metrics
+from fakes import FakeAgent
+
+HOST = "127.0.0.1"
+PORT = 8000
+MAX_CONCURRENCY = 16
+# Requests allowed to wait for a free slot; beyond that the server answers 503 immediately
+MAX_QUEUE = 64
+REQUEST_TIMEOUT = 60.0
+HEADER_TIMEOUT = 10.0
+MAX_BODY_BYTES = 64 * 1024
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class ChatServer:
+    """
+    Minimal HTTP/JSON front end for handle_chat_async, serving every conversation on one event loop.
+
+    POST /chat         {"question": "..."}  ->  {"answer": "...", "sources": [...], "latency": seconds}
+    POST /chat/stream  {"question": "..."}  ->  newline-delimited JSON events from main.stream_chat_async,
+                                                ending with a "done" event that reports ttft and latency
+    GET  /health                            ->  {"status": "ok", "running": n, "queued": n}
+    GET  /metrics                           ->  stage timers and counters (see metrics) in the Prometheus
+                                                text format, plus running/queued gauges
+
+    At most max_concurrency questions run at once and max_queue more may wait for a slot;
+    further requests get 503 with Retry-After so clients back off instead of piling up.
+    A question that takes longer than timeout seconds is cancelled and answered with 504.
+    """
+
+    def __init__(self, agent=None, max_concurrency=MAX_CONCURRENCY, max_queue=MAX_QUEUE,
+                 timeout=REQUEST_TIMEOUT):
+        self.agent = agent
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.running = 0
+        self.queued = 0
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """Wait for a free slot, or fail fast with 503 when the wait queue is full."""
+        if self.running + self.queued >= self.max_concurrency + self.max_queue:
+            metrics.count("chat.rejected")
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "Server busy, retry later.", {"Retry-After": "1"})
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self._slots.release()
+
+    async def chat(self, question):
+        async with self.slot():
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            try:
+                response = await asyncio.wait_for(main.handle_chat_async(question, agent=self.agent), self.timeout)
+            except asyncio.TimeoutError:
+                metrics.count("chat.timeouts")
+                raise HTTPError(HTTPStatus.GATEWAY_TIMEOUT, f"No answer within {self.timeout:g}s.")
+        return dict(response, latency=round(loop.time() - start, 4))
+
+    async def stream(self, writer, question):
+        """
+        Write events for one question as they arrive. Errors before the first event still get
+        a proper status code; after that they are reported as a final {"type": "error"} event.
+        """
+        async with self.slot():
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.timeout
+            events = main.stream_chat_async(question, agent=self.agent)
+            try:
+                try:
+                    event = await asyncio.wait_for(anext(events), self.timeout)
+                except asyncio.TimeoutError:
+                    metrics.count("chat.timeouts")
+                    raise HTTPError(HTTPStatus.GATEWAY_TIMEOUT, f"No answer within {self.timeout:g}s.")
+                head = ["HTTP/1.1 200 OK", "Content-Type: application/x-ndjson", "Connection: close"]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+                while True:
+                    writer.write(json.dumps(event).encode("utf-8") + b"\n")
+                    await writer.drain()
+                    try:
+                        event = await asyncio.wait_for(anext(events), deadline - loop.time())
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        metrics.count("chat.timeouts")
+                        event = {"type": "error", "error": f"No answer within {self.timeout:g}s."}
+                    except Exception as e:
+                        event = {"type": "error", "error": str(e)}
+                    if event["type"] == "error":
+                        writer.write(json.dumps(event).encode("utf-8") + b"\n")
+                        break
+            finally:
+                await events.aclose()
+
+    @staticmethod
+    def parse_question(method, body):
+        if method != "POST":
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Use POST.")
+        try:
+            payload = json.loads(body or b"null")
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Body must be JSON.")
+        question = payload.get("question") if isinstance(payload, dict) else None
+        if not isinstance(question, str) or not question.strip():
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Body must be {"question": "..."}.')
+        return question
+
+    async def route(self, method, path, body):
+        if path == "/health":
+            if method != "GET":
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET.")
+            return {"status": "ok", "running": self.running, "queued": self.queued}
+        if path == "/chat":
+            return await self.chat(self.parse_question(method, body))
+        raise HTTPError(HTTPStatus.NOT_FOUND, f"No route for {path}.")
+
+    def metrics_text(self, method):
+        if method != "GET":
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET.")
+        return metrics.registry.prometheus(gauges={"chat.running": self.running, "chat.queued": self.queued})
+
+    async def read_request(self, reader):
+        """Parse one HTTP/1.1 request; returns (method, path, body)."""
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), HEADER_TIMEOUT)
+            parts = request_line.decode("latin-1").split()
+            if len(parts) != 3:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line.")
+            method, path, _ = parts
+            content_length = 0
+            while True:
+                line = await asyncio.wait_for(reader.readline(), HEADER_TIMEOUT)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.strip().lower() == "content-length":
+                    content_length = int(value.strip())
+            if content_length > MAX_BODY_BYTES:
+                raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Body exceeds {MAX_BODY_BYTES} bytes.")
+            body = await asyncio.wait_for(reader.readexactly(content_length), HEADER_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise HTTPError(HTTPStatus.REQUEST_TIMEOUT, "Request not received in time.")
+        except (ValueError, asyncio.IncompleteReadError):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request.")
+        return method, path.split("?", 1)[0], body
+
+    async def handle_connection(self, reader, writer):
+        headers = {}
+        content_type = "application/json"
+        try:
+            method, path, body = await self.read_request(reader)
+            if path == "/chat/stream":
+                try:
+                    await self.stream(writer, self.parse_question(method, body))
+                except ConnectionError:
+                    pass
+                writer.close()
+                return
+            if path == "/metrics":
+                status, payload, content_type = HTTPStatus.OK, self.metrics_text(method), metrics.PROMETHEUS_CONTENT_TYPE
+            else:
+                status, payload = HTTPStatus.OK, await self.route(method, path, body)
+        except HTTPError as e:
+            status, payload, headers = e.status, {"error": str(e)}, e.headers
+        except Exception as e:
+            status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}
+
+        data = payload.encode("utf-8") if isinstance(payload, str) else json.dumps(payload).encode("utf-8")
+        head = [f"HTTP/1.1 {status.value} {status.phrase}", f"Content-Type: {content_type}",
+                f"Content-Length: {len(data)}", "Connection: close"]
+        head += [f"{name}: {value}" for name, value in headers.items()]
+        try:
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host=HOST, port=PORT):
+        """Start listening and return the asyncio server (port 0 picks a free port)."""
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+
+async def serve(server, host=HOST, port=PORT):
+    if server.agent is None:
+        # Load the index and build the agent before accepting traffic
+        await asyncio.to_thread(main.get_agent)
+    listener = await server.start(host, port)
+    print(f"Chat server listening on http://{host}:{listener.sockets[0].getsockname()[1]} "
+          f"(concurrency {server.max_concurrency}, queue {server.max_queue}, timeout {server.timeout:g}s)")
+    async with listener:
+        await listener.serve_forever()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve handle_chat over HTTP/JSON.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY,
+                        help="Questions answered at the same time.")
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE,
+                        help="Questions allowed to wait for a slot before the server answers 503.")
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT,
+                        help="Seconds before an unanswered question is cancelled with 504.")
+    parser.add_argument("--fake-llm", type=float, metavar="SECONDS", default=None,
+                        help="Answer with a fake agent after this delay instead of calling OpenAI (load testing).")
+    args = parser.parse_args(argv)
+    if args.max_concurrency < 1:
+        parser.error("--max-concurrency must be at least 1")
+    if args.max_queue < 0:
+        parser.error("--max-queue must not be negative")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    agent = FakeAgent(args.fake_llm) if args.fake_llm is not None else None
+    server = ChatServer(agent, args.max_concurrency, args.max_queue, args.timeout)
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,210 @@
+import os
+import re
+import zlib
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+DEDUP_FILE = "dedup.sqlite"
+# Estimated Jaccard similarity of word shingles above which two chunks count as near-duplicates
+NEAR_DUP_THRESHOLD = 0.9
+NUM_PERM = 64
+# 8 bands of 8 rows: pairs at the threshold become LSH candidates with ~99% probability
+LSH_BANDS = 8
+SHINGLE_WORDS = 3
+_PRIME = (1 << 31) - 1
+_SQL_BATCH = 500
+
+_rng = np.random.RandomState(20240501)
+_A = _rng.randint(1, _PRIME, NUM_PERM).astype(np.int64)
+_B = _rng.randint(0, _PRIME, NUM_PERM).astype(np.int64)
+_WORD = re.compile(r"\w+")
+
+
+def normalize(text):
+    """Lowercased words only, so whitespace, punctuation and case differences do not matter."""
+    return " ".join(_WORD.findall(text.lower()))
+
+
+def exact_key(text):
+    return hashlib.sha256(normalize(text).encode("utf-8")).hexdigest()
+
+
+def minhash(text):
+    """MinHash signature (NUM_PERM uint32 values) of a text's word SHINGLE_WORDS-grams."""
+    words = normalize(text).split()
+    if len(words) > SHINGLE_WORDS:
+        shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    else:
+        shingles = {" ".join(words)}
+    x = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.int64, count=len(shingles))
+    return ((_A[:, None] * x[None, :] + _B[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.mean(a == b))
+
+
+def band_keys(signature):
+    rows = NUM_PERM // LSH_BANDS
+    return [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(LSH_BANDS)]
+
+
+def dedup_path(folder):
+    return os.path.join(folder, DEDUP_FILE)
+
+
+class DedupIndex:
+    """
+    Exact and near-duplicate detection for the chunks of one index, kept in an SQLite file next to it.
+    Every chunk stored in the vectorstore has its normalized-text hash and MinHash signature here,
+    with the signature split into LSH bands so candidates are found without comparing all pairs.
+    `refs` records which sources (manifest keys) use each stored chunk: a duplicate adds its source
+    to the chunk it matched instead of being embedded. A chunk is only deleted from the vectorstore
+    once no source refers to it any more (see release). Writes are held until commit(), like the
+    docstore and lexical index. threshold=None keeps the records for release only (ingest --no-dedup):
+    new chunks are neither checked nor recorded.
+    """
+
+    def __init__(self, path, threshold=NEAR_DUP_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self.exact = 0
+        self.near = 0
+        self.saved_chars = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, exact TEXT NOT NULL, signature BLOB NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_exact ON chunks (exact)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS bands (band INTEGER NOT NULL, bucket BLOB NOT NULL, id TEXT NOT NULL, "
+                "PRIMARY KEY (band, bucket, id)) WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS bands_id ON bands (id)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS refs (id TEXT NOT NULL, source TEXT NOT NULL, PRIMARY KEY (id, source)) "
+                "WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS refs_source ON refs (source)")
+        return self._conn
+
+    def _near_match(self, conn, signature):
+        candidates = set()
+        for band, bucket in band_keys(signature):
+            candidates.update(row[0] for row in conn.execute(
+                "SELECT id FROM bands WHERE band = ? AND bucket = ?", (band, bucket)
+            ))
+        best, best_score = None, self.threshold
+        for doc_id in sorted(candidates):
+            (blob,) = conn.execute("SELECT signature FROM chunks WHERE id = ?", (doc_id,)).fetchone()
+            score = similarity(signature, np.frombuffer(blob, dtype=np.uint32))
+            if score >= best_score:
+                best, best_score = doc_id, score
+        return best
+
+    def check(self, text, doc_id, source):
+        """
+        ID under which a chunk is stored: doc_id for a new chunk (registered here so later chunks
+        can match it), or the ID of the stored chunk it duplicates. Either way source now refers to it.
+        """
+        key = exact_key(text)
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT id FROM chunks WHERE exact = ? ORDER BY id LIMIT 1", (key,)).fetchone()
+            match = row[0] if row else None
+            signature = None
+            if match is None and self.threshold < 1:
+                signature = minhash(text)
+                match = self._near_match(conn, signature)
+                if match is not None and match != doc_id:
+                    self.near += 1
+            elif match is not None and match != doc_id:
+                self.exact += 1
+            if match is not None:
+                if match != doc_id:
+                    self.saved_chars += len(text)
+                conn.execute("INSERT OR IGNORE INTO refs (id, source) VALUES (?, ?)", (match, source))
+                return match
+
+            if signature is None:
+                signature = minhash(text)
+            conn.execute("INSERT OR REPLACE INTO chunks (id, exact, signature) VALUES (?, ?, ?)",
+                         (doc_id, key, signature.tobytes()))
+            conn.executemany("INSERT OR IGNORE INTO bands (band, bucket, id) VALUES (?, ?, ?)",
+                             [(band, bucket, doc_id) for band, bucket in band_keys(signature)])
+            conn.execute("INSERT OR IGNORE INTO refs (id, source) VALUES (?, ?)", (doc_id, source))
+            return doc_id
+
+    def release(self, source, ids):
+        """
+        Drop source's references to ids; returns the IDs no source refers to any more, which the
+        caller deletes from the vectorstore. IDs this index never saw (older entries) are returned as is.
+        """
+        ids = list(dict.fromkeys(ids))
+        with self._lock:
+            conn = self._connect()
+            unused = []
+            for i in range(0, len(ids), _SQL_BATCH):
+                batch = ids[i:i + _SQL_BATCH]
+                marks = ",".join("?" * len(batch))
+                conn.execute(f"DELETE FROM refs WHERE source = ? AND id IN ({marks})", [source, *batch])
+                used = {row[0] for row in conn.execute(f"SELECT DISTINCT id FROM refs WHERE id IN ({marks})", batch)}
+                gone = [doc_id for doc_id in batch if doc_id not in used]
+                if gone:
+                    marks = ",".join("?" * len(gone))
+                    conn.execute(f"DELETE FROM chunks WHERE id IN ({marks})", gone)
+                    conn.execute(f"DELETE FROM bands WHERE id IN ({marks})", gone)
+                unused.extend(gone)
+            return unused
+
+    def sources(self, doc_id):
+        """Every source that contains this chunk (or a near-duplicate of it)."""
+        with self._lock:
+            return sorted(row[0] for row in self._connect().execute("SELECT source FROM refs WHERE id = ?", (doc_id,)))
+
+    def shared_chunks(self):
+        """Number of stored chunks used by more than one source."""
+        with self._lock:
+            (count,) = self._connect().execute(
+                "SELECT COUNT(*) FROM (SELECT id FROM refs GROUP BY id HAVING COUNT(*) > 1)"
+            ).fetchone()
+        return count
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            for table in ("chunks", "bands", "refs"):
+                conn.execute(f"DELETE FROM {table}")
+
+    def commit(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.commit()
+
+    def close(self):
+        """Close without committing: records only persist through commit(), at index checkpoints."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.rollback()
+                self._conn.close()
+                self._conn = None
+
+    def report(self, dimension):
+        """One line on what deduplication saved in this run, or None if nothing was a duplicate."""
+        skipped = self.exact + self.near
+        if not skipped:
+            return None
+        # Each skipped chunk saves one float32 vector plus its text in the docstore
+        saved_bytes = skipped * dimension * 4 + self.saved_chars
+        return (f"Dedup: skipped {skipped} duplicate chunks ({self.exact} exact, {self.near} near): "
+                f"{skipped} embeddings and {saved_bytes / (1 << 20):.2f} MB of index space saved")
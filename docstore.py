@@ -0,0 +1,191 @@
+import os
+import json
+import pickle
+import sqlite3
+import argparse
+import threading
+from langchain_core.documents import Document
+from langchain_community.docstore.base import Docstore, AddableMixin
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from index_versions import update_published
+
+DOCSTORE_FILE = "docstore.sqlite"
+DOCSTORE_KINDS = ("memory", "sqlite")
+# Pickle written by FAISS.save_local for the exact index; a published search index shares it
+INDEX_PICKLE = "index.pkl"
+_SQL_BATCH = 500
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """
+    Chunk store kept in an SQLite file next to the FAISS index, keyed by docstore ID.
+    Only the chunks a query hits are read, instead of unpickling every chunk at load time.
+    When pickled by FAISS.save_local it only records its file name; call bind(folder)
+    (or bind_docstore) after FAISS.load_local to point it at the index folder.
+    Writes are held in a transaction until commit(), so readers never see chunks the saved
+    index does not know about.
+    """
+
+    def __init__(self, path=None):
+        self.filename = os.path.basename(path) if path else DOCSTORE_FILE
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {"filename": self.filename}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.filename = state["filename"]
+
+    def bind(self, folder):
+        self.close()
+        self.path = os.path.join(folder, self.filename)
+        return self
+
+    def _connect(self):
+        if self._conn is None:
+            if self.path is None:
+                raise RuntimeError("SQLiteDocstore is not bound to an index folder; call bind(folder) first.")
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS docs (id TEXT PRIMARY KEY, page_content TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+        return self._conn
+
+    def add(self, texts):
+        with self._lock:
+            self._connect().executemany(
+                "INSERT OR REPLACE INTO docs (id, page_content, metadata) VALUES (?, ?, ?)",
+                [(doc_id, doc.page_content, json.dumps(doc.metadata)) for doc_id, doc in texts.items()]
+            )
+
+    def delete(self, ids):
+        with self._lock:
+            conn = self._connect()
+            for i in range(0, len(ids), _SQL_BATCH):
+                batch = list(ids[i:i + _SQL_BATCH])
+                conn.execute(f"DELETE FROM docs WHERE id IN ({','.join('?' * len(batch))})", batch)
+
+    def search(self, search):
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT page_content, metadata FROM docs WHERE id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute("DELETE FROM docs")
+
+    def commit(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.commit()
+                self._conn.close()
+                self._conn = None
+
+    def __len__(self):
+        with self._lock:
+            (count,) = self._connect().execute("SELECT COUNT(*) FROM docs").fetchone()
+        return count
+
+
+def docstore_kind(docstore):
+    return "sqlite" if isinstance(docstore, SQLiteDocstore) else "memory"
+
+
+def bind_docstore(vectorstore, folder):
+    """Point a freshly loaded vectorstore's SQLite docstore at its folder; no-op for in-memory stores."""
+    if isinstance(vectorstore.docstore, SQLiteDocstore):
+        vectorstore.docstore.bind(folder)
+    return vectorstore
+
+
+def commit_docstore(vectorstore):
+    if isinstance(vectorstore.docstore, SQLiteDocstore):
+        vectorstore.docstore.commit()
+
+
+def close_docstore(vectorstore):
+    """Commit and close an SQLite docstore's connection (it reopens on next use); no-op for in-memory stores."""
+    if isinstance(vectorstore.docstore, SQLiteDocstore):
+        vectorstore.docstore.close()
+
+
+def new_sqlite_docstore(folder):
+    """An empty SQLite docstore for a brand-new index in folder."""
+    docstore = SQLiteDocstore(os.path.join(folder, DOCSTORE_FILE))
+    docstore.clear()
+    return docstore
+
+
+def convert_docstore(vectorstore, kind, folder):
+    """Move a vectorstore's chunks into a docstore of the given kind (no-op if already that kind)."""
+    if kind == docstore_kind(vectorstore.docstore):
+        return vectorstore
+    ids = list(vectorstore.index_to_docstore_id.values())
+    if kind == "sqlite":
+        target = new_sqlite_docstore(folder)
+        for i in range(0, len(ids), _SQL_BATCH):
+            target.add({doc_id: vectorstore.docstore.search(doc_id) for doc_id in ids[i:i + _SQL_BATCH]})
+    else:
+        target = InMemoryDocstore({doc_id: vectorstore.docstore.search(doc_id) for doc_id in ids})
+    vectorstore.docstore = target
+    return vectorstore
+
+
+def migrate_folder(folder):
+    """
+    Migrate an index folder written with the default pickled InMemoryDocstore to SQLite.
+    Chunks are copied into docstore.sqlite once and index.pkl is rewritten to reference it.
+    Run it on a staged copy (see main): the previous version is the backup. Returns the number
+    of chunks migrated.
+    """
+    pkl_path = os.path.join(folder, INDEX_PICKLE)
+    if not os.path.exists(pkl_path):
+        return 0
+    with open(pkl_path, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    if isinstance(docstore, SQLiteDocstore):
+        return 0
+    target = new_sqlite_docstore(folder)
+    ids = list(index_to_docstore_id.values())
+    for i in range(0, len(ids), _SQL_BATCH):
+        target.add({doc_id: docstore.search(doc_id) for doc_id in ids[i:i + _SQL_BATCH]})
+    target.commit()
+    with open(pkl_path, "wb") as f:
+        pickle.dump((target, index_to_docstore_id), f)
+
+    count = len(target)
+    target.close()
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the docstore behind the FAISS index.")
+    parser.add_argument("--folder", default="./db/faiss_index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("migrate", help="Move chunks from the pickled in-memory docstore into SQLite.")
+    args = parser.parse_args(argv)
+
+    # Published files are never changed in place: the migrated copy is published as a new version
+    count, version = update_published(args.folder, migrate_folder)
+    if count:
+        print(f"Migrated {count} chunks to {DOCSTORE_FILE}, published as version {version}")
+    else:
+        print("Nothing to migrate; the index already uses the SQLite docstore.")
+
+
+if __name__ == "__main__":
+    main()
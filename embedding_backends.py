@@ -0,0 +1,110 @@
+import os
+import re
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+from embedding_client import ConcurrentEmbeddings, client_settings
+
+# "openai" calls the API; "hashing" embeds locally on the CPU with no network access
+EMBEDDING_BACKENDS = ("openai", "hashing")
+DEFAULT_EMBEDDING_BACKEND = "openai"
+OPENAI_EMBEDDING_MODEL = "text-embedding-ada-002"
+# Recorded in the index config; indexes from before it was recorded were all built with OpenAI
+LEGACY_BACKEND = {"backend": "openai"}
+HASHING_DIMENSION = 512
+HASHING_NGRAMS = (3, 5)
+
+_FNV_OFFSET = np.uint64(14695981039346656037)
+_FNV_PRIME = np.uint64(1099511628211)
+_NON_WORD = re.compile(r"\W+")
+
+
+def embedding_backend(name=None):
+    """The configured backend: `name`, else EMBEDDING_BACKEND, else openai."""
+    name = name or os.getenv("EMBEDDING_BACKEND", DEFAULT_EMBEDDING_BACKEND)
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"EMBEDDING_BACKEND must be one of {', '.join(EMBEDDING_BACKENDS)}, got {name!r}")
+    return name
+
+
+def create_embeddings(name=None, client_options=None):
+    """
+    A LangChain Embeddings instance for the configured backend. Given `client_options` (a dict,
+    possibly empty, see embedding_client.client_settings), the OpenAI backend is the concurrent,
+    rate-limited bulk client instead; the hashing backend ignores them.
+    """
+    if embedding_backend(name) == "openai":
+        if client_options is not None:
+            return ConcurrentEmbeddings(OPENAI_EMBEDDING_MODEL, **client_settings(**client_options))
+        return OpenAIEmbeddings(model=OPENAI_EMBEDDING_MODEL)
+    return HashingEmbeddings()
+
+
+def backend_info(name, embeddings):
+    """What an index records (as "embedding" in its index config) about the model that embedded it."""
+    return {"backend": embedding_backend(name), "model": str(getattr(embeddings, "model", name))}
+
+
+def check_backend(config, info, folder):
+    """Raise ValueError if the index whose config this is was embedded by another backend or model than `info`."""
+    recorded = config.get("embedding", LEGACY_BACKEND)
+    if recorded["backend"] != info["backend"] or recorded.get("model", info["model"]) != info["model"]:
+        raise ValueError(
+            f"The index in {folder} was built with the {recorded['backend']} embedding backend "
+            f"({recorded.get('model', 'unknown model')}), but {info['backend']} ({info['model']}) is configured. "
+            f"Set EMBEDDING_BACKEND={recorded['backend']}, or rebuild the index with "
+            f"`python ingest.py --embedding-backend {info['backend']} --rebuild-from-cache`."
+        )
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Local, stateless embeddings: the character n-grams (HASHING_NGRAMS) of the lowercased,
+    punctuation-stripped text are hashed (FNV-1a) into `dimension` signed buckets, counts are
+    scaled sublinearly (log1p) and the vector is L2-normalized. A whole batch is hashed in a
+    few NumPy passes over one concatenated byte array, so no Python loop runs per n-gram.
+    Similar wording gives similar vectors and exact identifiers share n-grams; there is no
+    semantic model, so paraphrases score lower than with OpenAI embeddings.
+    """
+
+    def __init__(self, dimension=HASHING_DIMENSION, ngrams=HASHING_NGRAMS):
+        self.dimension = dimension
+        self.ngrams = ngrams
+        self.model = f"hashing-char{ngrams[0]}-{ngrams[1]}-d{dimension}"
+
+    def _embed(self, texts):
+        encoded = [f" {_NON_WORD.sub(' ', text.lower()).strip()} ".encode("utf-8") for text in texts]
+        ends = np.cumsum([len(data) for data in encoded])
+        starts = ends - [len(data) for data in encoded]
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+        buckets, signs = [], []
+        for n in range(self.ngrams[0], self.ngrams[1] + 1):
+            count = len(data) - n + 1
+            if count <= 0:
+                continue
+            hashes = np.full(count, _FNV_OFFSET, dtype=np.uint64)
+            for offset in range(n):
+                hashes ^= data[offset:offset + count]
+                hashes *= _FNV_PRIME
+            positions = np.arange(count)
+            rows = np.searchsorted(starts, positions, side="right") - 1
+            # Drop n-grams that run into the next text of the batch
+            keep = positions + n <= ends[rows]
+            buckets.append(rows[keep] * self.dimension + (hashes[keep] % np.uint64(self.dimension)).astype(np.int64))
+            signs.append(np.where(hashes[keep] >> np.uint64(63), 1.0, -1.0))
+        if not buckets:
+            return np.zeros((len(texts), self.dimension), dtype=np.float32)
+        counts = np.bincount(
+            np.concatenate(buckets), weights=np.concatenate(signs), minlength=len(texts) * self.dimension
+        ).reshape(len(texts), self.dimension)
+        vectors = (np.sign(counts) * np.log1p(np.abs(counts))).astype(np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        return self._embed(texts).tolist()
+
+    def embed_query(self, text):
+        return self._embed([text])[0].tolist()
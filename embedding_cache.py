@@ -0,0 +1,171 @@
+import os
+import time
+import sqlite3
+import hashlib
+from array import array
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_CACHE_PATH = "./db/embedding_cache.sqlite"
+MAX_CACHE_ENTRIES = 500000
+
+# SQLite limits the number of bound parameters per statement
+_SQL_BATCH = 500
+
+
+def text_key(text, namespace=""):
+    """Content address of a chunk: the hash of the embedding model name and the chunk text."""
+    return hashlib.sha256(f"{namespace}\0{text}".encode("utf-8")).hexdigest()
+
+
+def _to_blob(vector):
+    return array("f", vector).tobytes()
+
+
+def _from_blob(blob):
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingCache:
+    """
+    On-disk map of text hash -> embedding vector with a size cap and LRU eviction.
+    The SQLite file is only opened on first use, so constructing a cache is free.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_entries=MAX_CACHE_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings (last_used)")
+        return self._conn
+
+    def get_many(self, keys):
+        """Return {key: vector} for the keys present in the cache and mark them as recently used."""
+        conn = self._connect()
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        for i in range(0, len(unique_keys), _SQL_BATCH):
+            batch = unique_keys[i:i + _SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            ).fetchall()
+            found.update((key, _from_blob(blob)) for key, blob in rows)
+            conn.execute(
+                f"UPDATE embeddings SET last_used = ? WHERE key IN ({placeholders})",
+                [time.time(), *batch]
+            )
+        conn.commit()
+        return found
+
+    def put_many(self, items):
+        """Store (key, vector) pairs, then evict the least recently used entries over the cap."""
+        conn = self._connect()
+        now = time.time()
+        conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+            [(key, _to_blob(vector), now) for key, vector in items]
+        )
+        self._evict(conn)
+        conn.commit()
+
+    def _evict(self, conn):
+        (count,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (excess,)
+            )
+
+    def __len__(self):
+        (count,) = self._connect().execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        return count
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves document vectors from an EmbeddingCache and only sends
+    chunks it has never seen to the underlying model. Queries always go to the model.
+    """
+
+    def __init__(self, underlying, cache):
+        self.underlying = underlying
+        self.cache = cache
+        self.namespace = str(getattr(underlying, "model", type(underlying).__name__))
+
+    def embed_documents(self, texts):
+        keys = [text_key(text, self.namespace) for text in texts]
+        found = self.cache.get_many(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        self.cache.hits += len(texts) - len(missing)
+        self.cache.misses += len(missing)
+
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            new_items = list(zip(missing.keys(), vectors))
+            self.cache.put_many(new_items)
+            found.update(new_items)
+
+        return [found[key] for key in keys]
+
+    def embed_query(self, text):
+        return self.underlying.embed_query(text)
+
+
+class PrefetchedQueryEmbeddings(Embeddings):
+    """
+    Query-side wrapper that serves embed_query from vectors fetched ahead of time.
+    prefetch(texts) embeds a whole batch of expected queries in one call; a later embed_query
+    for the same text reuses that vector and anything else falls through to the underlying model.
+    """
+
+    def __init__(self, underlying):
+        self.underlying = underlying
+        self._vectors = {}
+        self.hits = 0
+        self.misses = 0
+
+    def prefetch(self, texts):
+        missing = list(dict.fromkeys(text for text in texts if text not in self._vectors))
+        if missing:
+            self._vectors.update(zip(missing, self.underlying.embed_documents(missing)))
+        return len(missing)
+
+    def clear(self):
+        self._vectors.clear()
+
+    def embed_documents(self, texts):
+        return self.underlying.embed_documents(texts)
+
+    def embed_query(self, text):
+        vector = self._vectors.get(text)
+        if vector is None:
+            self.misses += 1
+            return self.underlying.embed_query(text)
+        self.hits += 1
+        return vector
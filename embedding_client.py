@@ -0,0 +1,301 @@
+import os
+import math
+import time
+import random
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import openai
+from langchain_core.embeddings import Embeddings
+import metrics
+
+# Budgets of the OpenAI usage tier the key belongs to; lowered automatically to the limits the API reports
+EMBED_CONCURRENCY = 4
+EMBED_RPM = 3000
+EMBED_TPM = 1000000
+# Seconds of budget a bucket holds, i.e. how far a burst may run ahead of the steady rate
+BURST_SECONDS = 5.0
+INITIAL_BATCH_TEXTS = 128
+# API limits per request
+MAX_BATCH_TEXTS = 2048
+MAX_REQUEST_TOKENS = 300000
+MAX_RETRIES = 6
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+RETRY_STATUSES = (408, 409, 429, 500, 502, 503, 504)
+
+
+def estimate_tokens(text):
+    """About four characters per token: cheap enough to run on every chunk before it is sent."""
+    return (len(text) + 3) // 4
+
+
+def client_settings(**overrides):
+    """Client options from EMBED_CONCURRENCY, EMBED_RPM and EMBED_TPM, with non-None overrides on top."""
+    settings = {
+        "concurrency": int(os.getenv("EMBED_CONCURRENCY", EMBED_CONCURRENCY)),
+        "rpm": int(os.getenv("EMBED_RPM", EMBED_RPM)),
+        "tpm": int(os.getenv("EMBED_TPM", EMBED_TPM)),
+    }
+    settings.update((key, value) for key, value in overrides.items() if value is not None)
+    return settings
+
+
+def retry_after(headers):
+    """Seconds the server asked us to wait (retry-after-ms or retry-after), or None."""
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return max(float(value) * scale, 0.0)
+            except ValueError:
+                pass
+    return None
+
+
+class RateLimiter:
+    """
+    Token buckets for a requests-per-minute and a tokens-per-minute budget (None or 0 means
+    unlimited), shared by the client's worker threads. Each bucket refills at its steady rate and
+    holds `burst` seconds of budget. acquire() blocks until both buckets can cover a request; a
+    request larger than a bucket waits for the full bucket and leaves it in debt, so the long-run
+    rate stays within budget. pause() holds every worker back until a server-imposed wait is over.
+    """
+
+    def __init__(self, rpm=EMBED_RPM, tpm=EMBED_TPM, burst=BURST_SECONDS, clock=time.monotonic, sleep=time.sleep):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.burst = burst
+        self.waited = 0.0
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._updated = self._paused_until = clock()
+        self._requests = self._capacity(rpm)
+        self._tokens = self._capacity(tpm)
+
+    def _capacity(self, per_minute):
+        return max(per_minute * self.burst / 60, 1.0) if per_minute else 0.0
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(self._capacity(self.rpm), self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self._capacity(self.tpm), self._tokens + elapsed * self.tpm / 60)
+
+    def _wait(self, now, tokens):
+        wait_seconds = self._paused_until - now
+        if self.rpm and self._requests < 1:
+            wait_seconds = max(wait_seconds, (1 - self._requests) * 60 / self.rpm)
+        if self.tpm:
+            needed = min(tokens, self._capacity(self.tpm))
+            if self._tokens < needed:
+                wait_seconds = max(wait_seconds, (needed - self._tokens) * 60 / self.tpm)
+        return wait_seconds
+
+    def acquire(self, tokens=0):
+        """Take one request and `tokens` tokens from the budgets, sleeping as needed; returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                wait_seconds = self._wait(now, tokens)
+                if wait_seconds <= 0:
+                    if self.rpm:
+                        self._requests -= 1
+                    if self.tpm:
+                        self._tokens -= tokens
+                    self.waited += waited
+                    return waited
+            self._sleep(wait_seconds)
+            waited += wait_seconds
+
+    def settle(self, estimated, actual):
+        """Correct the token bucket once the server has reported what a request really used."""
+        with self._lock:
+            if self.tpm:
+                self._tokens += estimated - actual
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+    def limit(self, rpm=None, tpm=None):
+        """Lower the budgets to limits the server reported; budgets are never raised."""
+        with self._lock:
+            self._refill(self._clock())
+            if rpm and (not self.rpm or rpm < self.rpm):
+                self.rpm = rpm
+                self._requests = min(self._requests, self._capacity(rpm))
+            if tpm and (not self.tpm or tpm < self.tpm):
+                self.tpm = tpm
+                self._tokens = min(self._tokens, self._capacity(tpm))
+
+
+def _header_int(headers, name):
+    try:
+        return int(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+class ConcurrentEmbeddings(Embeddings):
+    """
+    OpenAI embeddings for bulk ingest. One embed_documents call is split into batches that are
+    sent by `concurrency` worker threads over the SDK's pooled HTTP client, within the RateLimiter
+    budgets, and the vectors come back in input order.
+
+    Batches are sized adaptively: they start at INITIAL_BATCH_TEXTS texts, double after each
+    request that went through at full size, up to the API's per-request limits, and halve on a
+    rate limit, timeout or server error. A small call is spread over all workers instead of
+    going out as one batch. Rate limits (429), timeouts and 5xx errors are retried up to
+    `max_retries` times with exponential backoff and full jitter, on top of any Retry-After the
+    server sent, during which the other workers hold back too. Other errors are raised at once.
+
+    Throughput is tracked in `stats` (see report) and counted under `stage` in metrics.
+    """
+
+    def __init__(self, model, concurrency=EMBED_CONCURRENCY, rpm=EMBED_RPM, tpm=EMBED_TPM, base_url=None,
+                 api_key=None, max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE, backoff_cap=BACKOFF_CAP,
+                 timeout=60.0, stage="ingest.embed"):
+        self.model = model
+        self.concurrency = max(1, concurrency)
+        self.limiter = RateLimiter(rpm, tpm)
+        self.base_url = base_url
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.timeout = timeout
+        self.stage = stage
+        self.batch_texts = INITIAL_BATCH_TEXTS
+        self.stats = {"texts": 0, "tokens": 0, "requests": 0, "retries": 0, "rate_limited": 0, "seconds": 0.0}
+        self._lock = threading.Lock()
+        self._client = None
+        self._pool = None
+
+    def _connect(self):
+        with self._lock:
+            if self._client is None:
+                self._client = openai.OpenAI(
+                    api_key=self.api_key, base_url=self.base_url, max_retries=0, timeout=self.timeout
+                )
+                self._pool = ThreadPoolExecutor(self.concurrency, thread_name_prefix="embed")
+            return self._client, self._pool
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._client.close()
+                self._client = self._pool = None
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.stats[name] += value
+        metrics.count(f"{self.stage}.{name}", value)
+
+    def _batch_end(self, tokens, start, workers_free):
+        """End of the next batch from `start`: within the adaptive size, the token limits and a fair share of what is left."""
+        remaining = len(tokens) - start
+        size = min(self.batch_texts, MAX_BATCH_TEXTS, max(1, math.ceil(remaining / workers_free)))
+        token_limit = min(MAX_REQUEST_TOKENS, self.limiter.tpm or MAX_REQUEST_TOKENS)
+        end, used = start, 0
+        while end < start + size and (end == start or used + tokens[end] <= token_limit):
+            used += tokens[end]
+            end += 1
+        return end
+
+    def _adapt(self, grow, sent):
+        with self._lock:
+            if grow:
+                if sent >= self.batch_texts:
+                    self.batch_texts = min(self.batch_texts * 2, MAX_BATCH_TEXTS)
+            else:
+                self.batch_texts = max(self.batch_texts // 2, 1)
+
+    def _backoff(self, attempt, server_wait):
+        return (server_wait or 0.0) + random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def _embed_batch(self, client, texts, tokens):
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(tokens)
+            server_wait = None
+            try:
+                raw = client.embeddings.with_raw_response.create(
+                    model=self.model, input=[text or " " for text in texts], encoding_format="float"
+                )
+            except openai.APIStatusError as error:
+                if error.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    raise
+                self._count("requests")
+                server_wait = retry_after(error.response.headers)
+                if error.status_code == 429:
+                    self._count("rate_limited")
+                    self.limiter.pause(server_wait or self.backoff_base)
+                self._adapt(False, len(texts))
+            except openai.APIConnectionError:
+                if attempt == self.max_retries:
+                    raise
+                self._count("requests")
+                self._adapt(False, len(texts))
+            else:
+                self._count("requests")
+                self.limiter.limit(_header_int(raw.headers, "x-ratelimit-limit-requests"),
+                                   _header_int(raw.headers, "x-ratelimit-limit-tokens"))
+                response = raw.parse()
+                used = response.usage.total_tokens if response.usage else tokens
+                self.limiter.settle(tokens, used)
+                self._count("tokens", used)
+                with self._lock:
+                    # Texts are already counted as <stage>.texts by TimedEmbeddings
+                    self.stats["texts"] += len(texts)
+                self._adapt(True, len(texts))
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            self._count("retries")
+            time.sleep(self._backoff(attempt, server_wait))
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        start_time = time.perf_counter()
+        client, pool = self._connect()
+        tokens = [estimate_tokens(text) for text in texts]
+        vectors = [None] * len(texts)
+        running = {}
+        position = 0
+        try:
+            while position < len(texts) or running:
+                while position < len(texts) and len(running) < self.concurrency:
+                    end = self._batch_end(tokens, position, self.concurrency - len(running))
+                    future = pool.submit(self._embed_batch, client, texts[position:end], sum(tokens[position:end]))
+                    running[future] = position
+                    position = end
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start = running.pop(future)
+                    batch = future.result()
+                    vectors[start:start + len(batch)] = batch
+        finally:
+            for future in running:
+                future.cancel()
+            with self._lock:
+                self.stats["seconds"] += time.perf_counter() - start_time
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def report(self):
+        """One line on the requests sent and the throughput reached, or None if nothing was embedded."""
+        stats = dict(self.stats)
+        if not stats["requests"]:
+            return None
+        seconds = stats["seconds"] or 1e-9
+        return (f"Embedding API: {stats['texts']} texts, {stats['tokens']} tokens in {stats['requests']} requests "
+                f"over {seconds:.2f}s ({stats['texts'] / seconds:.1f} texts/s, "
+                f"{stats['tokens'] * 60 / seconds:,.0f} tokens/min); {stats['rate_limited']} rate-limited, "
+                f"{stats['retries']} retries, {self.limiter.waited:.2f}s waiting for budget, "
+                f"concurrency {self.concurrency}, batch size now {self.batch_texts}")
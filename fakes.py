@@ -0,0 +1,252 @@
+import re
+import json
+import math
+import time
+import zlib
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+from embedding_client import estimate_tokens
+
+FAKE_LLM_LATENCY = 0.5
+FAKE_EMBEDDING_DIMENSION = 256
+_WORD = re.compile(r"\w+")
+
+
+class FakeAgent:
+    """
+    Stand-in for the LangChain agent that answers after a fixed delay without calling OpenAI,
+    for load testing the chat path. Its result has the same shape as the real agent's, including
+    a retriever tool message, so sources are reported as usual. stream/astream mimic
+    stream_mode="messages": the tool message arrives after the delay, then the answer word by word.
+    """
+
+    def __init__(self, latency=FAKE_LLM_LATENCY, answer="This is a fake answer."):
+        self.latency = latency
+        self.answer = answer
+        self.calls = 0
+
+    def _result(self, inputs):
+        self.calls += 1
+        question = inputs["messages"][-1][1]
+        return {
+            "messages": [
+                ToolMessage(content="", name="search_personal_docs", tool_call_id="fake"),
+                AIMessage(content=f"{self.answer} (question: {question})"),
+            ]
+        }
+
+    def invoke(self, inputs):
+        time.sleep(self.latency)
+        return self._result(inputs)
+
+    async def ainvoke(self, inputs):
+        await asyncio.sleep(self.latency)
+        return self._result(inputs)
+
+    def _stream(self, inputs):
+        messages = self._result(inputs)["messages"]
+        words = messages[-1].content.split(" ")
+        chunks = [AIMessageChunk(content=word if i == 0 else " " + word) for i, word in enumerate(words)]
+        return [(message, {}) for message in messages[:-1] + chunks]
+
+    def stream(self, inputs, stream_mode="messages"):
+        time.sleep(self.latency)
+        yield from self._stream(inputs)
+
+    async def astream(self, inputs, stream_mode="messages"):
+        await asyncio.sleep(self.latency)
+        for item in self._stream(inputs):
+            yield item
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic local stand-in for OpenAIEmbeddings: each text becomes a unit vector of signed,
+    hashed word counts, so texts sharing words are close. Every call (one batch of documents, or
+    one query) waits `latency` seconds first, to mimic an API round trip.
+    """
+
+    def __init__(self, latency=0.0, dimension=FAKE_EMBEDDING_DIMENSION):
+        self.latency = latency
+        self.dimension = dimension
+        self.calls = 0
+
+    def _vector(self, text):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in _WORD.findall(text.lower()):
+            h = zlib.crc32(word.encode("utf-8"))
+            vector[h % self.dimension] += 1.0 if h & (1 << 31) else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        time.sleep(self.latency)
+        return self._vector(text)
+
+
+class FakeChatModel:
+    """
+    Stand-in for the chat model on the direct path (invoke/ainvoke/stream/astream of a message
+    list): answers after `latency` seconds with a fixed sentence that quotes the question.
+    """
+
+    def __init__(self, latency=FAKE_LLM_LATENCY, answer="This is a fake answer."):
+        self.latency = latency
+        self.answer = answer
+        self.calls = 0
+
+    def _content(self, messages):
+        self.calls += 1
+        return f"{self.answer} (question: {messages[-1][1]})"
+
+    def invoke(self, messages):
+        time.sleep(self.latency)
+        return AIMessage(content=self._content(messages))
+
+    async def ainvoke(self, messages):
+        await asyncio.sleep(self.latency)
+        return AIMessage(content=self._content(messages))
+
+    def _chunks(self, messages):
+        words = self._content(messages).split(" ")
+        return [AIMessageChunk(content=word if i == 0 else " " + word) for i, word in enumerate(words)]
+
+    def stream(self, messages):
+        time.sleep(self.latency)
+        yield from self._chunks(messages)
+
+    async def astream(self, messages):
+        await asyncio.sleep(self.latency)
+        for chunk in self._chunks(messages):
+            yield chunk
+
+
+class FakeEmbeddingServer:
+    """
+    Local stand-in for the OpenAI embeddings endpoint (POST <url>/embeddings) that enforces
+    limits the way the API does. At most `requests_per_window` requests and `tokens_per_window`
+    tokens (estimated like embedding_client does; None means unlimited) are accepted per fixed
+    window of `window` seconds; anything over gets a 429 with retry-after-ms set to the end of
+    the window. Successful responses carry the limits, scaled to a minute, in x-ratelimit-*
+    headers. A request with an input longer than `max_input_tokens` gets a 400. Vectors come
+    from FakeEmbeddings, after `latency` seconds. Use as a context manager; `url` is the base URL.
+    """
+
+    def __init__(self, requests_per_window=None, tokens_per_window=None, window=60.0, latency=0.0,
+                 max_input_tokens=8191, dimension=FAKE_EMBEDDING_DIMENSION):
+        self.requests_per_window = requests_per_window
+        self.tokens_per_window = tokens_per_window
+        self.window = window
+        self.latency = latency
+        self.max_input_tokens = max_input_tokens
+        self.embeddings = FakeEmbeddings(dimension=dimension)
+        self.requests = 0
+        self.rejected = 0
+        self.batch_sizes = []
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_requests = 0
+        self._window_tokens = 0
+        self._server = None
+
+    def _admit(self, tokens):
+        """None if the request fits in the current window, else the seconds until the window resets."""
+        with self._lock:
+            self.requests += 1
+            now = time.monotonic()
+            if now - self._window_start >= self.window:
+                self._window_start, self._window_requests, self._window_tokens = now, 0, 0
+            over_requests = self.requests_per_window is not None and self._window_requests + 1 > self.requests_per_window
+            over_tokens = self.tokens_per_window is not None and self._window_tokens + tokens > self.tokens_per_window
+            if over_requests or over_tokens:
+                self.rejected += 1
+                return self._window_start + self.window - now
+            self._window_requests += 1
+            self._window_tokens += tokens
+            return None
+
+    def _limit_headers(self):
+        headers = {}
+        for name, limit in (("requests", self.requests_per_window), ("tokens", self.tokens_per_window)):
+            if limit is not None:
+                headers[f"x-ratelimit-limit-{name}"] = str(int(limit * 60 / self.window))
+        return headers
+
+    def handle(self, body):
+        """(status, headers, payload) for one request body."""
+        texts = body.get("input") or []
+        texts = [texts] if isinstance(texts, str) else texts
+        tokens = [estimate_tokens(text) for text in texts]
+        if any(count > self.max_input_tokens for count in tokens):
+            return 400, {}, {"error": {"message": "This model's maximum context length is exceeded.",
+                                       "type": "invalid_request_error"}}
+        wait = self._admit(sum(tokens))
+        if wait is not None:
+            headers = {"retry-after-ms": str(int(wait * 1000)), "retry-after": str(math.ceil(wait))}
+            return 429, headers, {"error": {"message": "Rate limit reached.", "type": "requests"}}
+        time.sleep(self.latency)
+        with self._lock:
+            self.batch_sizes.append(len(texts))
+        return 200, self._limit_headers(), {
+            "object": "list",
+            "model": body.get("model"),
+            "data": [{"object": "embedding", "index": i, "embedding": self.embeddings._vector(text)}
+                     for i, text in enumerate(texts)],
+            "usage": {"prompt_tokens": sum(tokens), "total_tokens": sum(tokens)},
+        }
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path.rstrip("/").endswith("/embeddings"):
+                    status, headers, payload = fake.handle(body)
+                else:
+                    status, headers, payload = 404, {}, {"error": {"message": "Not found"}}
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
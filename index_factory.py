@@ -0,0 +1,472 @@
+import os
+import re
+import json
+import time
+import pickle
+import hashlib
+import argparse
+import numpy as np
+import faiss
+from langchain_community.vectorstores import FAISS
+from index_versions import resolve_index, update_published
+from docstore import DOCSTORE_FILE
+
+# Ingest always keeps the exact flat index as "index.faiss"/"index.pkl". Approximate types are
+# derived from it at publish time and saved next to it as "search.faiss", which the retriever
+# loads with the docstore in "index.pkl" (see load_search_vectorstore). "sq8" and "pq" are
+# exhaustive indexes over compressed vectors (8-bit scalar / product quantization) that only
+# shrink memory and disk.
+# The search index labels each vector by a hash of its docstore ID (see search_labels) rather than
+# by its position in the exact index, so later ingests add and remove vectors in place.
+INDEX_TYPES = ("flat", "ivf-flat", "ivf-pq", "hnsw", "sq8", "pq")
+INDEX_CONFIG_FILE = "index_config.json"
+EXACT_INDEX_NAME = "index"
+SEARCH_INDEX_NAME = "search"
+DEFAULT_INDEX_CONFIG = {
+    "type": "flat",
+    "nlist": 1024,
+    "pq_m": 16,
+    "hnsw_m": 32,
+    "nprobe": 16,
+    "efSearch": 64,
+    "train_size": 50000,
+}
+# Sample used by ingest to report the recall lost by an approximate or compressed index
+QUALITY_CHECK_QUERIES = 100
+QUALITY_CHECK_K = 10
+# IVF k-means wants roughly 39 training points per centroid; PQ always trains 256 centroids
+MIN_POINTS_PER_CENTROID = 39
+PQ_CENTROIDS = 256
+# Recorded in the index config of search indexes labelled by search_labels
+SEARCH_LABELS = "docstore-hash"
+
+
+def load_index_config(folder):
+    """Index settings saved next to the index, falling back to the defaults (an exact flat index)."""
+    config = dict(DEFAULT_INDEX_CONFIG)
+    try:
+        with open(os.path.join(folder, INDEX_CONFIG_FILE), "r") as f:
+            config.update(json.load(f))
+    except FileNotFoundError:
+        pass
+    return config
+
+
+def save_index_config(folder, config):
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, INDEX_CONFIG_FILE), "w") as f:
+        json.dump(config, f, indent=2)
+
+
+def check_index_config(config, num_vectors=None, dim=None):
+    """
+    Raise ValueError if config cannot be built over num_vectors vectors of dim dimensions;
+    checks needing a value that is not known yet (None) are skipped.
+    """
+    index_type = config["type"]
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}; expected one of {', '.join(INDEX_TYPES)}")
+    if index_type in ("pq", "ivf-pq"):
+        if dim is not None and dim % config["pq_m"]:
+            raise ValueError(f"pq_m={config['pq_m']} must divide the embedding dimension {dim}")
+        if num_vectors is not None and num_vectors < PQ_CENTROIDS:
+            raise ValueError(f"{index_type} needs at least {PQ_CENTROIDS} vectors to train, found {num_vectors}")
+
+
+def factory_string(config, num_vectors, dim):
+    """
+    FAISS index_factory description for a config. The IVF list count is capped so that small
+    corpora still have enough training points per centroid.
+    """
+    check_index_config(config, num_vectors, dim)
+    index_type = config["type"]
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "hnsw":
+        return f"HNSW{config['hnsw_m']}"
+    if index_type == "sq8":
+        return "SQ8"
+
+    if index_type == "pq":
+        return f"PQ{config['pq_m']}"
+
+    nlist = max(1, min(config["nlist"], num_vectors // MIN_POINTS_PER_CENTROID))
+    if index_type == "ivf-flat":
+        return f"IVF{nlist},Flat"
+    return f"IVF{nlist},PQ{config['pq_m']}"
+
+
+def base_index(index):
+    """The index inside the IDMap2 wrapper that gives non-IVF search indexes their labels."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap2):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def compatible_factory(built, wanted):
+    """
+    Whether a search index built as the factory string `built` can keep serving a config now
+    described as `wanted`. The IVF list count follows the corpus size (see factory_string); the
+    trained lists are kept until it should be more than twice or under half what it is, so a
+    growing corpus is not retrained on every ingest.
+    """
+    if built == wanted:
+        return True
+    built_ivf = re.fullmatch(r"IVF(\d+),(.+)", built or "")
+    wanted_ivf = re.fullmatch(r"IVF(\d+),(.+)", wanted)
+    if not (built_ivf and wanted_ivf) or built_ivf.group(2) != wanted_ivf.group(2):
+        return False
+    return 0.5 <= int(built_ivf.group(1)) / int(wanted_ivf.group(1)) <= 2
+
+
+def apply_search_params(index, config):
+    """Set the query-time knobs (nprobe for IVF, efSearch for HNSW) stored in the config."""
+    try:
+        faiss.extract_index_ivf(index).nprobe = config["nprobe"]
+        return
+    except RuntimeError:
+        pass
+    hnsw_index = base_index(index)
+    if isinstance(hnsw_index, faiss.IndexHNSW):
+        hnsw_index.hnsw.efSearch = config["efSearch"]
+
+
+def enable_reconstruct(index):
+    """
+    Build the direct map an IVF index needs to reconstruct stored vectors by label (a hash table,
+    since labels are docstore ID hashes, see search_labels). Call it once after loading, before
+    the index is shared: building it while other threads search the index is not safe.
+    """
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return
+    ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+
+
+def mmap_io_flags(config):
+    """
+    faiss.read_index flags that memory-map the index file instead of copying it onto the heap,
+    so worker processes share its pages through the OS page cache. IVF indexes map their
+    inverted lists; flat-coded indexes (flat, hnsw, sq8, pq) map their code arrays.
+    """
+    if config["type"].startswith("ivf"):
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    return faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+
+
+def all_vectors(index):
+    """Every vector stored in an exact (flat) index, in position order."""
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def search_labels(doc_ids):
+    """
+    Labels of docstore IDs in the search index: 63-bit hashes that stay the same as chunks are
+    added and removed, unlike positions in the exact index.
+    """
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(doc_id.encode("utf-8"), digest_size=8).digest(), "little") >> 1
+         for doc_id in doc_ids),
+        dtype=np.int64, count=len(doc_ids)
+    )
+
+
+def stored_labels(index):
+    """Labels of every vector in a search index."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap2):
+        return faiss.vector_to_array(index.id_map)
+    invlists = faiss.extract_index_ivf(index).invlists
+    sizes = [invlists.list_size(i) for i in range(invlists.nlist)]
+    return np.concatenate([np.empty(0, dtype=np.int64)] + [
+        faiss.rev_swig_ptr(invlists.get_ids(i), size).copy() for i, size in enumerate(sizes) if size
+    ])
+
+
+def training_sample(vectors, size, seed=0):
+    """A fixed-seed random sample of the corpus vectors, so retraining is reproducible."""
+    if len(vectors) <= size:
+        return vectors
+    rng = np.random.default_rng(seed)
+    return vectors[np.sort(rng.choice(len(vectors), size, replace=False))]
+
+
+def build_search_index(vectors, config, trained_template=None, labels=None):
+    """
+    Build the approximate index described by config over vectors, labelled by labels (by default
+    their positions). IVF indexes store labels themselves; the others are wrapped in IDMap2.
+    Passing the previously published index as trained_template reuses its training
+    (IVF centroids, PQ codebooks) so only the vectors are added again.
+    """
+    if labels is None:
+        labels = np.arange(len(vectors), dtype=np.int64)
+    if trained_template is not None:
+        index = faiss.clone_index(trained_template)
+        index.reset()
+    else:
+        description = factory_string(config, len(vectors), vectors.shape[1])
+        if not config["type"].startswith("ivf"):
+            description = "IDMap2," + description
+        index = faiss.index_factory(vectors.shape[1], description)
+        if not index.is_trained:
+            index.train(training_sample(vectors, config["train_size"]))
+    index.add_with_ids(vectors, labels)
+    apply_search_params(index, config)
+    return index
+
+
+def update_search_index(index, exact_index, labels):
+    """
+    Bring a published search index in line with the exact index, whose vectors have the given
+    labels: vectors no longer in it are removed and new ones added, without retraining.
+    Returns (added, removed), or None if the index cannot remove vectors (HNSW) and must be rebuilt.
+    """
+    stored = stored_labels(index)
+    gone = np.setdiff1d(stored, labels)
+    new = np.flatnonzero(~np.isin(labels, stored))
+    if len(gone):
+        if isinstance(base_index(index), faiss.IndexHNSW):
+            return None
+        index.remove_ids(faiss.IDSelectorBatch(gone))
+    if len(new):
+        index.add_with_ids(exact_index.reconstruct_batch(new), labels[new])
+    return len(new), len(gone)
+
+
+def publish_search_index(vectorstore, folder, config, retrain=False):
+    """
+    Write the retriever-facing index for the current exact vectorstore.
+    Flat configs serve the exact index directly. For approximate configs, search.faiss is updated
+    in place while the factory string is unchanged: only the vectors added to or deleted from the
+    exact index since it was published are added or removed (see update_search_index). It is
+    rebuilt from all vectors, reusing the previous training, when the index predates stable labels
+    or HNSW lost vectors, and retrained when retrain is set or the factory string no longer fits
+    (see compatible_factory).
+    Returns the approximate index, or None for flat.
+    """
+    previous = load_index_config(folder)
+    if config["type"] == "flat":
+        for ext in (".faiss", ".pkl"):
+            try:
+                os.remove(os.path.join(folder, SEARCH_INDEX_NAME + ext))
+            except FileNotFoundError:
+                pass
+        if previous != config:
+            save_index_config(folder, config)
+        return None
+
+    exact = vectorstore.index
+    labels = search_labels([vectorstore.index_to_docstore_id[i] for i in range(exact.ntotal)])
+    search_path = os.path.join(folder, SEARCH_INDEX_NAME + ".faiss")
+    wanted = factory_string(config, exact.ntotal, exact.d)
+    published = None
+    if not retrain and compatible_factory(previous.get("factory"), wanted) and os.path.exists(search_path):
+        published = faiss.read_index(search_path)
+        wanted = previous["factory"]
+        if previous.get("labels") != SEARCH_LABELS and not config["type"].startswith("ivf"):
+            # Built before stable labels, without the IDMap2 wrapper that holds them
+            published = None
+            wanted = factory_string(config, exact.ntotal, exact.d)
+
+    start = time.perf_counter()
+    changes = None
+    if published is not None and previous.get("labels") == SEARCH_LABELS:
+        changes = update_search_index(published, exact, labels)
+    if changes is not None:
+        search_index = published
+        apply_search_params(search_index, config)
+        action = f"added {changes[0]}, removed {changes[1]} vectors"
+    else:
+        search_index = build_search_index(all_vectors(exact), config, trained_template=published, labels=labels)
+        action = f"built over {exact.ntotal} vectors ({'reused training' if published is not None else 'trained'})"
+    _save_search_index(search_index, folder)
+    print(f"Search index {wanted} {action} in {time.perf_counter() - start:.2f}s")
+
+    search_bytes = os.path.getsize(search_path)
+    vector_bytes = exact.ntotal * exact.d * 4
+    compression_ratio = vector_bytes / search_bytes
+    disk_bytes = retriever_bytes(folder)
+    if changes is None:
+        # Exact search over every vector: measured when the index is built, not on each update
+        recall = quality_check(exact, search_index, all_vectors(exact), labels)
+    else:
+        recall = previous.get("recall_at_k", 0.0)
+    print(
+        f"  {search_bytes / 1e6:.1f} MB search index vs {vector_bytes / 1e6:.1f} MB of float32 vectors "
+        f"({compression_ratio:.1f}x compression), {disk_bytes / 1e6:.1f} MB on disk with the docstore, "
+        f"recall@{QUALITY_CHECK_K} {recall:.3f} (loss {1.0 - recall:.3f})"
+    )
+    save_index_config(folder, {
+        **config, "factory": wanted, "labels": SEARCH_LABELS,
+        "compression_ratio": round(compression_ratio, 2), "disk_bytes": disk_bytes, "recall_at_k": round(recall, 4)
+    })
+    return search_index
+
+
+def _save_search_index(search_index, folder):
+    os.makedirs(folder, exist_ok=True)
+    faiss.write_index(search_index, os.path.join(folder, SEARCH_INDEX_NAME + ".faiss"))
+    try:
+        # Written by versions that pickled a second copy of the docstore for the search index
+        os.remove(os.path.join(folder, SEARCH_INDEX_NAME + ".pkl"))
+    except FileNotFoundError:
+        pass
+
+
+def retriever_bytes(folder):
+    """Bytes a retriever loads from folder for an approximate index: search.faiss and the docstore."""
+    names = (SEARCH_INDEX_NAME + ".faiss", EXACT_INDEX_NAME + ".pkl", DOCSTORE_FILE)
+    return sum(os.path.getsize(os.path.join(folder, name)) for name in names if os.path.exists(os.path.join(folder, name)))
+
+
+def load_search_vectorstore(folder, embeddings, io_flags=0):
+    """
+    The published search index as a vectorstore. It has no pickle of its own: the docstore and
+    docstore IDs come from the exact index's index.pkl, keyed by search_labels (or by position,
+    for indexes published before stable labels).
+    """
+    with open(os.path.join(folder, EXACT_INDEX_NAME + ".pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    index = faiss.read_index(os.path.join(folder, SEARCH_INDEX_NAME + ".faiss"), io_flags)
+    if load_index_config(folder).get("labels") == SEARCH_LABELS:
+        doc_ids = [index_to_docstore_id[i] for i in range(len(index_to_docstore_id))]
+        index_to_docstore_id = dict(zip(search_labels(doc_ids).tolist(), doc_ids))
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+def quality_check(exact_index, search_index, vectors, labels, k=QUALITY_CHECK_K, num_queries=QUALITY_CHECK_QUERIES):
+    """
+    recall@k of the search index against exact search, using batched searches over sampled
+    queries; labels are the search index labels of the exact index positions.
+    """
+    k = min(k, len(vectors))
+    queries = sample_queries(vectors, num_queries)
+    _, truth = exact_index.search(queries, k)
+    _, found = search_index.search(queries, k)
+    return recall_at_k(found, labels[truth], k)
+
+
+def recall_at_k(found, truth, k):
+    """Mean fraction of the exact top-k that the approximate search also returned."""
+    return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(found, truth)]))
+
+
+def percentile_ms(seconds, pct):
+    return float(np.percentile(np.asarray(seconds) * 1000.0, pct))
+
+
+def measure(index, queries, k, truth=None):
+    """Search queries one at a time, as the retriever does. Returns (labels, recall@k, p50 ms, p99 ms)."""
+    timings = []
+    labels = np.empty((len(queries), k), dtype=np.int64)
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, found = index.search(query.reshape(1, -1), k)
+        timings.append(time.perf_counter() - start)
+        labels[i] = found[0]
+    recall = recall_at_k(labels, truth, k) if truth is not None else 1.0
+    return labels, recall, percentile_ms(timings, 50), percentile_ms(timings, 99)
+
+
+def sample_queries(vectors, count, noise=0.1, seed=0):
+    """
+    Query vectors drawn from the corpus and perturbed, so a query is not trivially its own
+    nearest neighbour.
+    """
+    rng = np.random.default_rng(seed)
+    picked = vectors[rng.choice(len(vectors), min(count, len(vectors)), replace=False)]
+    scale = noise * vectors.std(axis=0, keepdims=True)
+    return (picked + rng.standard_normal(picked.shape).astype(np.float32) * scale).astype(np.float32)
+
+
+def exact_labels(folder):
+    """Search index labels (see search_labels) of the exact index positions, from its pickled docstore mapping."""
+    with open(os.path.join(folder, EXACT_INDEX_NAME + ".pkl"), "rb") as f:
+        _, index_to_docstore_id = pickle.load(f)
+    return search_labels([index_to_docstore_id[i] for i in range(len(index_to_docstore_id))])
+
+
+def recall_latency_report(folder, k=10, num_queries=200, nprobes=(), ef_searches=()):
+    """
+    Compare the published search index with exact search over the exact index.
+    Each nprobe / efSearch value is tried in turn; returns one result row per setting.
+    """
+    config = load_index_config(folder)
+    exact = faiss.read_index(os.path.join(folder, EXACT_INDEX_NAME + ".faiss"))
+    vectors = all_vectors(exact)
+    queries = sample_queries(vectors, num_queries)
+    truth, _, exact_p50, exact_p99 = measure(exact, queries, k)
+    if config.get("labels") == SEARCH_LABELS:
+        truth = exact_labels(folder)[truth]
+    rows = [{"setting": "exact (Flat)", "recall": 1.0, "p50_ms": exact_p50, "p99_ms": exact_p99}]
+
+    if config["type"] == "flat":
+        return rows
+    search = faiss.read_index(os.path.join(folder, SEARCH_INDEX_NAME + ".faiss"))
+    settings = [("nprobe", n) for n in nprobes] + [("efSearch", ef) for ef in ef_searches]
+    if not settings:
+        settings = [("nprobe" if config["type"].startswith("ivf") else "efSearch", None)]
+    if config["type"] in ("sq8", "pq"):
+        # Exhaustive compressed indexes have no query-time knobs
+        settings = [(None, None)]
+    for name, value in settings:
+        trial = dict(config)
+        if value is not None:
+            trial[name] = value
+        apply_search_params(search, trial)
+        _, recall, p50, p99 = measure(search, queries, k, truth)
+        label = config.get("factory", config["type"])
+        rows.append({
+            "setting": f"{label} {name}={trial[name]}" if name else label,
+            "recall": recall, "p50_ms": p50, "p99_ms": p99
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and tune the FAISS search index.")
+    parser.add_argument("--folder", default="./db/faiss_index")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    report = sub.add_parser("report", help="Measure recall@k against exact search and p50/p99 query latency.")
+    report.add_argument("--k", type=int, default=10)
+    report.add_argument("--queries", type=int, default=200)
+    report.add_argument("--nprobe", type=int, nargs="*", default=[])
+    report.add_argument("--ef-search", type=int, nargs="*", default=[])
+
+    setter = sub.add_parser("set", help="Persist query-time parameters, e.g. `set nprobe=32 efSearch=128`.")
+    setter.add_argument("params", nargs="+")
+
+    args = parser.parse_args(argv)
+    if args.command == "report":
+        folder = resolve_index(args.folder)
+        rows = recall_latency_report(folder, args.k, args.queries, args.nprobe, args.ef_search)
+        print(f"{'setting':<36} {'recall@' + str(args.k):>10} {'p50 ms':>9} {'p99 ms':>9}")
+        for row in rows:
+            print(f"{row['setting']:<36} {row['recall']:>10.3f} {row['p50_ms']:>9.3f} {row['p99_ms']:>9.3f}")
+        config = load_index_config(folder)
+        if "compression_ratio" in config:
+            print(f"Search index is {config['compression_ratio']}x smaller than the float32 vectors.")
+        if "disk_bytes" in config:
+            print(f"Retrievers load {config['disk_bytes'] / 1e6:.1f} MB from disk, docstore included.")
+    else:
+        params = {}
+        for param in args.params:
+            name, _, value = param.partition("=")
+            if name not in ("nprobe", "efSearch"):
+                parser.error(f"Only nprobe and efSearch can be set, got {name!r}")
+            params[name] = int(value)
+
+        def update(folder):
+            save_index_config(folder, {**load_index_config(folder), **params})
+            return params
+
+        # Published files are never changed in place: the new settings are published as a new version
+        _, version = update_published(args.folder, update)
+        print(f"Saved search parameters to {INDEX_CONFIG_FILE}, published as version {version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import os
+import time
+import shutil
+
+# An index root holds immutable versions/<name> folders and a CURRENT file naming the published one
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+STAGING_DIR = "staging"
+# Written into the staging folder once a manifest checkpoint refers to it
+CHECKPOINT_FILE = "CHECKPOINT"
+# Older versions are kept a while so readers that resolved them just before a swap can finish
+KEEP_VERSIONS = 3
+# Coarser than the file timestamp resolution of common filesystems
+MTIME_GRANULARITY_NS = 2_000_000_000
+
+
+def current_version(root):
+    """Name of the published version under root, or None for an unversioned (or missing) index."""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def resolve_index(root):
+    """
+    Folder holding the published index files of an index root: the version CURRENT points to,
+    or root itself for an index written before versioning (or not written yet).
+    """
+    return version_folder(root, current_version(root))
+
+
+def version_folder(root, version):
+    """Folder of a version of the index under root (see current_version); root itself for None."""
+    return os.path.join(root, VERSIONS_DIR, version) if version else root
+
+
+def staging_path(root):
+    return os.path.join(root, STAGING_DIR)
+
+
+def has_staged_version(root):
+    """Whether an interrupted run left an unpublished version behind."""
+    return os.path.isdir(staging_path(root))
+
+
+def _index_files(folder):
+    """Regular files of an index folder, leaving out the version bookkeeping of a root."""
+    try:
+        entries = list(os.scandir(folder))
+    except FileNotFoundError:
+        return []
+    return [
+        entry for entry in entries
+        if entry.is_file() and not entry.name.startswith(CURRENT_FILE) and entry.name != CHECKPOINT_FILE
+    ]
+
+
+def mark_checkpoint(folder):
+    """Record that a manifest checkpoint refers to the staged folder, so an interrupted run is resumed."""
+    with open(os.path.join(folder, CHECKPOINT_FILE), "w") as f:
+        f.write(time.strftime("%Y-%m-%dT%H:%M:%S%z") + "\n")
+
+
+def has_checkpoint(folder):
+    return os.path.isfile(os.path.join(folder, CHECKPOINT_FILE))
+
+
+def stage_version(root, fresh=False):
+    """
+    Working folder for the next version of the index under root: a copy of the published one,
+    or an empty folder when fresh. A staging folder left by an interrupted run is resumed as is
+    (unless fresh) if it holds a checkpoint (see mark_checkpoint), since the manifest refers to
+    it; without one nothing depends on it, and it is replaced.
+    Returns (folder, resumed).
+    """
+    staging = staging_path(root)
+    if os.path.isdir(staging):
+        if not fresh and has_checkpoint(staging):
+            return staging, True
+        shutil.rmtree(staging)
+    shutil.rmtree(staging + ".tmp", ignore_errors=True)
+    os.makedirs(staging + ".tmp")
+    if not fresh:
+        for entry in _index_files(resolve_index(root)):
+            shutil.copy2(entry.path, os.path.join(staging + ".tmp", entry.name))
+    # Only a complete copy becomes the staging folder
+    os.replace(staging + ".tmp", staging)
+    return staging, False
+
+
+def _link_or_copy(entry, published, target):
+    """
+    Hard-link the published copy of a file when the file has not changed since it was copied
+    (copy2 keeps the size and mtime), else copy it. Published files are never modified, so the
+    link is safe while the writer keeps changing its own file.
+    """
+    try:
+        stat, current = os.stat(published), entry.stat()
+        # A file written just before it was copied could be written again within the mtime
+        # granularity without its mtime changing, so only older files are trusted
+        settled = stat.st_ctime_ns - current.st_mtime_ns > MTIME_GRANULARITY_NS
+        if settled and (stat.st_size, stat.st_mtime_ns) == (current.st_size, current.st_mtime_ns):
+            os.link(published, target)
+            return
+    except OSError:
+        # Not published yet, or a filesystem without hard links
+        pass
+    shutil.copy2(entry.path, target)
+
+
+def _fsync(path, directory=False):
+    try:
+        fd = os.open(path, os.O_RDONLY | (getattr(os, "O_DIRECTORY", 0) if directory else 0))
+    except OSError:
+        # Windows cannot open directories; renames there are durable without it
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def publish_version(root, folder, copy=False):
+    """
+    Make the staged folder the published version: its files are flushed to disk, it is renamed
+    into versions/, and CURRENT is replaced in one atomic rename, so a reader sees either the old
+    version or the new one, never a half-written index. Versions beyond KEEP_VERSIONS and the
+    files of an unversioned index in root are then removed. copy=True publishes a copy and leaves
+    folder in place, for a writer that keeps working in it (ingest --watch); files unchanged since
+    the published version are hard-linked from it instead of copied. Returns the new version name.
+    """
+    versions = os.path.join(root, VERSIONS_DIR)
+    os.makedirs(versions, exist_ok=True)
+    # A sequence number keeps names in publishing order whatever the clock does
+    sequence = max((int(name.split("-")[0]) for name in os.listdir(versions) if name.split("-")[0].isdigit()), default=0)
+    version = f"{sequence + 1:06d}-{time.strftime('%Y%m%d-%H%M%S')}"
+    if copy:
+        copied = os.path.join(versions, version + ".tmp")
+        shutil.rmtree(copied, ignore_errors=True)
+        os.makedirs(copied)
+        published = resolve_index(root)
+        for entry in _index_files(folder):
+            _link_or_copy(entry, os.path.join(published, entry.name), os.path.join(copied, entry.name))
+        folder = copied
+    else:
+        try:
+            os.remove(os.path.join(folder, CHECKPOINT_FILE))
+        except FileNotFoundError:
+            pass
+    for entry in _index_files(folder):
+        _fsync(entry.path)
+    os.replace(folder, os.path.join(versions, version))
+    _fsync(versions, directory=True)
+
+    pointer = os.path.join(root, CURRENT_FILE)
+    with open(pointer + ".tmp", "w") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer + ".tmp", pointer)
+    _fsync(root, directory=True)
+    prune_versions(root)
+    return version
+
+
+def prune_versions(root, keep=KEEP_VERSIONS):
+    """Delete all but the newest `keep` versions (never the published one) and any unversioned index files in root."""
+    current = current_version(root)
+    if current is None:
+        return
+    versions = os.path.join(root, VERSIONS_DIR)
+    names = sorted(name for name in os.listdir(versions) if name != current)
+    for name in names[:max(len(names) - (keep - 1), 0)]:
+        shutil.rmtree(os.path.join(versions, name), ignore_errors=True)
+    for entry in _index_files(root):
+        os.remove(entry.path)
+
+
+def update_published(root, update):
+    """
+    Change the published index outside an ingest run (index_factory set, docstore migrate):
+    update(folder) edits a staged copy of the published version, which is then published like
+    any other, so readers never see a file change under them and hot reload picks it up. When
+    update returns a false value nothing changed, and the copy is dropped instead.
+    Refuses (RuntimeError) while a staged version exists, since an ingest run or --watch owns it.
+    Returns (update's result, the new version or None).
+    """
+    if has_staged_version(root):
+        raise RuntimeError(
+            f"{staging_path(root)} holds an unpublished ingest run; finish it with ingest.py (or stop --watch) first."
+        )
+    folder, _ = stage_version(root)
+    try:
+        result = update(folder)
+    except BaseException:
+        discard_staged_version(root)
+        raise
+    if not result:
+        discard_staged_version(root)
+        return result, None
+    return result, publish_version(root, folder)
+
+
+def discard_staged_version(root):
+    shutil.rmtree(staging_path(root), ignore_errors=True)
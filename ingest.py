@@ -1,5 +1,12 @@
 import os
 import json
+import shutil
+import uuid
+import hashlib
+import time
+import argparse
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
 from langchain_community.document_loaders import (
     PyPDFLoader,
     Docx2txtLoader,
@@ -7,82 +14,974 @@ from langchain_community.document_loaders import (
     UnstructuredPowerPointLoader
 )
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_community.vectorstores.utils import filter_complex_metadata
 from dotenv import load_dotenv
+import metrics
+from metrics import INGEST_METRICS_FILE, TimedEmbeddings
+from loaders import XlsxLoader, PptxLoader, fast_loaders_enabled
+from text_cache import TEXT_CACHE_PATH, TextCache
+from embedding_cache import EmbeddingCache, CachedEmbeddings
+from embedding_backends import EMBEDDING_BACKENDS, backend_info, check_backend, create_embeddings
+from embedding_client import EMBED_CONCURRENCY, EMBED_RPM, EMBED_TPM, ConcurrentEmbeddings
+from index_factory import (
+    EXACT_INDEX_NAME, INDEX_TYPES, check_index_config, load_index_config, publish_search_index, save_index_config
+)
+from index_versions import (
+    discard_staged_version, has_checkpoint, has_staged_version, mark_checkpoint, publish_version, resolve_index,
+    stage_version
+)
+from lexical_index import sync_lexical_index
+from dedup import NEAR_DUP_THRESHOLD, DedupIndex, dedup_path
+from docstore import (
+    DOCSTORE_FILE, DOCSTORE_KINDS, bind_docstore, close_docstore, commit_docstore, convert_docstore, docstore_kind
+)
+from shards import SHARD_MODES, SHARDS_PATH, collection_of, load_catalog, save_catalog, shard_folder, shard_manifest_path
 
 load_dotenv()
 
 MANIFEST_FILE = "processed_files.json"
 FAISS_INDEX_PATH = "./db/faiss_index"
+SOURCE_DIR = "./data"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+EMBED_BATCH_SIZE = 256
+CHECKPOINT_EVERY = 20
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".doc", ".xlsx", ".xls", ".pptx", ".ppt")
+# --watch: rescan interval after a change (doubling up to the max while idle), quiet time before
+# a burst of changes is applied, and how often applied changes are published
+WATCH_POLL_SECONDS = 2.0
+WATCH_MAX_POLL_SECONDS = 30.0
+WATCH_DEBOUNCE_SECONDS = 5.0
+WATCH_PERSIST_SECONDS = 60.0
 
 
-def load_manifest():
-    if os.path.exists(MANIFEST_FILE):
-        with open(MANIFEST_FILE, 'r') as f:
+def load_manifest(path=MANIFEST_FILE):
+    if os.path.exists(path):
+        with open(path, 'r') as f:
             return json.load(f)
     return {}
 
 
-def save_manifest(manifest):
-    with open(MANIFEST_FILE, 'w') as f:
+def save_manifest(manifest, path=MANIFEST_FILE):
+    with open(path, 'w') as f:
         json.dump(manifest, f)
 
 
-def build_vector_db():
-    manifest = load_manifest()
-    embeddings = OpenAIEmbeddings()
+def manifest_key(file_path):
+    """Manifest key of a source file: its path relative to SOURCE_DIR with "/" separators."""
+    return os.path.relpath(file_path, SOURCE_DIR).replace(os.sep, "/")
+
+
+def hash_file(file_path, block_size=1 << 20):
+    """SHA-256 of a file's bytes, read in blocks so large files are not loaded into memory."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def manifest_mtime(entry):
+    """Manifest entries are dicts; older manifests stored the bare mtime."""
+    return entry["mtime"] if isinstance(entry, dict) else entry
+
+
+def is_complete(entry):
+    """Entries written mid-file by a streaming checkpoint are marked incomplete."""
+    return not isinstance(entry, dict) or entry.get("complete", True)
+
+
+def chunk_ids(filename, digest, count, start=0):
+    """Deterministic docstore IDs for the chunks of one version of a file."""
+    return [str(uuid.uuid5(uuid.NAMESPACE_URL, f"{filename}:{digest}:{i}")) for i in range(start, start + count)]
+
+
+def stale_chunk_ids(vectorstore, entry, filename):
+    """
+    IDs of the chunks previously indexed for a file. Older manifest entries did not record
+    them, so fall back to matching the chunk source metadata in the docstore.
+    """
+    if vectorstore is None:
+        return []
+    if isinstance(entry, dict):
+        return list(entry.get("ids", []))
+    source = os.path.join(SOURCE_DIR, filename)
+    return [
+        doc_id for doc_id in vectorstore.index_to_docstore_id.values()
+        if vectorstore.docstore.search(doc_id).metadata.get("source") == source
+    ]
+
+
+def delete_chunks(vectorstore, ids):
+    """Remove chunks from the index and docstore; returns True if anything was removed."""
+    if vectorstore is None or not ids:
+        return False
+    present = set(vectorstore.index_to_docstore_id.values())
+    ids = [doc_id for doc_id in ids if doc_id in present]
+    if not ids:
+        return False
+    vectorstore.delete(ids)
+    return True
+
+
+def release_chunks(vectorstore, dedup, filename, ids):
+    """
+    Remove a file's chunks, keeping those that another file still shares (see dedup.DedupIndex).
+    A kept chunk that cites the file as its source is re-pointed to a file that still uses it.
+    """
+    with metrics.timer("ingest.delete"):
+        if dedup is not None:
+            unused = dedup.release(filename, ids)
+            repoint_sources(vectorstore, dedup, filename, set(ids) - set(unused))
+            ids = unused
+        return delete_chunks(vectorstore, ids)
+
+
+def repoint_sources(vectorstore, dedup, filename, ids):
+    """Set the source of the shared chunks among ids that cite filename to the first file still using them."""
+    if vectorstore is None or not ids:
+        return
+    source = os.path.join(SOURCE_DIR, filename)
+    present = set(vectorstore.index_to_docstore_id.values())
+    for doc_id in sorted(ids & present):
+        doc = vectorstore.docstore.search(doc_id)
+        owners = dedup.sources(doc_id)
+        if doc.metadata.get("source") != source or not owners:
+            continue
+        doc.metadata["source"] = os.path.join(SOURCE_DIR, owners[0])
+        # InMemoryDocstore.add refuses existing IDs, so the chunk is replaced
+        vectorstore.docstore.delete([doc_id])
+        vectorstore.docstore.add({doc_id: doc})
+
+
+def dedup_chunks(dedup, filename, chunks, ids):
+    """
+    Dedup stage between metadata filtering and the vectorstore insert. Returns the chunks (and IDs)
+    to embed and the ID each chunk is stored under, which for a duplicate is the chunk it matched.
+    """
+    if dedup is None or dedup.threshold is None:
+        return chunks, ids, ids
+    with metrics.timer("ingest.dedup"):
+        stored = [dedup.check(chunk.page_content, doc_id, filename) for chunk, doc_id in zip(chunks, ids)]
+    new = [(chunk, doc_id) for chunk, doc_id, kept in zip(chunks, ids, stored) if kept == doc_id]
+    metrics.count("ingest.duplicate_chunks", len(chunks) - len(new))
+    return [chunk for chunk, _ in new], [doc_id for _, doc_id in new], stored
+
+
+def get_loader(file_path):
+    """
+    Pick the loader for a file based on its extension, or None if unsupported.
+    .xlsx and .pptx files use the streaming loaders in loaders.py, which fall back to the
+    Unstructured loaders for files they cannot read (set FAST_LOADERS=0 to always use those).
+    """
+    if file_path.endswith(".pdf"):
+        return PyPDFLoader(file_path)
+    elif file_path.endswith(".docx") or file_path.endswith(".doc"):
+        return Docx2txtLoader(file_path)
+    elif file_path.endswith(".xlsx") or file_path.endswith(".xls"):
+        if file_path.endswith(".xlsx") and fast_loaders_enabled():
+            return XlsxLoader(
+                file_path, fallback=lambda: UnstructuredExcelLoader(file_path, mode="elements"), max_chars=CHUNK_SIZE
+            )
+        return UnstructuredExcelLoader(file_path, mode="elements")
+    elif file_path.endswith(".pptx") or file_path.endswith(".ppt"):
+        if file_path.endswith(".pptx") and fast_loaders_enabled():
+            return PptxLoader(file_path, fallback=lambda: UnstructuredPowerPointLoader(file_path, mode="elements"))
+        return UnstructuredPowerPointLoader(file_path, mode="elements")
+    return None
+
+
+def extractor_key(loader):
+    """
+    Text cache key of a loader: its class name, plus the settings that decide how an XlsxLoader
+    batches rows into pages (max_chars follows CHUNK_SIZE), e.g. "XlsxLoader:1000:100".
+    """
+    if isinstance(loader, XlsxLoader):
+        return f"{type(loader).__name__}:{loader.max_chars}:{loader.max_rows}"
+    return type(loader).__name__
 
-    if os.path.exists(FAISS_INDEX_PATH):
-        vectorstore = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
+
+def extracted_pages(file_path, digest=None, lazy=False):
+    """
+    A file's pages/elements, taken from the extracted-text cache when this version of the file
+    (by content hash) was parsed before with the same loader and settings (see extractor_key),
+    else parsed and recorded there.
+    A generator: with lazy=True pages are parsed one at a time, otherwise the loader reads the
+    file in one go. Re-chunking an unchanged corpus therefore never parses a document again.
+    """
+    loader = get_loader(file_path)
+    extract = loader.lazy_load if lazy else loader.load
+    cache = TextCache(TEXT_CACHE_PATH)
+    try:
+        yield from cache.load(digest or hash_file(file_path), extractor_key(loader), file_path, extract)
+    finally:
+        cache.close()
+
+
+def is_text_cached(file_path, digest):
+    cache = TextCache(TEXT_CACHE_PATH)
+    try:
+        return cache.contains(digest, extractor_key(get_loader(file_path)))
+    finally:
+        cache.close()
+
+
+def number_parts(pages):
+    """
+    Record each page/element's position in its file as metadata "part", so retrieval only merges
+    chunks split from the same one (see retrieval.merge_adjacent).
+    """
+    for part, page in enumerate(pages):
+        page.metadata["part"] = part
+        yield page
+
+
+def load_and_split(file_path, digest=None):
+    """
+    Load a single file and split it into metadata-filtered chunks.
+    Runs in a worker process when ingesting in parallel, so it only returns picklable data.
+    """
+    start = time.perf_counter()
+    with metrics.timer("ingest.load"):
+        docs = list(extracted_pages(file_path, digest))
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, add_start_index=True
+    )
+    with metrics.timer("ingest.split"):
+        chunks = text_splitter.split_documents(list(number_parts(docs)))
+    with metrics.timer("ingest.filter"):
+        filtered_chunks = filter_complex_metadata(chunks)
+    return filtered_chunks, time.perf_counter() - start
+
+
+def load_and_split_measured(file_path, digest=None):
+    """load_and_split for a worker process: also returns the stage metrics it recorded there."""
+    with metrics.capture() as recorded:
+        chunks, seconds = load_and_split(file_path, digest)
+    return chunks, seconds, recorded.snapshot()
+
+
+def iter_loaded_files(file_paths, workers=1, digests=None):
+    """
+    Yield (file_path, chunks, load_seconds) in the same order as file_paths.
+    With more than one worker, loading and splitting happen in a process pool while
+    the caller consumes results in order, so the resulting index is deterministic.
+    `digests` (one per path) saves hashing the files again to look up the text cache.
+    """
+    digests = digests or [None] * len(file_paths)
+    if workers <= 1:
+        for file_path, digest in zip(file_paths, digests):
+            chunks, seconds = load_and_split(file_path, digest)
+            yield file_path, chunks, seconds
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for file_path, (chunks, seconds, recorded) in zip(
+            file_paths, pool.map(load_and_split_measured, file_paths, digests)
+        ):
+            metrics.registry.merge(recorded)
+            yield file_path, chunks, seconds
+
+
+def iter_pages(file_path, digest=None):
+    """Yield a file's pages/elements one at a time instead of loading the whole document."""
+    yield from metrics.timed(extracted_pages(file_path, digest, lazy=True), "ingest.load")
+
+
+def iter_chunks(pages):
+    """Split pages as they arrive, yielding metadata-filtered chunks."""
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, add_start_index=True
+    )
+    for page in number_parts(pages):
+        with metrics.timer("ingest.split"):
+            chunks = text_splitter.split_documents([page])
+        with metrics.timer("ingest.filter"):
+            chunks = filter_complex_metadata(chunks)
+        yield from chunks
+
+
+def iter_batches(items, batch_size):
+    """Group an iterable into lists of at most batch_size items."""
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def open_vectorstore(folder, embeddings):
+    """The exact index saved in folder, or None if there is none yet."""
+    if not os.path.exists(os.path.join(folder, EXACT_INDEX_NAME + ".faiss")):
+        return None
+    vectorstore = FAISS.load_local(folder, embeddings, allow_dangerous_deserialization=True)
+    bind_docstore(vectorstore, folder)
+    return vectorstore
+
+
+def add_chunks(vectorstore, chunks, ids, embeddings, docstore=None, folder=FAISS_INDEX_PATH):
+    """
+    Insert chunks under the given IDs, creating the vectorstore on first use.
+    A new vectorstore gets the requested docstore kind ("memory" or "sqlite").
+    The time not spent in embeddings (timed as "ingest.embed" by TimedEmbeddings) is "ingest.index_add".
+    """
+    if not chunks:
+        return vectorstore
+    start = time.perf_counter()
+    embed_seconds = metrics.registry.seconds("ingest.embed")
+    if vectorstore is None:
+        vectorstore = FAISS.from_documents(chunks, embeddings, ids=ids)
+        if docstore is not None:
+            convert_docstore(vectorstore, docstore, folder)
     else:
-        vectorstore = None
+        vectorstore.add_documents(chunks, ids=ids)
+    embed_seconds = metrics.registry.seconds("ingest.embed") - embed_seconds
+    metrics.observe("ingest.index_add", time.perf_counter() - start - embed_seconds)
+    metrics.count("ingest.chunks_added", len(chunks))
+    return vectorstore
+
+
+def save_checkpoint(vectorstore, manifest, folder=FAISS_INDEX_PATH, manifest_file=MANIFEST_FILE, dedup=None):
+    """
+    Persist the docstore, then the index, then the manifest, so the manifest never references
+    unsaved chunks and the saved index never references chunks missing from the docstore.
+    The BM25 lexical index and the dedup records are synced to the saved index before the manifest is written.
+    manifest=None saves the index only, for a caller that writes the manifest once several indexes are saved.
+    """
+    with metrics.timer("ingest.save"):
+        commit_docstore(vectorstore)
+        vectorstore.save_local(folder)
+        sync_lexical_index(vectorstore, folder)
+        if dedup is not None:
+            dedup.commit()
+        if manifest is not None:
+            save_manifest(manifest, manifest_file)
+
+
+def scan_tree(root, extensions=SUPPORTED_EXTENSIONS):
+    """
+    {manifest key: (mtime, size)} of the files with a supported extension under root, walked
+    recursively with os.scandir: directory entries already tell folders from files, so one stat
+    per matching file is the only other system call. Entries removed mid-scan are left out.
+    One-shot runs and --watch both list SOURCE_DIR with it, so they index the same files.
+    """
+    files = {}
+    folders = [root]
+    while folders:
+        folder = folders.pop()
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            folders.append(entry.path)
+                        elif entry.name.endswith(extensions) and entry.is_file():
+                            stat = entry.stat()
+                            key = os.path.relpath(entry.path, root).replace(os.sep, "/")
+                            files[key] = (stat.st_mtime, stat.st_size)
+                    except FileNotFoundError:
+                        continue
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+    return files
 
-    new_docs_loaded = False
-    source_dir = "./data"
 
-    for filename in os.listdir(source_dir):
-        file_path = os.path.join(source_dir, filename)
-        mtime = os.path.getmtime(file_path)
+def find_changed_files(manifest, rebuild=False, files=None):
+    """
+    Scan the SOURCE_DIR tree (see scan_tree) against the manifest; with rebuild=True every
+    supported file is pending. `files` ({manifest key: mtime}) checks those files instead of
+    scanning SOURCE_DIR (see watch).
+    Returns (pending file paths, {file_path: (mtime, sha256)}, listed manifest keys, manifest_changed).
+    """
+    pending = []
+    file_info = {}
+    manifest_changed = False
+    watched = files is not None
+    if not watched:
+        files = {key: mtime for key, (mtime, _) in scan_tree(SOURCE_DIR).items()}
+    listed = set(files)
+
+    for filename in sorted(listed):
+        file_path = os.path.join(SOURCE_DIR, filename)
+        if not file_path.endswith(SUPPORTED_EXTENSIONS):
+            continue
+        mtime = files[filename]
+        entry = manifest.get(filename)
 
-        if filename in manifest and manifest[filename] >= mtime:
+        # Files handed in were seen changing, so only their exact recorded mtime marks them unchanged
+        if not rebuild and entry is not None and is_complete(entry) and (
+            manifest_mtime(entry) == mtime if watched else manifest_mtime(entry) >= mtime
+        ):
             print(f"Skipping {filename}, already previously processed...")
             continue
 
-        loader = None
-        if filename.endswith(".pdf"):
-            loader = PyPDFLoader(file_path)
-        elif filename.endswith(".docx") or filename.endswith(".doc"):
-            loader = Docx2txtLoader(file_path)
-        elif filename.endswith(".xlsx") or filename.endswith(".xls"):
-            loader = UnstructuredExcelLoader(file_path, mode="elements")
-        elif filename.endswith(".pptx") or filename.endswith(".ppt"):
-            loader = UnstructuredPowerPointLoader(file_path, mode="elements")
-
-        if loader:
+        with metrics.timer("ingest.hash"):
+            digest = hash_file(file_path)
+        if not rebuild and isinstance(entry, dict) and is_complete(entry) and entry.get("sha256") == digest:
+            # Touched but not edited: remember the new mtime so the file is not hashed again
+            print(f"Skipping {filename}, content unchanged...")
+            entry["mtime"] = mtime
+            manifest_changed = True
+            continue
+
+        pending.append(file_path)
+        file_info[file_path] = (mtime, digest)
+
+    return pending, file_info, listed, manifest_changed
+
+
+def stream_file(file_path, mtime, digest, manifest, vectorstore, add, batch_size, on_batch, dedup=None):
+    """
+    Stream one file through pages -> chunks -> fixed-size embedding batches.
+    A file left incomplete by an interrupted run is resumed: chunks whose IDs are already
+    in the index are skipped instead of being embedded again. With a `dedup` index, chunks that
+    duplicate a stored chunk are recorded against it and not embedded.
+    `add(vectorstore, chunks, ids)` inserts a batch and returns the (possibly new) vectorstore.
+    Returns (vectorstore, number of chunks embedded).
+    """
+    filename = manifest_key(file_path)
+    entry = manifest.get(filename)
+    resuming = isinstance(entry, dict) and not is_complete(entry) and entry.get("sha256") == digest
+    if resuming:
+        print(f"Resuming: {filename} ({len(entry['ids'])} chunks already indexed)")
+        already_indexed = set(vectorstore.index_to_docstore_id.values()) if vectorstore is not None else set()
+    else:
+        print(f"Processing: {filename}")
+        if entry is not None:
+            release_chunks(vectorstore, dedup, filename, stale_chunk_ids(vectorstore, entry, filename))
+        already_indexed = set()
+
+    ids = []
+
+    def unindexed_chunks():
+        for position, chunk in enumerate(iter_chunks(iter_pages(file_path, digest))):
+            doc_id = chunk_ids(filename, digest, 1, start=position)[0]
+            _, _, (stored,) = dedup_chunks(dedup, filename, [chunk], [doc_id])
+            ids.append(stored)
+            if stored == doc_id and doc_id not in already_indexed:
+                yield chunk, doc_id
+
+    embedded = 0
+    for batch in iter_batches(unindexed_chunks(), batch_size):
+        chunks, batch_ids = zip(*batch)
+        vectorstore = add(vectorstore, list(chunks), list(batch_ids))
+        embedded += len(batch)
+        manifest[filename] = {"mtime": mtime, "sha256": digest, "ids": list(ids), "complete": False}
+        on_batch(vectorstore)
+
+    manifest[filename] = {"mtime": mtime, "sha256": digest, "ids": ids}
+    return vectorstore, embedded
+
+
+def apply_changes(vectorstore, manifest, pending, file_info, removed, add, dedup=None, workers=1, stream=False,
+                  batch_size=EMBED_BATCH_SIZE, on_batch=None):
+    """
+    Drop the chunks of the `removed` manifest keys from vectorstore and (re)embed the `pending`
+    files into it, updating their manifest entries. `add(vectorstore, chunks, ids)` inserts chunks
+    and returns the (possibly new) vectorstore; with stream=True, `on_batch(vectorstore)` runs
+    after each embedding batch. Returns (vectorstore, chunks embedded, whether chunks were removed).
+    """
+    index_changed = False
+    for filename in removed:
+        print(f"Removing {filename}, no longer in {SOURCE_DIR}...")
+        if release_chunks(vectorstore, dedup, filename, stale_chunk_ids(vectorstore, manifest[filename], filename)):
+            index_changed = True
+        del manifest[filename]
+
+    total_chunks = 0
+    if stream:
+        for file_path in pending:
+            mtime, digest = file_info[file_path]
+            file_start = time.perf_counter()
+            vectorstore, embedded = stream_file(
+                file_path, mtime, digest, manifest, vectorstore, add, batch_size, on_batch or (lambda current: None),
+                dedup
+            )
+            file_seconds = time.perf_counter() - file_start
+            rate = embedded / file_seconds if file_seconds > 0 else 0.0
+            print(f"  {embedded} chunks embedded in {file_seconds:.2f}s ({rate:.1f} chunks/s)")
+            total_chunks += embedded
+    else:
+        digests = [file_info[file_path][1] for file_path in pending]
+        for file_path, filtered_chunks, load_seconds in iter_loaded_files(pending, workers, digests):
+            filename = manifest_key(file_path)
+            mtime, digest = file_info[file_path]
             print(f"Processing: {filename}")
-            docs = loader.load()
-
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-            chunks = text_splitter.split_documents(docs)
-            filtered_chunks = filter_complex_metadata(chunks)
-
-            if vectorstore is None:
-                vectorstore = FAISS.from_documents(filtered_chunks, embeddings)
-            else:
-                vectorstore.add_documents(filtered_chunks)
-            manifest[filename] = mtime
-            new_docs_loaded = True
-
-    if new_docs_loaded:
-        save_manifest(manifest)
-        vectorstore.save_local(FAISS_INDEX_PATH)
-        print(f"Database updated and saved to {FAISS_INDEX_PATH}")
+
+            if filename in manifest:
+                release_chunks(vectorstore, dedup, filename, stale_chunk_ids(vectorstore, manifest[filename], filename))
+
+            new_chunks, new_ids, ids = dedup_chunks(
+                dedup, filename, filtered_chunks, chunk_ids(filename, digest, len(filtered_chunks))
+            )
+            embed_start = time.perf_counter()
+            vectorstore = add(vectorstore, new_chunks, new_ids)
+            embed_seconds = time.perf_counter() - embed_start
+
+            file_seconds = load_seconds + embed_seconds
+            rate = len(new_chunks) / file_seconds if file_seconds > 0 else 0.0
+            print(
+                f"  {len(new_chunks)} chunks: load+split {load_seconds:.2f}s, "
+                f"embed+index {embed_seconds:.2f}s ({rate:.1f} chunks/s)"
+            )
+            total_chunks += len(new_chunks)
+            manifest[filename] = {"mtime": mtime, "sha256": digest, "ids": ids}
+    return vectorstore, total_chunks, index_changed
+
+
+def update_index(folder, manifest, pending, file_info, removed, embeddings, workers=1, stream=False,
+                 batch_size=EMBED_BATCH_SIZE, checkpoint_every=CHECKPOINT_EVERY, index_options=None,
+                 retrain=False, docstore=None, manifest_file=MANIFEST_FILE, fresh=False,
+                 dedup_threshold=NEAR_DUP_THRESHOLD, embedding_info=None):
+    """
+    Bring the index under the root `folder` in line with one set of changes: the chunks of the
+    `removed` manifest keys are dropped and the `pending` files (re)embedded, then the index is
+    saved and its search index republished. The work happens in a staged copy of the published
+    version, which is published atomically at the end (see index_versions); a copy left by an
+    interrupted run is resumed and published. fresh=True starts from an empty index instead of the
+    saved one (keeping an SQLite docstore). Chunks that duplicate a stored chunk, exactly or with an estimated
+    similarity of at least dedup_threshold (None turns dedup off, 1.0 keeps exact matching only),
+    are not embedded; with dedup off, chunks that files deduplicated earlier still share are kept.
+    `embedding_info` (see embedding_backends.backend_info) is recorded in the index config;
+    adding to an index built by another backend raises ValueError.
+    Returns (chunks embedded, vectors in the index or None).
+    """
+    published = resolve_index(folder)
+    working, resumed = stage_version(folder, fresh)
+    if resumed:
+        print(f"Resuming the unpublished index version left in {working} by an interrupted run")
+    vectorstore = dedup = None
+    changed = False
+    try:
+        index_config = load_index_config(published if fresh else working)
+        index_config.update(index_options or {})
+        check_index_config(index_config)
+        if fresh:
+            if docstore is None and os.path.isfile(os.path.join(published, DOCSTORE_FILE)):
+                docstore = "sqlite"
+        else:
+            vectorstore = open_vectorstore(working, embeddings)
+        if embedding_info is not None:
+            if vectorstore is not None:
+                check_backend(index_config, embedding_info, folder)
+            index_config["embedding"] = embedding_info
+        # Saved before any checkpoint, so a resumed version is read with the settings it is built with
+        save_index_config(working, index_config)
+        # With dedup off, existing records are still opened so releases keep the chunks other files share
+        if dedup_threshold is not None or os.path.isfile(dedup_path(working)):
+            dedup = DedupIndex(dedup_path(working), dedup_threshold)
+        if dedup is not None and fresh:
+            dedup.clear()
+
+        docstore_changed = False
+        if docstore is not None and vectorstore is not None and docstore_kind(vectorstore.docstore) != docstore:
+            print(f"Converting docstore to {docstore}...")
+            convert_docstore(vectorstore, docstore, working)
+            docstore_changed = True
+
+        def add(current, chunks, ids):
+            return add_chunks(current, chunks, ids, embeddings, docstore, working)
+
+        batches = 0
+
+        def on_batch(current):
+            nonlocal batches
+            batches += 1
+            if checkpoint_every and batches % checkpoint_every == 0:
+                save_checkpoint(current, manifest, working, manifest_file, dedup)
+                mark_checkpoint(working)
+                print(f"  Checkpoint saved after {batches} batches")
+
+        vectorstore, total_chunks, index_changed = apply_changes(
+            vectorstore, manifest, pending, file_info, removed, add, dedup, workers, stream, batch_size, on_batch
+        )
+
+        report = dedup.report(vectorstore.index.d) if dedup is not None and vectorstore is not None else None
+        if report:
+            print(report)
+        if vectorstore is not None:
+            # Before the manifest is saved, so settings the index cannot be built with leave it untouched
+            check_index_config(index_config, vectorstore.index.ntotal, vectorstore.index.d)
+        if vectorstore is not None and (pending or removed or index_changed or docstore_changed or fresh or resumed):
+            save_checkpoint(vectorstore, manifest, working, manifest_file, dedup)
+            mark_checkpoint(working)
+            with metrics.timer("ingest.publish"):
+                publish_search_index(vectorstore, working, index_config, retrain)
+            changed = True
+        elif (index_options or retrain) and vectorstore is not None:
+            with metrics.timer("ingest.publish"):
+                publish_search_index(vectorstore, working, index_config, retrain)
+            changed = True
+    except Exception:
+        # A version no manifest checkpoint refers to is only a partial copy
+        if not has_checkpoint(working):
+            discard_staged_version(folder)
+        raise
+    finally:
+        if dedup is not None:
+            dedup.close()
+        if vectorstore is not None:
+            close_docstore(vectorstore)
+
+    if changed:
+        with metrics.timer("ingest.publish"):
+            version = publish_version(folder, working)
+        print(f"Database updated and saved to {folder} (version {version})")
+    else:
+        discard_staged_version(folder)
+    return total_chunks, vectorstore.index.ntotal if vectorstore is not None else None
+
+
+def update_shards(manifest, pending, file_info, removed, shard_by, root=SHARDS_PATH, rebuild_all=False, **options):
+    """
+    Sharded layout: group the changes by collection (see shards.collection_of) and update only
+    the shards they touch, or every shard when rebuild_all. The catalog is saved after each shard,
+    so an interrupted run never leaves a built shard out of it; shards left without files are deleted.
+    Returns the number of chunks embedded.
+    """
+    catalog = load_catalog(root) or {"shard_by": shard_by, "shards": {}}
+    groups = {}
+    for file_path in pending:
+        groups.setdefault(collection_of(manifest_key(file_path), shard_by), ([], []))[0].append(file_path)
+    for key in removed:
+        groups.setdefault(collection_of(key, shard_by), ([], []))[1].append(key)
+    if rebuild_all:
+        for name in catalog["shards"]:
+            groups.setdefault(name, ([], []))
+    # Shards an interrupted run left unpublished
+    for name in os.listdir(root):
+        if has_staged_version(shard_folder(name, root)):
+            groups.setdefault(name, ([], []))
+
+    total_chunks = 0
+    for name in sorted(groups):
+        shard_pending, shard_removed = groups[name]
+        folder = shard_folder(name, root)
+        print(f"--- Shard {name} ---")
+        chunks, vectors = update_index(
+            folder, manifest, shard_pending, file_info, shard_removed,
+            manifest_file=shard_manifest_path(root), **options
+        )
+        total_chunks += chunks
+        files = sum(1 for key in manifest if collection_of(key, shard_by) == name)
+        if files:
+            shard = catalog["shards"].setdefault(name, {"folder": name})
+            shard["files"] = files
+            if vectors is not None:
+                shard["vectors"] = vectors
+        else:
+            print(f"Shard {name} is empty, deleting it...")
+            catalog["shards"].pop(name, None)
+            shutil.rmtree(folder, ignore_errors=True)
+        save_catalog(catalog, root)
+    return total_chunks
+
+
+def prune_text_cache(manifest):
+    """Keep only the text of the file versions the index is built from."""
+    text_cache = TextCache(TEXT_CACHE_PATH)
+    text_cache.prune({entry["sha256"] for entry in manifest.values() if isinstance(entry, dict) and "sha256" in entry})
+    text_cache.close()
+
+
+def index_layout(shard_by=None):
+    """
+    (shard_by, manifest file) of the index layout: an existing sharded layout keeps its mode,
+    and asking for another one raises ValueError.
+    """
+    catalog = load_catalog(SHARDS_PATH)
+    if catalog is not None:
+        if shard_by is not None and shard_by != catalog["shard_by"]:
+            raise ValueError(
+                f"{SHARDS_PATH} is sharded by {catalog['shard_by']}; delete it to re-shard by {shard_by}."
+            )
+        shard_by = catalog["shard_by"]
+    if shard_by:
+        os.makedirs(SHARDS_PATH, exist_ok=True)
+    return shard_by, shard_manifest_path(SHARDS_PATH) if shard_by else MANIFEST_FILE
+
+
+def open_embeddings(embedding_backend=None, embed_options=None):
+    """
+    Embedding model for an ingest run, behind the embedding cache and the "ingest.embed" timer.
+    Returns (model, embeddings to index with, backend info, embedding cache).
+    """
+    embedding_cache = EmbeddingCache()
+    model = create_embeddings(embedding_backend, client_options=embed_options or {})
+    embedding_info = backend_info(embedding_backend, model)
+    # Local backends embed faster than the cache can look vectors up
+    embeddings = CachedEmbeddings(model, embedding_cache) if embedding_info["backend"] == "openai" else model
+    if metrics.registry.enabled:
+        embeddings = TimedEmbeddings(embeddings, "ingest.embed")
+    return model, embeddings, embedding_info, embedding_cache
+
+
+def check_search_index(manifest, pending, removed, shard_by=None, index_options=None):
+    """
+    Raise ValueError before anything is loaded or embedded if the search index settings (the
+    saved ones with index_options applied) cannot be built. Without pending files the vector
+    count of each index is known from the chunk IDs in the manifest and is checked too.
+    """
+    indexes = {}
+    for key, entry in manifest.items():
+        if key not in removed:
+            name = collection_of(key, shard_by) if shard_by else None
+            indexes.setdefault(name, []).append(entry)
+    for name, entries in indexes.items():
+        folder = shard_folder(name, SHARDS_PATH) if shard_by else FAISS_INDEX_PATH
+        config = load_index_config(resolve_index(folder))
+        config.update(index_options or {})
+        counted = not pending and all(isinstance(entry, dict) and "ids" in entry for entry in entries)
+        vectors = len({doc_id for entry in entries for doc_id in entry["ids"]}) if counted else None
+        check_index_config(config, vectors)
+
+
+def build_vector_db(workers=1, stream=False, batch_size=EMBED_BATCH_SIZE, checkpoint_every=CHECKPOINT_EVERY,
+                    index_options=None, retrain=False, docstore=None, shard_by=None, rebuild_from_cache=False,
+                    dedup_threshold=NEAR_DUP_THRESHOLD, embedding_backend=None, embed_options=None):
+    """
+    Bring the FAISS index in line with SOURCE_DIR.
+    By default each changed file is loaded whole (optionally by a pool of `workers` processes).
+    With stream=True files flow through generators in batches of `batch_size` chunks, so memory
+    stays bounded, and the index and manifest are checkpointed every `checkpoint_every` batches.
+    `index_options` overrides the saved search index settings (see index_factory); the search
+    index is then republished even if no documents changed.
+    `docstore` ("memory" or "sqlite") converts the chunk store; by default the existing kind is kept.
+    `shard_by` ("dir" or "type") writes one index per collection under SHARDS_PATH instead of a
+    single index (see update_shards); a sharded layout keeps its mode on later runs.
+    `rebuild_from_cache` re-chunks and re-indexes every file into a new index, taking the text
+    from the extracted-text cache so documents are not parsed again (files missing from the
+    cache are parsed once). Use it after changing CHUNK_SIZE, CHUNK_OVERLAP or the splitter.
+    `dedup_threshold` sets near-duplicate detection (see update_index); None turns it off.
+    `embedding_backend` ("openai" or "hashing", default EMBEDDING_BACKEND or openai) picks the
+    embedding model; an index built with another backend must be rebuilt with rebuild_from_cache.
+    OpenAI embeddings go through the concurrent, rate-limited client (see embedding_client);
+    `embed_options` overrides its concurrency, rpm and tpm.
+    Unless metrics are disabled (METRICS=0), each run appends a JSON summary with its per-stage
+    timings and counters to INGEST_METRICS_FILE (see ingest_summary).
+    """
+    metrics.registry.reset("ingest.")
+    shard_by, manifest_file = index_layout(shard_by)
+    manifest = load_manifest(manifest_file)
+    model, embeddings, embedding_info, embedding_cache = open_embeddings(embedding_backend, embed_options)
+
+    pending, file_info, listed, manifest_changed = find_changed_files(manifest, rebuild=rebuild_from_cache)
+    removed = sorted(set(manifest) - listed)
+    if index_options or retrain:
+        check_search_index(manifest, pending, removed, shard_by, index_options)
+    if rebuild_from_cache:
+        uncached = [path for path in pending if not is_text_cached(path, file_info[path][1])]
+        print(f"Rebuilding the index from the text cache: {len(pending) - len(uncached)} of {len(pending)} files "
+              f"cached, {len(uncached)} to parse")
+    options = dict(
+        embeddings=embeddings, workers=workers, stream=stream, batch_size=batch_size,
+        checkpoint_every=checkpoint_every, index_options=index_options, retrain=retrain, docstore=docstore,
+        fresh=rebuild_from_cache, dedup_threshold=dedup_threshold, embedding_info=embedding_info
+    )
+    rebuild = bool(index_options or retrain or docstore or rebuild_from_cache)
+    if not shard_by and has_staged_version(FAISS_INDEX_PATH):
+        # An interrupted run's changes are in the manifest but not published yet
+        rebuild = True
+
+    run_start = time.perf_counter()
+    if shard_by:
+        total_chunks = update_shards(
+            manifest, pending, file_info, removed, shard_by, SHARDS_PATH, rebuild_all=rebuild, **options
+        )
+    elif pending or removed or rebuild:
+        total_chunks, _ = update_index(
+            FAISS_INDEX_PATH, manifest, pending, file_info, removed, manifest_file=manifest_file, **options
+        )
     else:
-        print("No new changes detected.")
+        total_chunks = 0
+
+    if pending:
+        elapsed = time.perf_counter() - run_start
+        files_per_second = len(pending) / elapsed if elapsed > 0 else 0.0
+        mode = "streaming" if stream else f"{workers} worker(s)"
+        print(
+            f"Ingested {len(pending)} files ({total_chunks} chunks) in {elapsed:.2f}s "
+            f"with {mode}: {files_per_second:.2f} files/s"
+        )
+        print(f"Embedding cache: {embedding_cache.hits} hits, {embedding_cache.misses} misses")
+        if isinstance(model, ConcurrentEmbeddings) and model.report():
+            print(model.report())
+        stages = metrics.registry.snapshot("ingest.")["stages"]
+        if stages:
+            print("Stages: " + ", ".join(
+                f"{name[len('ingest.'):]} {stats['seconds']:.2f}s" for name, stats in stages.items()
+            ))
+    if not (pending or removed or rebuild):
+        if manifest_changed:
+            save_manifest(manifest, manifest_file)
+            print("No content changes detected; manifest timestamps refreshed.")
+        else:
+            print("No new changes detected.")
+    if pending or removed:
+        prune_text_cache(manifest)
+    if metrics.registry.enabled:
+        metrics.write_summary(ingest_summary(
+            run_start, pending, removed, total_chunks, embedding_cache, workers=workers, stream=stream, shard_by=shard_by
+        ), INGEST_METRICS_FILE)
+    embedding_cache.close()
+    if isinstance(model, ConcurrentEmbeddings):
+        model.close()
+
+
+def ingest_summary(run_start, pending, removed, total_chunks, embedding_cache, **settings):
+    """Machine-readable record of one ingest run: what changed, the settings, and the per-stage metrics."""
+    return dict({
+        "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "seconds": round(time.perf_counter() - run_start, 6),
+        "files_ingested": len(pending),
+        "files_removed": len(removed),
+        "chunks_embedded": total_chunks,
+        "embedding_cache": (
+            {"hits": embedding_cache.hits, "misses": embedding_cache.misses} if embedding_cache is not None else None
+        ),
+        "settings": settings,
+    }, **metrics.registry.snapshot("ingest."))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest ./data into the FAISS vector database.")
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="Number of processes used to load and split files in parallel (default: 1)."
+    )
+    parser.add_argument(
+        "--stream", action="store_true",
+        help="Stream files page by page in fixed-size embedding batches to keep memory bounded."
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=EMBED_BATCH_SIZE,
+        help=f"Chunks per embedding batch in --stream mode (default: {EMBED_BATCH_SIZE})."
+    )
+    parser.add_argument(
+        "--checkpoint-every", type=int, default=CHECKPOINT_EVERY,
+        help=f"Save the index and manifest every N batches in --stream mode (default: {CHECKPOINT_EVERY})."
+    )
+    parser.add_argument(
+        "--docstore", choices=DOCSTORE_KINDS,
+        help="Chunk store behind the index: pickled in memory, or an SQLite file read on demand (default: keep current)."
+    )
+    index_group = parser.add_argument_group("search index", "Settings are saved with the index and reused by later runs.")
+    index_group.add_argument("--index-type", choices=INDEX_TYPES, help="Search index type (default: flat, exact search).")
+    index_group.add_argument("--nlist", type=int, help="Number of IVF lists for ivf-flat/ivf-pq.")
+    index_group.add_argument("--pq-m", type=int, help="Number of PQ sub-quantizers for ivf-pq.")
+    index_group.add_argument("--hnsw-m", type=int, help="Graph degree for hnsw.")
+    index_group.add_argument("--nprobe", type=int, help="IVF lists probed per query.")
+    index_group.add_argument("--ef-search", type=int, help="HNSW search beam width.")
+    index_group.add_argument("--train-size", type=int, help="Number of corpus vectors sampled for training.")
+    index_group.add_argument(
+        "--retrain", action="store_true", help="Retrain the search index instead of reusing its training."
+    )
+    parser.add_argument(
+        "--shard-by", choices=SHARD_MODES,
+        help=f"Write one index per collection under {SHARDS_PATH}: per top-level subdirectory of {SOURCE_DIR} "
+             "or per file type. Kept by later runs."
+    )
+    parser.add_argument(
+        "--rebuild-from-cache", action="store_true",
+        help="Re-chunk and re-index every file into a new index from the extracted-text cache, without parsing them again."
+    )
+    dedup_group = parser.add_mutually_exclusive_group()
+    dedup_group.add_argument(
+        "--dedup-threshold", type=float, default=NEAR_DUP_THRESHOLD,
+        help=f"Estimated similarity from which a chunk counts as a near-duplicate and is not embedded "
+             f"(default: {NEAR_DUP_THRESHOLD}; 1.0 skips exact duplicates only)."
+    )
+    dedup_group.add_argument("--no-dedup", action="store_true", help="Embed every chunk, even exact duplicates.")
+    parser.add_argument(
+        "--embedding-backend", choices=EMBEDDING_BACKENDS,
+        help="Embedding model: the OpenAI API, or local hashed character n-grams that need no network "
+             "(default: EMBEDDING_BACKEND or openai). Switching an existing index needs --rebuild-from-cache."
+    )
+    client_group = parser.add_argument_group(
+        "embedding API", "Concurrent, rate-limited OpenAI embedding requests (defaults: EMBED_CONCURRENCY, "
+        "EMBED_RPM and EMBED_TPM, else the values shown)."
+    )
+    client_group.add_argument(
+        "--embed-concurrency", type=int, help=f"Embedding requests in flight at once (default: {EMBED_CONCURRENCY})."
+    )
+    client_group.add_argument("--embed-rpm", type=int, help=f"Requests-per-minute budget (default: {EMBED_RPM}).")
+    client_group.add_argument("--embed-tpm", type=int, help=f"Tokens-per-minute budget (default: {EMBED_TPM}).")
+    watch_group = parser.add_argument_group(
+        "watch mode", f"Keep running with the index loaded and apply changes to {SOURCE_DIR} and its subdirectories."
+    )
+    watch_group.add_argument("--watch", action="store_true", help="Watch for changes until stopped (Ctrl-C or SIGTERM).")
+    watch_group.add_argument(
+        "--poll-seconds", type=float, default=WATCH_POLL_SECONDS,
+        help=f"Rescan interval after a change; it doubles while nothing changes (default: {WATCH_POLL_SECONDS})."
+    )
+    watch_group.add_argument(
+        "--max-poll-seconds", type=float, default=WATCH_MAX_POLL_SECONDS,
+        help=f"Longest rescan interval while nothing changes (default: {WATCH_MAX_POLL_SECONDS})."
+    )
+    watch_group.add_argument(
+        "--debounce-seconds", type=float, default=WATCH_DEBOUNCE_SECONDS,
+        help=f"Quiet time before changes are applied (default: {WATCH_DEBOUNCE_SECONDS})."
+    )
+    watch_group.add_argument(
+        "--persist-seconds", type=float, default=WATCH_PERSIST_SECONDS,
+        help=f"Longest time applied changes wait to be saved and published (default: {WATCH_PERSIST_SECONDS})."
+    )
+    args = parser.parse_args(argv)
+    if args.no_dedup:
+        args.dedup_threshold = None
+    args.index_options = {
+        key: value for key, value in (
+            ("type", args.index_type), ("nlist", args.nlist), ("pq_m", args.pq_m), ("hnsw_m", args.hnsw_m),
+            ("nprobe", args.nprobe), ("efSearch", args.ef_search), ("train_size", args.train_size)
+        ) if value is not None
+    }
+    args.embed_options = {
+        key: value for key, value in (
+            ("concurrency", args.embed_concurrency), ("rpm", args.embed_rpm), ("tpm", args.embed_tpm)
+        ) if value is not None
+    }
+    if args.stream and args.workers > 1:
+        parser.error("--stream processes files sequentially and cannot be combined with --workers")
+    if args.watch and (args.index_options or args.retrain or args.docstore or args.rebuild_from_cache):
+        parser.error("--watch cannot be combined with search index, --docstore or --rebuild-from-cache options; "
+                     "run those once without --watch")
+    return args
 
 
 if __name__ == "__main__":
-    print("--- Starting Ingestion Process ---")
-    build_vector_db()
+    args = parse_args()
+    if args.watch:
+        from watch import watch
+        print("--- Starting Ingestion Watch ---")
+        watch(
+            shard_by=args.shard_by,
+            embedding_backend=args.embedding_backend,
+            embed_options=args.embed_options,
+            workers=args.workers,
+            stream=args.stream,
+            batch_size=args.batch_size,
+            dedup_threshold=args.dedup_threshold,
+            poll_seconds=args.poll_seconds,
+            max_poll_seconds=args.max_poll_seconds,
+            debounce_seconds=args.debounce_seconds,
+            persist_seconds=args.persist_seconds
+        )
+    else:
+        print("--- Starting Ingestion Process ---")
+        build_vector_db(
+            workers=args.workers,
+            stream=args.stream,
+            batch_size=args.batch_size,
+            checkpoint_every=args.checkpoint_every,
+            index_options=args.index_options,
+            retrain=args.retrain,
+            docstore=args.docstore,
+            shard_by=args.shard_by,
+            rebuild_from_cache=args.rebuild_from_cache,
+            dedup_threshold=args.dedup_threshold,
+            embedding_backend=args.embedding_backend,
+            embed_options=args.embed_options
+        )
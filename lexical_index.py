@@ -0,0 +1,175 @@
+import os
+import re
+import math
+import sqlite3
+import threading
+from collections import Counter
+
+LEXICAL_INDEX_FILE = "bm25.sqlite"
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Terms found in more than this share of chunks are skipped when the query has other terms
+MAX_DF_RATIO = 0.5
+_SQL_BATCH = 500
+
+# Identifiers such as INV-2024-0042, job_code.7 or jane.doe@example.com stay one token
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_./@:#][a-z0-9]+)*")
+_PART = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Lowercased word and identifier tokens; compound identifiers also yield their parts."""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        tokens.append(token)
+        parts = _PART.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over chunk text, stored in an SQLite file next to the FAISS index.
+    Chunks are keyed by the same docstore IDs as the vectorstore; postings refer to them by a
+    compact integer row ID. The chunk count and total length BM25 needs on every query are kept
+    in a one-row stats table, updated by add and delete, rather than summed over all chunks.
+    Writes are held in a transaction until commit(), like SQLiteDocstore.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS docs (rowid INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, length INTEGER NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, doc INTEGER NOT NULL, tf INTEGER NOT NULL, "
+                "PRIMARY KEY (term, doc)) WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS stats (id INTEGER PRIMARY KEY CHECK (id = 0), docs INTEGER NOT NULL, "
+                "length INTEGER NOT NULL)"
+            )
+            if self._conn.execute("SELECT 1 FROM stats").fetchone() is None:
+                # Index files written before the stats table are summed once
+                self._conn.execute("INSERT INTO stats SELECT 0, COUNT(*), COALESCE(SUM(length), 0) FROM docs")
+                self._conn.commit()
+        return self._conn
+
+    def add(self, texts):
+        """Index {doc_id: text}; an ID that is already indexed is replaced."""
+        self.delete(list(texts))
+        with self._lock:
+            conn = self._connect()
+            added_length = 0
+            for doc_id, text in texts.items():
+                counts = Counter(tokenize(text))
+                length = sum(counts.values())
+                cursor = conn.execute("INSERT INTO docs (id, length) VALUES (?, ?)", (doc_id, length))
+                conn.executemany(
+                    "INSERT INTO postings (term, doc, tf) VALUES (?, ?, ?)",
+                    [(term, cursor.lastrowid, tf) for term, tf in counts.items()]
+                )
+                added_length += length
+            conn.execute("UPDATE stats SET docs = docs + ?, length = length + ?", (len(texts), added_length))
+
+    def delete(self, ids):
+        with self._lock:
+            conn = self._connect()
+            for i in range(0, len(ids), _SQL_BATCH):
+                batch = list(ids[i:i + _SQL_BATCH])
+                marks = ",".join("?" * len(batch))
+                count, length = conn.execute(
+                    f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs WHERE id IN ({marks})", batch
+                ).fetchone()
+                if not count:
+                    continue
+                conn.execute(f"DELETE FROM postings WHERE doc IN (SELECT rowid FROM docs WHERE id IN ({marks}))", batch)
+                conn.execute(f"DELETE FROM docs WHERE id IN ({marks})", batch)
+                conn.execute("UPDATE stats SET docs = docs - ?, length = length - ?", (count, length))
+
+    def ids(self):
+        with self._lock:
+            return {row[0] for row in self._connect().execute("SELECT id FROM docs")}
+
+    def search(self, query, k):
+        """Top-k (doc_id, BM25 score) pairs for a query, best first."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            conn = self._connect()
+            total, total_length = conn.execute("SELECT docs, length FROM stats").fetchone()
+            if not total:
+                return []
+            average_length = total_length / total
+            scores = Counter()
+            for term in terms:
+                (df,) = conn.execute("SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()
+                if not df or (len(terms) > 1 and df > MAX_DF_RATIO * total):
+                    continue
+                idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+                rows = conn.execute(
+                    "SELECT docs.id, postings.tf, docs.length FROM postings JOIN docs ON docs.rowid = postings.doc "
+                    "WHERE postings.term = ?", (term,)
+                )
+                for doc_id, tf, length in rows:
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                    scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores.most_common(k)
+
+    def commit(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.commit()
+                self._conn.close()
+                self._conn = None
+
+    def __len__(self):
+        with self._lock:
+            (count,) = self._connect().execute("SELECT docs FROM stats").fetchone()
+        return count
+
+
+def lexical_index_path(folder):
+    return os.path.join(folder, LEXICAL_INDEX_FILE)
+
+
+def sync_lexical_index(vectorstore, folder):
+    """
+    Bring the lexical index in folder in line with the vectorstore: chunks added since the last
+    sync are tokenized from the docstore and removed chunks are dropped. Only the difference is
+    touched, so calling this at every ingest checkpoint keeps the index incremental, and an index
+    built before the lexical index existed is backfilled on its next ingest.
+    Returns (chunks added, chunks removed).
+    """
+    path = lexical_index_path(folder)
+    ids = list(vectorstore.index_to_docstore_id.values())
+    if not ids and not os.path.isfile(path):
+        return 0, 0
+
+    index = LexicalIndex(path)
+    indexed = index.ids()
+    current = set(ids)
+    stale = [doc_id for doc_id in indexed if doc_id not in current]
+    new = [doc_id for doc_id in ids if doc_id not in indexed]
+    index.delete(stale)
+    for i in range(0, len(new), _SQL_BATCH):
+        docs = {doc_id: vectorstore.docstore.search(doc_id) for doc_id in new[i:i + _SQL_BATCH]}
+        index.add({doc_id: doc.page_content for doc_id, doc in docs.items() if hasattr(doc, "page_content")})
+    index.close()
+    return len(new), len(stale)
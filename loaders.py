@@ -0,0 +1,168 @@
+import os
+import re
+import zipfile
+import datetime
+import posixpath
+import xml.etree.ElementTree as ET
+from langchain_core.documents import Document
+from langchain_core.document_loaders import BaseLoader
+from openpyxl import load_workbook
+
+# Characters per spreadsheet chunk; kept at the ingest chunk size so the splitter leaves row batches whole
+SHEET_CHUNK_CHARS = 1000
+MAX_ROWS_PER_CHUNK = 100
+CELL_SEPARATOR = " | "
+
+_DRAWING_NS = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+_PRESENTATION_NS = "{http://schemas.openxmlformats.org/presentationml/2006/main}"
+_RELATIONSHIP_ID = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+_PACKAGE_RELS_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+
+def fast_loaders_enabled():
+    """FAST_LOADERS=0 sends spreadsheets and slides through the Unstructured loaders only."""
+    return os.getenv("FAST_LOADERS", "1") != "0"
+
+
+def format_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, datetime.datetime) and value.time() == datetime.time(0):
+        return value.date().isoformat()
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value).strip()
+
+
+class FallbackLoader(BaseLoader):
+    """
+    Base for the fast loaders: if the fast path fails before yielding anything (an old binary
+    format, an encrypted or unusual file), the file is loaded with `fallback()` instead.
+    """
+
+    def __init__(self, file_path, fallback=None):
+        self.file_path = file_path
+        self.fallback = fallback
+
+    def fast_load(self):
+        raise NotImplementedError
+
+    def lazy_load(self):
+        started = False
+        try:
+            for doc in self.fast_load():
+                started = True
+                yield doc
+        except Exception as e:
+            if started or self.fallback is None:
+                raise
+            print(f"  Fast loader failed for {os.path.basename(self.file_path)} ({e!r}), using the fallback loader")
+            yield from self.fallback().lazy_load()
+
+
+class XlsxLoader(FallbackLoader):
+    """
+    Streams a workbook with openpyxl in read-only mode, so only the current row is in memory.
+    Rows are grouped into chunks of up to max_chars characters (and max_rows rows); every chunk
+    starts with the sheet name and its header row, so a chunk can be read without the rest of the sheet.
+    Metadata: source, sheet, first_row and last_row (1-based sheet rows), and page (chunk number
+    in the workbook), which keeps retrieval from merging unrelated row batches.
+    """
+
+    def __init__(self, file_path, fallback=None, max_chars=SHEET_CHUNK_CHARS, max_rows=MAX_ROWS_PER_CHUNK):
+        super().__init__(file_path, fallback)
+        self.max_chars = max_chars
+        self.max_rows = max_rows
+
+    def fast_load(self):
+        workbook = load_workbook(self.file_path, read_only=True, data_only=True)
+        try:
+            page = 0
+            for sheet in workbook.worksheets:
+                for first_row, last_row, text in self.sheet_chunks(sheet):
+                    page += 1
+                    yield Document(page_content=text, metadata={
+                        "source": self.file_path, "sheet": sheet.title,
+                        "first_row": first_row, "last_row": last_row, "page": page,
+                    })
+        finally:
+            workbook.close()
+
+    def sheet_chunks(self, sheet):
+        """Yield (first_row, last_row, text) for the row batches of one sheet."""
+        header = header_row = None
+        lines, first_row, last_row, size = [], None, None, 0
+        for number, values in enumerate(sheet.iter_rows(values_only=True), start=1):
+            cells = [format_cell(value) for value in values]
+            while cells and not cells[-1]:
+                cells.pop()
+            if not cells:
+                continue
+            line = CELL_SEPARATOR.join(cells)
+            if header is None:
+                header, header_row = f"Sheet: {sheet.title}\n{line}", number
+                continue
+            if lines and (size + len(line) + 1 > self.max_chars or len(lines) >= self.max_rows):
+                yield first_row, last_row, "\n".join([header] + lines)
+                lines = []
+            if not lines:
+                first_row, size = number, len(header)
+            lines.append(line)
+            last_row = number
+            size += len(line) + 1
+        if lines:
+            yield first_row, last_row, "\n".join([header] + lines)
+        elif header is not None:
+            # A sheet with a single row (or only a title) is still worth indexing
+            yield header_row, header_row, header
+
+
+def _slide_order(archive):
+    """Slide part names in presentation order, falling back to their file numbers."""
+    try:
+        rels = ET.fromstring(archive.read("ppt/_rels/presentation.xml.rels"))
+        targets = {rel.get("Id"): rel.get("Target") for rel in rels.iter(f"{_PACKAGE_RELS_NS}Relationship")}
+        presentation = ET.fromstring(archive.read("ppt/presentation.xml"))
+        order = [
+            posixpath.normpath(posixpath.join("ppt", targets[slide.get(_RELATIONSHIP_ID)]))
+            for slide in presentation.iter(f"{_PRESENTATION_NS}sldId")
+        ]
+        if order:
+            return order
+    except (KeyError, ET.ParseError):
+        pass
+    names = [name for name in archive.namelist() if re.fullmatch(r"ppt/slides/slide\d+\.xml", name)]
+    return sorted(names, key=lambda name: int(re.search(r"(\d+)\.xml$", name).group(1)))
+
+
+def slide_text(xml_file):
+    """Text of one slide's XML, one line per paragraph, read incrementally."""
+    lines, runs = [], []
+    for event, element in ET.iterparse(xml_file, events=("end",)):
+        if element.tag == f"{_DRAWING_NS}t":
+            runs.append(element.text or "")
+        elif element.tag == f"{_DRAWING_NS}p":
+            line = "".join(runs).strip()
+            if line:
+                lines.append(line)
+            runs = []
+            element.clear()
+    return "\n".join(lines)
+
+
+class PptxLoader(FallbackLoader):
+    """
+    Reads slide text straight from the .pptx package (zip of XML parts), one Document per
+    slide with its text boxes, tables and grouped shapes in reading order. Metadata: source and
+    page (slide number). Images and charts carry no text and are skipped.
+    """
+
+    def fast_load(self):
+        with zipfile.ZipFile(self.file_path) as archive:
+            for number, name in enumerate(_slide_order(archive), start=1):
+                with archive.open(name) as xml_file:
+                    text = slide_text(xml_file)
+                if text:
+                    yield Document(page_content=text, metadata={"source": self.file_path, "page": number})
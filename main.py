@@ -1,51 +1,321 @@
+import os
+import time
+import asyncio
+from contextlib import contextmanager
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain.agents import create_agent
-from tools import get_retriever_tool
+import metrics
+from tools import (
+    get_retriever_tool, get_vectorstore, get_lexical_index, index_generation, index_lease, refresh_index
+)
+from answer_cache import AnswerCache, ANSWER_CACHE_SIZE
+from rag import chat_mode, chunk_sources, answer_direct, answer_direct_async, stream_direct, astream_direct
 
 
 load_dotenv()
-model = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+# stream_usage makes streamed answers report their token counts too (see metrics.LLMMetricsHandler)
+model = ChatOpenAI(model="gpt-4o-mini", temperature=0, stream_usage=True, callbacks=metrics.chat_callbacks())
 
 # Initialize tools and agent lazily to avoid import-time errors
 _agent = None
+_agent_generation = None
+_answer_cache = None
 
 
 def get_agent():
-    """Lazy initialization of agent to avoid loading tools on import."""
-    global _agent
-    if _agent is None:
+    """
+    Lazy initialization of agent to avoid loading tools on import. The agent's retriever holds
+    the loaded index, so it is rebuilt once tools has hot-reloaded a newly published version.
+    """
+    global _agent, _agent_generation
+    refresh_index()
+    if _agent is None or _agent_generation != index_generation():
         tools = [get_retriever_tool()]
         _agent = create_agent(model, tools)
+        _agent_generation = index_generation()
     return _agent
 
 
-def handle_chat(user_input):
+def get_answer_cache():
     """
-    Standardizes the input/output for local chat or AWS Lambda.
+    Lazy initialization of the answer cache. ANSWER_CACHE_SIZE bounds it (0 disables caching);
+    setting ANSWER_CACHE_SIMILARITY (e.g. 0.95) also matches near-duplicate questions by
+    cosine similarity of their query embeddings. Entries are valid for the index loaded when
+    they were stored (see AnswerCache), and answers finished after a hot reload swapped the
+    index are not stored (see _Request).
+    """
+    global _answer_cache
+    if _answer_cache is None:
+        threshold = os.getenv("ANSWER_CACHE_SIMILARITY")
+        _answer_cache = AnswerCache(
+            max_entries=int(os.getenv("ANSWER_CACHE_SIZE", ANSWER_CACHE_SIZE)),
+            similarity_threshold=float(threshold) if threshold else None,
+            embed=lambda text: get_vectorstore().embeddings.embed_query(text)
+        )
+    return _answer_cache
+
+
+class _Request:
+    """
+    What every chat entry point does around computing an answer: look the question up in the
+    answer cache, lease the loaded index and pick the route while the answer is computed, then
+    store the answer. The lookup first checks for a newly published index version (a cache hit
+    never reaches get_vectorstore, the other place that checks), since cached answers are only
+    valid for the index that is loaded. Answers finished after a hot reload swapped the index are
+    not stored. Passing an agent always takes the agent route.
     """
-    # The modern agent expects a dictionary with a list of messages
-    inputs = {"messages": [("user", user_input)]}
-    agent = get_agent()
-    result = agent.invoke(inputs)
 
+    def __init__(self, user_input, agent=None):
+        self.user_input = user_input
+        self.agent = agent
+        self.cache = get_answer_cache()
+        self.generation = None
+
+    def cached(self):
+        refresh_index()
+        if self.cache.max_entries > 0:
+            return self._hit(self.cache.get(self.user_input))
+        return None
+
+    async def cached_async(self):
+        refresh_index()
+        if self.cache.max_entries > 0:
+            return self._hit(await _call_cache(self.cache, self.cache.get, self.user_input))
+        return None
+
+    @staticmethod
+    def _hit(cached):
+        if cached is not None:
+            metrics.count("chat.cache_hits")
+        return cached
+
+    @contextmanager
+    def answering(self):
+        """Yields "direct" or "agent"; the lease keeps a hot reload from closing the index the answer comes from."""
+        with index_lease() as self.generation:
+            yield "direct" if self.agent is None and chat_mode(self.user_input) == "direct" else "agent"
+
+    def get_agent(self):
+        return self.agent if self.agent is not None else get_agent()
+
+    def _cacheable(self):
+        return self.cache.max_entries > 0 and index_generation() == self.generation
+
+    def store(self, response):
+        if self._cacheable():
+            self.cache.put(self.user_input, response)
+
+    async def store_async(self, response):
+        if self._cacheable():
+            await _call_cache(self.cache, self.cache.put, self.user_input, response)
+
+
+def _build_response(result):
+    """Turn the agent's final state into the {answer, sources} payload."""
     # In the unified agent, the result is a State object
     # and the answer is the content of the last message
     final_answer = result["messages"][-1].content
 
-    # Logic to extract sources from the message history
-    sources = set()
+    # Logic to extract sources from the message history: the retriever tool attaches
+    # the chunks it returned as the message artifact
+    sources = []
     for msg in result["messages"]:
         if hasattr(msg, "name") and msg.name == "search_personal_docs":
-            # We add a marker to know this came from our specific tool
-            sources.add(f"Retrieved from: {msg.name}")
+            artifact = getattr(msg, "artifact", None)
+            if isinstance(artifact, list):
+                sources += [source for source in chunk_sources(artifact) if source not in sources]
+            elif not sources:
+                # Tool output without documents attached: fall back to marking the tool itself
+                sources.append(f"Retrieved from: {msg.name}")
 
     return {
         "answer": final_answer,
-        "sources": list(sources)
+        "sources": sources
     }
 
 
+def handle_chat(user_input):
+    """
+    Standardizes the input/output for local chat or AWS Lambda.
+    Plain document questions are answered directly (one retrieval, one LLM call); the router
+    in rag.chat_mode sends the rest to the tool-calling agent. CHAT_MODE=direct|agent forces a path.
+    Answers are cached per question until the index changes (see get_answer_cache).
+    Each question is timed as "chat.request", with the path it took as "chat.direct" or "chat.agent".
+    """
+    with metrics.timer("chat.request"):
+        return _handle_chat(user_input)
+
+
+def _handle_chat(user_input):
+    metrics.count("chat.requests")
+    request = _Request(user_input)
+    cached = request.cached()
+    if cached is not None:
+        return cached
+
+    with request.answering() as route:
+        if route == "direct":
+            with metrics.timer("chat.direct"):
+                response = answer_direct(user_input, get_vectorstore(), model, get_lexical_index())
+        else:
+            # The modern agent expects a dictionary with a list of messages
+            inputs = {"messages": [("user", user_input)]}
+            agent = request.get_agent()
+            with metrics.timer("chat.agent"):
+                result = agent.invoke(inputs)
+            response = _build_response(result)
+
+    request.store(response)
+    return response
+
+
+async def _call_cache(cache, method, *args):
+    # Similarity lookups embed the question with a blocking API call; keep those off the event loop
+    if cache.similarity_threshold is None:
+        return method(*args)
+    return await asyncio.to_thread(method, *args)
+
+
+async def handle_chat_async(user_input, agent=None):
+    """
+    Async counterpart of handle_chat built on the agent's ainvoke, so one event loop can
+    serve many conversations at once. Passing an agent (e.g. a fakes.FakeAgent) always uses
+    the agent path; otherwise questions are routed as in handle_chat.
+    """
+    with metrics.timer("chat.request"):
+        return await _handle_chat_async(user_input, agent)
+
+
+async def _handle_chat_async(user_input, agent):
+    metrics.count("chat.requests")
+    request = _Request(user_input, agent)
+    cached = await request.cached_async()
+    if cached is not None:
+        return cached
+
+    with request.answering() as route:
+        if route == "direct":
+            with metrics.timer("chat.direct"):
+                response = await answer_direct_async(user_input, get_vectorstore(), model, get_lexical_index())
+        else:
+            inputs = {"messages": [("user", user_input)]}
+            agent = request.get_agent()
+            with metrics.timer("chat.agent"):
+                result = await agent.ainvoke(inputs)
+            response = _build_response(result)
+
+    await request.store_async(response)
+    return response
+
+
+def agent_events(message):
+    """Translate one message streamed by the agent (stream_mode="messages") into chat events."""
+    if getattr(message, "type", None) == "tool":
+        artifact = getattr(message, "artifact", None)
+        sources = chunk_sources(artifact) if isinstance(artifact, list) else [f"Retrieved from: {message.name}"]
+        return [{"type": "tool", "name": message.name, "sources": sources}]
+    events = [
+        {"type": "tool_call", "name": chunk["name"]}
+        for chunk in getattr(message, "tool_call_chunks", None) or [] if chunk.get("name")
+    ]
+    if isinstance(message.content, str) and message.content:
+        events.append({"type": "token", "text": message.content})
+    return events
+
+
+class _StreamState:
+    """
+    Accumulates the answer, sources and time to first token from a stream of chat events;
+    the finished stream is recorded as "chat.stream" with its "chat.ttft".
+    """
+
+    def __init__(self):
+        metrics.count("chat.requests")
+        self.start = time.perf_counter()
+        self.ttft = None
+        self.answer = ""
+        self.sources = []
+
+    def update(self, event):
+        if event["type"] == "token":
+            if self.ttft is None:
+                self.ttft = time.perf_counter() - self.start
+            self.answer += event["text"]
+        elif event["type"] == "tool":
+            # Text streamed before a tool call is the agent thinking aloud, not the answer
+            self.answer = ""
+        self.sources += [source for source in event.get("sources", []) if source not in self.sources]
+        return event
+
+    def response(self):
+        return {"answer": self.answer, "sources": self.sources}
+
+    def done(self, response):
+        latency = time.perf_counter() - self.start
+        metrics.observe("chat.stream", latency)
+        metrics.observe("chat.ttft", self.ttft or latency)
+        return dict(response, type="done", ttft=round(self.ttft or 0.0, 4), latency=round(latency, 4))
+
+
+def stream_chat(user_input):
+    """
+    Streaming variant of handle_chat. Yields event dicts as they arrive:
+    {"type": "retrieval" | "tool", "sources": [...]} when chunks are retrieved,
+    {"type": "tool_call", "name": ...} when the agent decides to search,
+    {"type": "token", "text": ...} for each piece of the answer, and finally
+    {"type": "done", "answer": ..., "sources": [...], "ttft": seconds, "latency": seconds}.
+    """
+    state = _StreamState()
+    request = _Request(user_input)
+    cached = request.cached()
+    if cached is not None:
+        yield state.update({"type": "token", "text": cached["answer"]})
+        yield state.done(cached)
+        return
+
+    with request.answering() as route:
+        if route == "direct":
+            events = stream_direct(user_input, get_vectorstore(), model, get_lexical_index())
+        else:
+            inputs = {"messages": [("user", user_input)]}
+            events = (
+                event for message, _ in request.get_agent().stream(inputs, stream_mode="messages")
+                for event in agent_events(message)
+            )
+        for event in events:
+            yield state.update(event)
+
+    response = state.response()
+    request.store(response)
+    yield state.done(response)
+
+
+async def stream_chat_async(user_input, agent=None):
+    """Async iterator counterpart of stream_chat; agent is handled as in handle_chat_async."""
+    state = _StreamState()
+    request = _Request(user_input, agent)
+    cached = await request.cached_async()
+    if cached is not None:
+        yield state.update({"type": "token", "text": cached["answer"]})
+        yield state.done(cached)
+        return
+
+    with request.answering() as route:
+        if route == "direct":
+            async for event in astream_direct(user_input, get_vectorstore(), model, get_lexical_index()):
+                yield state.update(event)
+        else:
+            inputs = {"messages": [("user", user_input)]}
+            async for message, _ in request.get_agent().astream(inputs, stream_mode="messages"):
+                for event in agent_events(message):
+                    yield state.update(event)
+
+    response = state.response()
+    await request.store_async(response)
+    yield state.done(response)
+
+
 if __name__ == "__main__":
     print("--- Unified LangChain Agent Active ---")
     print("\nWelcome to your Smart Agent Personal Assistant.")
@@ -57,10 +327,15 @@ if __name__ == "__main__":
             break
 
         try:
-            res = handle_chat(q)
-            print(f"\nAgent: {res['answer']}")
-            if res["sources"]:
-                print(f"Sources: {res['sources']}")
+            print("\nAgent: ", end="", flush=True)
+            for event in stream_chat(q):
+                if event["type"] == "token":
+                    print(event["text"], end="", flush=True)
+                elif event["type"] == "done":
+                    print()
+                    if event["sources"]:
+                        print(f"Sources: {event['sources']}")
+                    print(f"(first token after {event['ttft']:.2f}s, answered in {event['latency']:.2f}s)")
         except Exception as e:
             print(f"\nError: {e}")
             import traceback
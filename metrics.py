@@ -0,0 +1,271 @@
+import os
+import re
+import json
+import time
+import threading
+import contextlib
+from langchain_core.embeddings import Embeddings
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Set METRICS=0 to turn instrumentation off; timers and counters then cost one attribute check
+METRICS_ENV = "METRICS"
+INGEST_METRICS_FILE = "./db/ingest_metrics.jsonl"
+PROMETHEUS_NAMESPACE = "rag"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def metrics_enabled():
+    return os.getenv(METRICS_ENV, "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+class _NullTimer:
+    """Shared do-nothing timer handed out while metrics are disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """
+    Process-wide registry of per-stage timers (calls, total and slowest seconds) and counters.
+    Names are dotted, with the pipeline first ("ingest.embed", "chat.retrieval"). Thread-safe;
+    a disabled registry records nothing and its timers are a shared no-op.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._timers = {}
+        self._counters = {}
+
+    def timer(self, name):
+        """Context manager that adds the time spent inside it to stage `name`."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self._timers.get(name)
+            if stats is None:
+                self._timers[name] = [1, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                stats[2] = max(stats[2], seconds)
+
+    def count(self, name, value=1):
+        if not self.enabled or not value:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def seconds(self, name):
+        """Total seconds recorded for a stage so far."""
+        with self._lock:
+            stats = self._timers.get(name)
+            return stats[1] if stats else 0.0
+
+    def snapshot(self, prefix=""):
+        """{"stages": {name: {"calls", "seconds", "max_seconds"}}, "counters": {name: value}} for names under prefix."""
+        with self._lock:
+            return {
+                "stages": {
+                    name: {"calls": calls, "seconds": round(total, 6), "max_seconds": round(slowest, 6)}
+                    for name, (calls, total, slowest) in sorted(self._timers.items()) if name.startswith(prefix)
+                },
+                "counters": {name: value for name, value in sorted(self._counters.items()) if name.startswith(prefix)},
+            }
+
+    def merge(self, snapshot):
+        """Add a snapshot taken elsewhere (e.g. in a worker process) to this registry."""
+        if not self.enabled:
+            return
+        with self._lock:
+            for name, stats in snapshot["stages"].items():
+                mine = self._timers.setdefault(name, [0, 0.0, 0.0])
+                mine[0] += stats["calls"]
+                mine[1] += stats["seconds"]
+                mine[2] = max(mine[2], stats["max_seconds"])
+            for name, value in snapshot["counters"].items():
+                self._counters[name] = self._counters.get(name, 0) + value
+
+    def reset(self, prefix=""):
+        with self._lock:
+            for table in (self._timers, self._counters):
+                for name in [name for name in table if name.startswith(prefix)]:
+                    del table[name]
+
+    def prometheus(self, gauges=None, namespace=PROMETHEUS_NAMESPACE):
+        """
+        The registry in the Prometheus text exposition format: stage timers as one summary
+        labelled by stage (plus a max gauge), each counter as <namespace>_<name>_total, and
+        `gauges` ({name: value}) as point-in-time gauges.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        if snapshot["stages"]:
+            metric = f"{namespace}_stage_seconds"
+            lines += [f"# HELP {metric} Time spent per pipeline stage.", f"# TYPE {metric} summary"]
+            for name, stats in snapshot["stages"].items():
+                lines.append(f'{metric}_count{{stage="{name}"}} {stats["calls"]}')
+                lines.append(f'{metric}_sum{{stage="{name}"}} {stats["seconds"]}')
+            lines += [f"# HELP {metric}_max Slowest call per pipeline stage.", f"# TYPE {metric}_max gauge"]
+            lines += [f'{metric}_max{{stage="{name}"}} {stats["max_seconds"]}' for name, stats in snapshot["stages"].items()]
+        for name, value in snapshot["counters"].items():
+            metric = f"{namespace}_{_metric_name(name)}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, value in (gauges or {}).items():
+            metric = f"{namespace}_{_metric_name(name)}"
+            lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+def _metric_name(name):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+registry = Metrics(enabled=metrics_enabled())
+
+
+def timer(name):
+    return registry.timer(name)
+
+
+def observe(name, seconds):
+    registry.observe(name, seconds)
+
+
+def count(name, value=1):
+    registry.count(name, value)
+
+
+def timed(iterable, name):
+    """Yield from iterable, adding the time spent producing each item to stage `name`."""
+    if not registry.enabled:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            registry.observe(name, time.perf_counter() - start)
+            return
+        registry.observe(name, time.perf_counter() - start)
+        yield item
+
+
+@contextlib.contextmanager
+def capture():
+    """
+    Record into a fresh registry for the duration of the block and yield it, so work done in
+    a worker process can be sent back and merged into the parent's registry.
+    """
+    global registry
+    parent = registry
+    registry = Metrics(enabled=parent.enabled)
+    try:
+        yield registry
+    finally:
+        registry = parent
+
+
+def write_summary(summary, path=INGEST_METRICS_FILE):
+    """Append one run summary as a line of JSON."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(summary) + "\n")
+
+
+class TimedEmbeddings(Embeddings):
+    """Embeddings wrapper that times document embedding as one stage and counts the texts embedded."""
+
+    def __init__(self, underlying, stage):
+        self.underlying = underlying
+        self.stage = stage
+
+    def embed_documents(self, texts):
+        with registry.timer(self.stage):
+            vectors = self.underlying.embed_documents(texts)
+        registry.count(f"{self.stage}.texts", len(texts))
+        return vectors
+
+    def embed_query(self, text):
+        return self.underlying.embed_query(text)
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """
+    LangChain callback that times every chat model call as "<prefix>.llm" and counts the
+    prompt and completion tokens the model reports.
+    """
+
+    run_inline = True
+
+    def __init__(self, prefix="chat"):
+        self.prefix = prefix
+        self._starts = {}
+
+    def _start(self, run_id):
+        self._starts[run_id] = time.perf_counter()
+
+    def _stop(self, run_id, stage):
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            registry.observe(f"{self.prefix}.{stage}", time.perf_counter() - start)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._stop(run_id, "llm")
+        usage = {}
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or usage
+        if not usage:
+            token_usage = (response.llm_output or {}).get("token_usage") or {}
+            usage = {"input_tokens": token_usage.get("prompt_tokens", 0),
+                     "output_tokens": token_usage.get("completion_tokens", 0)}
+        registry.count(f"{self.prefix}.prompt_tokens", usage.get("input_tokens", 0))
+        registry.count(f"{self.prefix}.completion_tokens", usage.get("output_tokens", 0))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._stop(run_id, "llm")
+        registry.count(f"{self.prefix}.llm_errors")
+
+
+def chat_callbacks():
+    """Callbacks for the chat model: an LLMMetricsHandler, or none while metrics are disabled."""
+    return [LLMMetricsHandler()] if registry.enabled else []
@@ -0,0 +1,113 @@
+import os
+import re
+import asyncio
+from retrieval import retrieve, retrieval_settings
+from ingest import manifest_key
+
+CHAT_MODES = ("auto", "direct", "agent")
+
+RAG_SYSTEM_PROMPT = (
+    "You are a personal assistant answering questions about the user's own documents. "
+    "Answer using only the context below. If the context does not contain the answer, "
+    "say that you could not find it in the documents.\n\nContext:\n{context}"
+)
+
+# Small talk and requests about the assistant itself: the agent answers these without retrieving
+_CONVERSATIONAL = re.compile(
+    r"^\s*(hi|hello|hey|thanks|thank you|good (morning|afternoon|evening)|bye|goodbye|"
+    r"who are you|what can you do|how are you)\b",
+    re.IGNORECASE
+)
+# Questions that usually need several searches (comparisons, multi-part asks)
+_MULTI_STEP = re.compile(
+    r"\b(compare|comparison|versus|vs\.?|difference between|differences between|both|each of)\b",
+    re.IGNORECASE
+)
+
+
+def route_question(question):
+    """
+    Cheap rule-based router: "direct" for a plain document question (retrieve once, one LLM call)
+    and "agent" for small talk or multi-step questions that benefit from the tool-calling loop.
+    """
+    if _CONVERSATIONAL.match(question) or _MULTI_STEP.search(question) or question.count("?") > 1:
+        return "agent"
+    return "direct"
+
+
+def chat_mode(question, mode=None):
+    """Resolve CHAT_MODE (auto, direct or agent; default auto) to the path a question takes."""
+    mode = mode or os.getenv("CHAT_MODE", "auto")
+    if mode not in CHAT_MODES:
+        raise ValueError(f"CHAT_MODE must be one of {', '.join(CHAT_MODES)}, got {mode!r}")
+    return route_question(question) if mode == "auto" else mode
+
+
+def source_name(source):
+    """
+    How a chunk's source file is shown: its path under SOURCE_DIR (see ingest.manifest_key), so
+    data/report.pdf and data/sub/report.pdf stay apart. Files from elsewhere keep their base name.
+    """
+    name = manifest_key(source)
+    return os.path.basename(source) if name.startswith("../") else name
+
+
+def chunk_sources(docs):
+    """Unique source files of the retrieved chunks (see source_name), most relevant first."""
+    sources = []
+    for doc in docs:
+        source = doc.metadata.get("source")
+        if source:
+            name = source_name(source)
+            if name not in sources:
+                sources.append(name)
+    return sources
+
+
+def format_context(docs):
+    return "\n\n---\n\n".join(
+        f"[{source_name(doc.metadata.get('source', 'unknown'))}]\n{doc.page_content}" for doc in docs
+    )
+
+
+def rag_messages(question, docs):
+    return [("system", RAG_SYSTEM_PROMPT.format(context=format_context(docs))), ("user", question)]
+
+
+def answer_direct(question, vectorstore, model, lexical_index=None):
+    """Run the retrieval stage once and answer with a single LLM call."""
+    docs = retrieve(vectorstore, question, lexical_index=lexical_index, **retrieval_settings())
+    message = model.invoke(rag_messages(question, docs))
+    return {"answer": message.content, "sources": chunk_sources(docs)}
+
+
+async def answer_direct_async(question, vectorstore, model, lexical_index=None):
+    # Embedding the query and searching the index both block; run them off the event loop
+    docs = await asyncio.to_thread(
+        retrieve, vectorstore, question, lexical_index=lexical_index, **retrieval_settings()
+    )
+    message = await model.ainvoke(rag_messages(question, docs))
+    return {"answer": message.content, "sources": chunk_sources(docs)}
+
+
+def _text(chunk):
+    return chunk.content if isinstance(chunk.content, str) else ""
+
+
+def stream_direct(question, vectorstore, model, lexical_index=None):
+    """Direct path as events: one "retrieval" event with the chunk sources, then "token" events."""
+    docs = retrieve(vectorstore, question, lexical_index=lexical_index, **retrieval_settings())
+    yield {"type": "retrieval", "sources": chunk_sources(docs)}
+    for chunk in model.stream(rag_messages(question, docs)):
+        if _text(chunk):
+            yield {"type": "token", "text": _text(chunk)}
+
+
+async def astream_direct(question, vectorstore, model, lexical_index=None):
+    docs = await asyncio.to_thread(
+        retrieve, vectorstore, question, lexical_index=lexical_index, **retrieval_settings()
+    )
+    yield {"type": "retrieval", "sources": chunk_sources(docs)}
+    async for chunk in model.astream(rag_messages(question, docs)):
+        if _text(chunk):
+            yield {"type": "token", "text": _text(chunk)}
@@ -0,0 +1,322 @@
+import os
+import numpy as np
+import metrics
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from shards import ShardedIndex, select_shards
+
+RETRIEVAL_MODES = ("hybrid", "vector", "lexical")
+RETRIEVAL_K = 4
+# Candidates fetched from the index before MMR picks the final k
+FETCH_K = 20
+# 1.0 ranks purely by relevance, 0.0 purely by diversity
+MMR_LAMBDA = 0.5
+# Minimum cosine similarity between query and chunk; None keeps every candidate
+SCORE_THRESHOLD = None
+CONTEXT_TOKEN_BUDGET = 2000
+TOKEN_ENCODING = "o200k_base"
+# Chunks of the same page whose character ranges are at most this far apart are merged
+MERGE_GAP = 2
+# Rank offset of reciprocal rank fusion; 60 is the value from the original RRF paper
+RRF_K = 60
+
+_encoding = None
+_encoding_loaded = False
+
+
+def retrieval_settings():
+    """Retrieval parameters, overridable with RETRIEVAL_MODE, RETRIEVAL_K, RETRIEVAL_FETCH_K,
+    RETRIEVAL_MMR_LAMBDA, RETRIEVAL_SCORE_THRESHOLD and RETRIEVAL_TOKEN_BUDGET."""
+    threshold = os.getenv("RETRIEVAL_SCORE_THRESHOLD")
+    return {
+        "mode": os.getenv("RETRIEVAL_MODE", "hybrid"),
+        "k": int(os.getenv("RETRIEVAL_K", RETRIEVAL_K)),
+        "fetch_k": int(os.getenv("RETRIEVAL_FETCH_K", FETCH_K)),
+        "lambda_mult": float(os.getenv("RETRIEVAL_MMR_LAMBDA", MMR_LAMBDA)),
+        "score_threshold": float(threshold) if threshold else SCORE_THRESHOLD,
+        "token_budget": int(os.getenv("RETRIEVAL_TOKEN_BUDGET", CONTEXT_TOKEN_BUDGET)),
+    }
+
+
+def count_tokens(text):
+    """Token count with tiktoken when its encoding is available, else about four characters per token."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+        except Exception:
+            _encoding = None
+    if _encoding is None:
+        return (len(text) + 3) // 4
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def _unit(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def candidate_vectors(index, labels):
+    """
+    Stored vectors for the candidate labels, or None if the index cannot reconstruct them.
+    IVF indexes can once tools.load_vectorstore has built their direct map (see index_factory.enable_reconstruct).
+    """
+    try:
+        return index.reconstruct_batch(labels)
+    except RuntimeError:
+        return None
+
+
+def mmr(query, candidates, k, lambda_mult=MMR_LAMBDA):
+    """
+    Maximal marginal relevance over unit vectors, vectorized over all candidates per step.
+    Returns the positions of the chosen candidates in selection order.
+    """
+    relevance = candidates @ query
+    similarity = candidates @ candidates.T
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarity[selected[0]].copy()
+    chosen = np.zeros(len(candidates), dtype=bool)
+    chosen[selected[0]] = True
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[chosen] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        chosen[best] = True
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+    return selected
+
+
+def search_candidates(vectorstore, query_vector, fetch_k=FETCH_K, score_threshold=SCORE_THRESHOLD):
+    """
+    Nearest chunks to a query vector with their cosine similarity.
+    Returns (docstore IDs, docs, cosine scores, unit vectors or None), most similar first.
+    """
+    distances, labels = vectorstore.index.search(query_vector.reshape(1, -1), fetch_k)
+    found = labels[0] >= 0
+    labels, distances = labels[0][found], distances[0][found]
+    if not len(labels):
+        return [], [], np.empty(0), None
+
+    vectors = candidate_vectors(vectorstore.index, labels)
+    if vectors is not None:
+        vectors = _unit(np.asarray(vectors, dtype=np.float32))
+        scores = vectors @ _unit(query_vector)
+    else:
+        # Squared L2 distance between unit vectors: |a - b|^2 = 2 - 2 cos
+        scores = 1.0 - distances / 2.0
+    keep = scores >= score_threshold if score_threshold is not None else np.ones(len(labels), dtype=bool)
+
+    ids, docs = [], []
+    for label in labels[keep]:
+        doc_id = vectorstore.index_to_docstore_id[int(label)]
+        doc = vectorstore.docstore.search(doc_id)
+        if isinstance(doc, Document):
+            ids.append(doc_id)
+            docs.append(doc)
+    if len(docs) != int(keep.sum()):
+        # A chunk missing from the docstore; fall back to plain ranking for the ones found
+        return ids, docs, scores[keep][:len(docs)], None
+    return ids, docs, scores[keep], vectors[keep] if vectors is not None else None
+
+
+def _top(parts, limit):
+    """Merge per-shard (IDs, docs, scores, vectors or None) candidate lists into the best `limit`."""
+    ids = [doc_id for part in parts for doc_id in part[0]]
+    docs = [doc for part in parts for doc in part[1]]
+    scores = np.concatenate([np.asarray(part[2], dtype=np.float32) for part in parts]) if parts else np.empty(0)
+    order = np.argsort(-scores, kind="stable")[:limit]
+    vectors = None
+    if ids and all(part[3] is not None for part in parts if part[0]):
+        vectors = np.concatenate([part[3] for part in parts if part[0]])[order]
+    return [ids[i] for i in order], [docs[i] for i in order], scores[order], vectors
+
+
+def vector_ranking(fan_out, embeddings, query, k, fetch_k, lambda_mult, score_threshold):
+    """
+    Dense ranking: the query is embedded once, each shard returns its fetch_k nearest chunks,
+    and MMR picks k from the best fetch_k overall. Returns (IDs, docs).
+    """
+    with metrics.timer("chat.embed_query"):
+        query_vector = np.asarray(embeddings.embed_query(query), dtype=np.float32)
+    fetch = max(fetch_k, k)
+    with metrics.timer("chat.vector_search"):
+        ids, docs, _, vectors = _top(
+            fan_out(lambda vectorstore, _: search_candidates(vectorstore, query_vector, fetch, score_threshold)), fetch
+        )
+    if vectors is not None and len(docs) > k:
+        order = mmr(_unit(query_vector), vectors, k, lambda_mult)
+        return [ids[i] for i in order], [docs[i] for i in order]
+    return ids[:k], docs[:k]
+
+
+def lexical_candidates(vectorstore, lexical_index, query, k):
+    """BM25 top k of one index as (IDs, docs, scores, None); empty without a lexical index."""
+    ids, docs, scores = [], [], []
+    if lexical_index is None:
+        return ids, docs, scores, None
+    for doc_id, score in lexical_index.search(query, k):
+        doc = vectorstore.docstore.search(doc_id)
+        if isinstance(doc, Document):
+            ids.append(doc_id)
+            docs.append(doc)
+            scores.append(score)
+    return ids, docs, scores, None
+
+
+def lexical_ranking(fan_out, query, k):
+    """BM25 ranking over every shard's lexical index; no embedding call. Returns (IDs, docs)."""
+    with metrics.timer("chat.lexical_search"):
+        ids, docs, _, _ = _top(fan_out(lambda vectorstore, lexical_index: lexical_candidates(
+            vectorstore, lexical_index, query, k)), k)
+    return ids, docs
+
+
+def reciprocal_rank_fusion(rankings, k):
+    """Fuse several (IDs, docs) rankings by summing 1 / (RRF_K + rank); returns the top-k docs."""
+    scores = {}
+    docs = {}
+    for ids, ranked_docs in rankings:
+        for rank, (doc_id, doc) in enumerate(zip(ids, ranked_docs), start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (RRF_K + rank)
+            docs.setdefault(doc_id, doc)
+    # sorted() is stable, so ties keep the order of the first ranking
+    return [docs[doc_id] for doc_id in sorted(scores, key=lambda doc_id: -scores[doc_id])[:k]]
+
+
+def merge_adjacent(docs):
+    """
+    Merge chunks that are neighbours in the same loaded page/element (using the splitter's
+    start_index), removing the overlap between them. The merged chunk takes the rank of its best
+    member. Chunks are only merged within the "part" ingest records (or the "page" of indexes
+    built before it): Unstructured elements have no page, and each restarts start_index at 0.
+    """
+    groups = {}
+    order = []
+    for rank, doc in enumerate(docs):
+        start = doc.metadata.get("start_index")
+        part = doc.metadata.get("part", doc.metadata.get("page"))
+        if start is None or start < 0 or part is None:
+            order.append((rank, doc))
+            continue
+        groups.setdefault((doc.metadata.get("source"), part), []).append((start, rank, doc))
+
+    for members in groups.values():
+        members.sort(key=lambda member: member[0])
+        start, rank, doc = members[0]
+        text, end = doc.page_content, start + len(doc.page_content)
+        for next_start, next_rank, next_doc in members[1:]:
+            if next_start <= end + MERGE_GAP:
+                overlap = max(end - next_start, 0)
+                separator = "" if next_start <= end else "\n"
+                text += separator + next_doc.page_content[overlap:]
+                end = max(end, next_start + len(next_doc.page_content))
+                rank = min(rank, next_rank)
+            else:
+                order.append((rank, Document(page_content=text, metadata=dict(doc.metadata, start_index=start))))
+                start, rank, doc = next_start, next_rank, next_doc
+                text, end = doc.page_content, start + len(doc.page_content)
+        order.append((rank, Document(page_content=text, metadata=dict(doc.metadata, start_index=start))))
+
+    return [doc for _, doc in sorted(order, key=lambda item: item[0])]
+
+
+def pack_context(docs, token_budget=CONTEXT_TOKEN_BUDGET, count=count_tokens):
+    """
+    Keep docs in rank order while they fit in token_budget, skipping any that would overflow it.
+    If even the best doc does not fit, it is truncated so the model always gets some context.
+    """
+    packed = []
+    used = 0
+    for doc in docs:
+        tokens = count(doc.page_content)
+        if used + tokens <= token_budget:
+            packed.append(doc)
+            used += tokens
+    if not packed and docs:
+        best = docs[0]
+        ratio = token_budget / max(count(best.page_content), 1)
+        packed.append(Document(page_content=best.page_content[:int(len(best.page_content) * ratio)],
+                               metadata=best.metadata))
+    return packed
+
+
+def retrieve(vectorstore, query, k=RETRIEVAL_K, fetch_k=FETCH_K, lambda_mult=MMR_LAMBDA,
+             score_threshold=SCORE_THRESHOLD, token_budget=CONTEXT_TOKEN_BUDGET, mode="vector",
+             lexical_index=None):
+    """
+    Retrieval stage shared by the direct path and the retriever tool.
+    The dense ranking fetches fetch_k candidates, drops those under score_threshold and picks k
+    with MMR; the lexical ranking takes the BM25 top k. mode "hybrid" fuses both with reciprocal
+    rank fusion (falling back to "vector" without a lexical index), "vector" and "lexical" use one.
+    A ShardedIndex is searched on the shards the query selects, in parallel, with the
+    per-shard results merged before MMR and fusion; when those shards return nothing, every
+    shard is searched.
+    The chosen chunks are merged with their neighbours and packed into token_budget.
+    Timed as the "chat.retrieval" stage (see metrics).
+    """
+    with metrics.timer("chat.retrieval"):
+        docs = _retrieve(vectorstore, query, k, fetch_k, lambda_mult, score_threshold, token_budget, mode, lexical_index)
+    metrics.count("chat.retrieved_chunks", len(docs))
+    return docs
+
+
+def _retrieve(vectorstore, query, k, fetch_k, lambda_mult, score_threshold, token_budget, mode, lexical_index):
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"RETRIEVAL_MODE must be one of {', '.join(RETRIEVAL_MODES)}, got {mode!r}")
+    if isinstance(vectorstore, ShardedIndex):
+        names = select_shards(query, vectorstore.names)
+        docs = _rank_shards(vectorstore, names, query, k, fetch_k, lambda_mult, score_threshold, mode)
+        if not docs and len(names) < len(vectorstore.names):
+            # The collection the question named has nothing on it; the others may
+            docs = _rank_shards(vectorstore, vectorstore.names, query, k, fetch_k, lambda_mult, score_threshold, mode)
+    else:
+        def fan_out(fn):
+            return [fn(vectorstore, lexical_index)]
+
+        docs = _rank(fan_out, lexical_index is not None, vectorstore.embeddings, query, k, fetch_k, lambda_mult,
+                     score_threshold, mode)
+    if not docs:
+        return []
+    return pack_context(merge_adjacent(docs), token_budget)
+
+
+def _rank_shards(vectorstore, names, query, k, fetch_k, lambda_mult, score_threshold, mode):
+    def fan_out(fn):
+        return vectorstore.map(fn, names)
+
+    return _rank(fan_out, vectorstore.has_lexical(names), vectorstore.embeddings, query, k, fetch_k, lambda_mult,
+                 score_threshold, mode)
+
+
+def _rank(fan_out, has_lexical, embeddings, query, k, fetch_k, lambda_mult, score_threshold, mode):
+    if not has_lexical:
+        if mode == "lexical":
+            raise FileNotFoundError("Lexical retrieval needs the BM25 index; run ingest.py to build it.")
+        mode = "vector"
+
+    settings = (k, fetch_k, lambda_mult, score_threshold)
+    if mode == "vector":
+        _, docs = vector_ranking(fan_out, embeddings, query, *settings)
+    elif mode == "lexical":
+        _, docs = lexical_ranking(fan_out, query, k)
+    else:
+        docs = reciprocal_rank_fusion([
+            vector_ranking(fan_out, embeddings, query, *settings),
+            lexical_ranking(fan_out, query, k),
+        ], k)
+    return docs
+
+
+class PackedRetriever(BaseRetriever):
+    """LangChain retriever around retrieve(), used by the agent's search tool."""
+
+    vectorstore: object
+    settings: dict
+    lexical_index: object = None
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return retrieve(self.vectorstore, query, lexical_index=self.lexical_index, **self.settings)
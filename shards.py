@@ -0,0 +1,148 @@
+import os
+import re
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from docstore import close_docstore
+from lexical_index import LEXICAL_INDEX_FILE
+from index_versions import resolve_index
+
+SHARDS_PATH = "./db/shards"
+CATALOG_FILE = "catalog.json"
+# Manifest of the sharded layout, kept apart from the single-index processed_files.json
+SHARD_MANIFEST_FILE = "manifest.json"
+SHARD_MODES = ("dir", "type")
+ROOT_COLLECTION = "root"
+COLLECTION_TYPES = {
+    ".pdf": "pdf",
+    ".docx": "documents", ".doc": "documents",
+    ".xlsx": "spreadsheets", ".xls": "spreadsheets",
+    ".pptx": "slides", ".ppt": "slides",
+}
+SHARD_SEARCH_WORKERS = 4
+# Words that name a file type collection in a question, besides the collection's own name.
+# Only unambiguous ones: "documents", "files" and the like say nothing about the file type.
+COLLECTION_ALIASES = {
+    "documents": ("docx",),
+    "spreadsheets": ("excel", "xlsx", "workbook"),
+    "slides": ("deck", "powerpoint", "pptx", "presentation"),
+}
+GENERIC_WORDS = {"document", "doc", "file", "folder", "data", ROOT_COLLECTION}
+
+
+def collection_of(key, shard_by):
+    """
+    Collection of a file given its manifest key (path relative to SOURCE_DIR, "/"-separated):
+    its top-level subdirectory for shard_by="dir" (ROOT_COLLECTION for files directly in
+    SOURCE_DIR), or its file type group for shard_by="type".
+    """
+    if shard_by == "dir":
+        head, sep, _ = key.partition("/")
+        return head if sep else ROOT_COLLECTION
+    return COLLECTION_TYPES.get(os.path.splitext(key)[1].lower(), "other")
+
+
+def shard_folder(name, root=SHARDS_PATH):
+    return os.path.join(root, name)
+
+
+def shard_manifest_path(root=SHARDS_PATH):
+    return os.path.join(root, SHARD_MANIFEST_FILE)
+
+
+def load_catalog(root=SHARDS_PATH):
+    """The catalog of a sharded layout, or None if root holds no shards."""
+    try:
+        with open(os.path.join(root, CATALOG_FILE), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_catalog(catalog, root=SHARDS_PATH):
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, CATALOG_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(catalog, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def _singular(word):
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def select_shards(question, names):
+    """
+    Shards a question is about: those it names explicitly (e.g. "in my slides", "the
+    spreadsheets", "my pdfs", a folder name), or every shard when it names none. Generic words
+    (see GENERIC_WORDS) never narrow the search, even when a shard is called after one.
+    RETRIEVAL_SHARDS (comma-separated) overrides the choice.
+    """
+    forced = [name.strip() for name in os.getenv("RETRIEVAL_SHARDS", "").split(",") if name.strip()]
+    if forced:
+        return [name for name in names if name in forced]
+    words = {_singular(word) for word in re.findall(r"[a-z0-9_-]+", question.lower())} - GENERIC_WORDS
+    mentioned = [
+        name for name in names
+        if words & {_singular(term) for term in (name.lower(), *COLLECTION_ALIASES.get(name, ()))}
+    ]
+    return mentioned or list(names)
+
+
+class ShardedIndex:
+    """
+    The shards listed in a catalog, searched together. Each shard is loaded with `load_shard(folder)`
+    the first time a question selects it, so questions about one collection never load the others.
+    All shards share one embeddings object (`embedding_function`), so a query is embedded once.
+    """
+
+    def __init__(self, catalog, load_shard, embeddings, root=SHARDS_PATH, workers=SHARD_SEARCH_WORKERS):
+        self.catalog = catalog
+        self.root = root
+        self.embedding_function = embeddings
+        self._load_shard = load_shard
+        self._shards = {}
+        self._locks = {name: threading.Lock() for name in catalog["shards"]}
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shard")
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    @property
+    def names(self):
+        return sorted(self.catalog["shards"])
+
+    def loaded(self):
+        return sorted(self._shards)
+
+    def shard(self, name):
+        """(vectorstore, lexical index or None) for one shard, loading it on first use."""
+        if name not in self._shards:
+            with self._locks[name]:
+                if name not in self._shards:
+                    folder = shard_folder(self.catalog["shards"][name]["folder"], self.root)
+                    self._shards[name] = self._load_shard(folder, self.embedding_function)
+        return self._shards[name]
+
+    def has_lexical(self, names):
+        """Whether any of the named shards has a BM25 index, without loading them."""
+        return any(
+            os.path.isfile(os.path.join(
+                resolve_index(shard_folder(self.catalog["shards"][name]["folder"], self.root)), LEXICAL_INDEX_FILE
+            ))
+            for name in names
+        )
+
+    def map(self, fn, names):
+        """Run fn(vectorstore, lexical_index) on each named shard in the thread pool, in order."""
+        if len(names) == 1:
+            return [fn(*self.shard(names[0]))]
+        return list(self._pool.map(lambda name: fn(*self.shard(name)), names))
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+        for vectorstore, lexical_index in self._shards.values():
+            close_docstore(vectorstore)
+            if lexical_index is not None:
+                lexical_index.close()
@@ -0,0 +1,93 @@
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from answer_cache import AnswerCache, normalize_question  # noqa: E402
+
+
+class FakeFingerprint:
+    """Index version the test can bump, standing in for a re-ingest."""
+
+    def __init__(self):
+        self.version = 1
+
+    def __call__(self):
+        return str(self.version)
+
+
+class TestAnswerCache(unittest.TestCase):
+
+    def test_normalize_question(self):
+        self.assertEqual(normalize_question("  What is   in my DOCS? "), "what is in my docs")
+        self.assertEqual(normalize_question("what is in my docs"), normalize_question("What is in my docs?!"))
+
+    def test_hit_after_put_returns_a_copy(self):
+        cache = AnswerCache(fingerprint=FakeFingerprint())
+        self.assertIsNone(cache.get("Hello?"))
+        cache.put("Hello?", {"answer": "Hi", "sources": []})
+
+        result = cache.get("hello")
+        self.assertEqual(result, {"answer": "Hi", "sources": []})
+        result["sources"].append("mutated")
+        self.assertEqual(cache.get("hello")["sources"], [])
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_new_index_invalidates_everything(self):
+        fingerprint = FakeFingerprint()
+        cache = AnswerCache(fingerprint=fingerprint)
+        cache.put("q", {"answer": "old"})
+        fingerprint.version += 1
+        self.assertIsNone(cache.get("q"))
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_eviction(self):
+        cache = AnswerCache(max_entries=2, fingerprint=FakeFingerprint())
+        cache.put("a", {"answer": "a"})
+        cache.put("b", {"answer": "b"})
+        cache.get("a")
+        cache.put("c", {"answer": "c"})
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+
+    def test_similarity_mode_matches_near_duplicates(self):
+        vectors = {
+            "what are my job leads": [1.0, 0.0, 0.1],
+            "what are my current job leads": [0.98, 0.0, 0.15],
+            "summarize the invoice": [0.0, 1.0, 0.0],
+        }
+        calls = []
+
+        def embed(text):
+            calls.append(text)
+            return vectors[text]
+
+        cache = AnswerCache(similarity_threshold=0.95, embed=embed, fingerprint=FakeFingerprint())
+        self.assertIsNone(cache.get("What are my job leads?"))  # nothing cached yet, no embedding needed
+        cache.put("What are my job leads?", {"answer": "Google"})
+
+        self.assertEqual(cache.get("What are my current job leads?")["answer"], "Google")
+        self.assertIsNone(cache.get("Summarize the invoice"))
+        # The miss's vector is reused when its answer is stored
+        cache.put("Summarize the invoice", {"answer": "Total $5"})
+        self.assertEqual(calls.count("summarize the invoice"), 1)
+
+    def test_similarity_mode_requires_embed(self):
+        with self.assertRaises(ValueError):
+            AnswerCache(similarity_threshold=0.9)
+
+    def test_default_fingerprint_is_the_loaded_index(self):
+        cache = AnswerCache()
+        with patch("tools._generation", 1):
+            cache.put("hello", {"answer": "hi", "sources": []})
+            self.assertIsNotNone(cache.get("hello"))
+        # A hot reload swapping in a new version bumps the generation
+        with patch("tools._generation", 2):
+            self.assertIsNone(cache.get("hello"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import io
+import os
+import sys
+import json
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+import batch  # noqa: E402
+from fakes import FakeAgent  # noqa: E402
+
+
+class ReverseLatencyAgent(FakeAgent):
+    """Earlier questions take longer, so answers finish in reverse order."""
+
+    def __init__(self, count):
+        super().__init__(latency=0)
+        self.count = count
+        self.running = 0
+        self.peak = 0
+
+    async def ainvoke(self, inputs):
+        index = int(inputs["messages"][-1][1][1:])
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.01 * (self.count - index))
+        self.running -= 1
+        return self._result(inputs)
+
+
+@patch.dict(os.environ, {"ANSWER_CACHE_SIZE": "0"})
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        main._answer_cache = None
+        self.addCleanup(setattr, main, "_answer_cache", None)
+
+    def test_results_come_back_in_input_order(self):
+        agent = ReverseLatencyAgent(10)
+        results = batch.answer_questions([f"q{i}" for i in range(10)], concurrency=4, agent=agent)
+
+        self.assertEqual([r["question"] for r in results], [f"q{i}" for i in range(10)])
+        self.assertTrue(all("latency" in r and r["sources"] for r in results))
+        self.assertEqual(agent.peak, 4)
+
+    def test_failures_are_reported_per_question(self):
+        agent = FakeAgent(latency=0)
+        answer = agent.ainvoke
+
+        async def fail_first(inputs):
+            if inputs["messages"][-1][1] == "a":
+                raise RuntimeError("boom")
+            return await answer(inputs)
+
+        with patch.object(agent, "ainvoke", side_effect=fail_first):
+            results = batch.answer_questions(["a", "b"], concurrency=1, agent=agent)
+        self.assertEqual(results[0]["error"], "boom")
+        self.assertIn("answer", results[1])
+
+    def test_load_questions_keeps_extra_fields(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "questions.jsonl")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write('"plain question"\n\n{"id": 7, "question": "with id"}\n')
+            items = batch.load_questions(path)
+        self.assertEqual(items, [{"question": "plain question"}, {"id": 7, "question": "with id"}])
+
+        out = io.StringIO()
+        with patch("sys.stderr", io.StringIO()):
+            asyncio.run(batch.write_results(items, out, agent=FakeAgent(latency=0)))
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([line.get("id") for line in lines], [None, 7])
+
+    def prefetch_vectorstore(self):
+        underlying = MagicMock()
+        underlying.embed_documents.side_effect = lambda texts: [[1.0, 0.0] for _ in texts]
+        underlying.embed_query.return_value = [0.0, 1.0]
+        vectorstore = MagicMock()
+        vectorstore.embedding_function = underlying
+        return vectorstore, underlying
+
+    def run_embedding(self, vectorstore, questions):
+        """Run a batch whose answers embed the question the way the retriever does."""
+        async def handle_chat_async(question, agent=None):
+            return {"answer": vectorstore.embedding_function.embed_query(question), "sources": []}
+        with patch("batch.get_vectorstore", return_value=vectorstore), \
+                patch("main.handle_chat_async", side_effect=handle_chat_async):
+            return batch.answer_questions(questions)
+
+    def test_query_embeddings_are_fetched_in_one_call(self):
+        vectorstore, underlying = self.prefetch_vectorstore()
+
+        results = self.run_embedding(vectorstore, ["a", "b", "c"])
+
+        self.assertEqual([result["answer"] for result in results], [[1.0, 0.0]] * 3)
+        underlying.embed_documents.assert_called_once_with(["a", "b", "c"])
+        underlying.embed_query.assert_not_called()
+        # The prefetched vectors only live as long as the batch
+        self.assertIs(vectorstore.embedding_function, underlying)
+
+    @patch.dict(os.environ, {"RETRIEVAL_MODE": "lexical"})
+    def test_lexical_retrieval_skips_the_prefetch(self):
+        vectorstore, underlying = self.prefetch_vectorstore()
+        self.run_embedding(vectorstore, ["a", "b"])
+        underlying.embed_documents.assert_not_called()
+
+    @patch.dict(os.environ, {"ANSWER_CACHE_SIZE": "8"})
+    def test_cached_questions_are_not_prefetched(self):
+        vectorstore, underlying = self.prefetch_vectorstore()
+        with patch.object(main.get_answer_cache(), "fingerprint", return_value=None):
+            main.get_answer_cache().put("a", {"answer": "cached", "sources": []})
+            self.run_embedding(vectorstore, ["a", "b"])
+        underlying.embed_documents.assert_called_once_with(["b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
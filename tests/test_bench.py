@@ -0,0 +1,77 @@
+import io
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bench  # noqa: E402
+from fakes import FakeEmbeddings  # noqa: E402
+
+
+class TestSyntheticCorpus(unittest.TestCase):
+
+    def test_corpus_is_deterministic_and_loadable(self):
+        with tempfile.TemporaryDirectory() as first, tempfile.TemporaryDirectory() as second:
+            questions = bench.make_corpus(first, documents=3, pages=2, rows=10)
+            bench.make_corpus(second, documents=3, pages=2, rows=10)
+
+            self.assertEqual(sorted(os.listdir(first)), ["docx_0001_interview.docx", "pdf_0000_invoice.pdf",
+                                                         "xlsx_0002_salary.xlsx"])
+            with open(os.path.join(first, "pdf_0000_invoice.pdf"), "rb") as a, \
+                    open(os.path.join(second, "pdf_0000_invoice.pdf"), "rb") as b:
+                self.assertEqual(a.read(), b.read())
+            pages = PyPDFLoader(os.path.join(first, "pdf_0000_invoice.pdf")).load()
+            self.assertEqual(len(pages), 2)
+            self.assertIn("Reference INVOICE-00000.", pages[0].page_content)
+            (doc,) = Docx2txtLoader(os.path.join(first, "docx_0001_interview.docx")).load()
+            self.assertIn("Reference INTERVIEW-01011.", doc.page_content)
+            self.assertEqual(len(questions), 3)
+
+    def test_fake_embeddings_are_deterministic_unit_vectors(self):
+        embeddings = FakeEmbeddings(dimension=64)
+        first, second = embeddings.embed_documents(["offer letter from acme", "offer letter from acme"])
+        self.assertEqual(first, second)
+        self.assertAlmostEqual(sum(x * x for x in first), 1.0, places=5)
+        self.assertEqual(embeddings.calls, 1)
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_small_run_reports_ingest_and_query_metrics(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as folder:
+            results = bench.run_benchmark(folder, documents=3, pages=2, rows=20, queries=4, isolate=False)
+        self.assertEqual(os.getcwd(), cwd)
+
+        ingest, query = results["ingest"], results["query"]
+        self.assertEqual(ingest["files"], 3)
+        self.assertGreater(ingest["chunks"], 0)
+        self.assertGreater(ingest["index_bytes"], 0)
+        self.assertIn("ingest.embed", ingest["stages"])
+        self.assertEqual(query["queries"], 4)
+        self.assertLessEqual(query["p50_seconds"], query["p99_seconds"])
+
+        slower = dict(results, query=dict(query, p99_seconds=query["p99_seconds"] * 2 + 1))
+        lines = bench.compare(results, slower)
+        self.assertTrue(any(line.startswith("query.p99_seconds") and "regression" in line for line in lines))
+
+    def test_peak_rss_is_optional(self):
+        # `resource` is Unix-only; without it the benchmark still runs and prints n/a
+        with patch.dict(sys.modules, {"resource": None}):
+            self.assertIsNone(bench.peak_rss_mb())
+        ingest = {"files": 1, "chunks": 1, "seconds": 1.0, "files_per_second": 1.0, "chunks_per_second": 1.0,
+                  "index_bytes": 0, "peak_rss_mb": None, "stages": {}}
+        query = {"queries": 1, "p50_seconds": 0.1, "p99_seconds": 0.1, "queries_per_second": 10.0, "peak_rss_mb": None}
+        out = io.StringIO()
+        with patch("sys.stdout", out):
+            bench.print_results({"ingest": ingest, "query": query})
+        self.assertIn("peak RSS n/a", out.getvalue())
+        self.assertFalse(any("peak_rss_mb" in line for line in bench.compare({"query": query}, {"query": query})))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import os
+import sys
+import json
+import asyncio
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from chat_server import ChatServer  # noqa: E402
+from fakes import FakeAgent  # noqa: E402
+
+
+async def request(port, method, path, payload=None):
+    """Send one HTTP request and return (status, json body)."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+    raw = await reader.read()
+    writer.close()
+    head, _, data = raw.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(data)
+
+
+@patch.dict(os.environ, {"ANSWER_CACHE_SIZE": "0"})
+class TestChatServer(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        main._answer_cache = None
+        self.addCleanup(setattr, main, "_answer_cache", None)
+
+    async def start(self, **kwargs):
+        self.server = ChatServer(**kwargs)
+        listener = await self.server.start("127.0.0.1", 0)
+        self.addAsyncCleanup(listener.wait_closed)
+        self.addCleanup(listener.close)
+        return listener.sockets[0].getsockname()[1]
+
+    async def test_chat_round_trip(self):
+        port = await self.start(agent=FakeAgent(latency=0))
+        status, body = await request(port, "POST", "/chat", {"question": "What is in my docs?"})
+
+        self.assertEqual(status, 200)
+        self.assertIn("What is in my docs?", body["answer"])
+        self.assertEqual(body["sources"], ["Retrieved from: search_personal_docs"])
+        self.assertIn("latency", body)
+
+    async def test_concurrent_questions_share_the_loop(self):
+        agent = FakeAgent(latency=0.2)
+        port = await self.start(agent=agent, max_concurrency=10)
+        start = asyncio.get_running_loop().time()
+        results = await asyncio.gather(*(request(port, "POST", "/chat", {"question": f"q{i}"}) for i in range(10)))
+
+        self.assertEqual([status for status, _ in results], [200] * 10)
+        self.assertEqual(agent.calls, 10)
+        # Ten 0.2s answers overlap instead of running back to back
+        self.assertLess(asyncio.get_running_loop().time() - start, 1.0)
+
+    async def test_bad_requests(self):
+        port = await self.start(agent=FakeAgent(latency=0))
+        self.assertEqual((await request(port, "POST", "/chat", {"q": "x"}))[0], 400)
+        self.assertEqual((await request(port, "GET", "/chat"))[0], 405)
+        self.assertEqual((await request(port, "GET", "/nope"))[0], 404)
+        status, body = await request(port, "GET", "/health")
+        self.assertEqual((status, body["status"]), (200, "ok"))
+
+    async def test_timeout_returns_504(self):
+        port = await self.start(agent=FakeAgent(latency=5), timeout=0.05)
+        status, body = await request(port, "POST", "/chat", {"question": "slow"})
+        self.assertEqual(status, 504)
+        self.assertEqual(self.server.running, 0)
+
+    async def test_backpressure_rejects_beyond_the_queue(self):
+        port = await self.start(agent=FakeAgent(latency=0.3), max_concurrency=1, max_queue=1)
+        results = await asyncio.gather(*(request(port, "POST", "/chat", {"question": f"q{i}"}) for i in range(3)))
+
+        self.assertEqual(sorted(status for status, _ in results), [200, 200, 503])
+
+    async def test_streaming_endpoint(self):
+        port = await self.start(agent=FakeAgent(latency=0))
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        body = json.dumps({"question": "Stream please"}).encode("utf-8")
+        writer.write(f"POST /chat/stream HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+        raw = await reader.read()
+        writer.close()
+
+        head, _, data = raw.partition(b"\r\n\r\n")
+        self.assertIn(b"200 OK", head)
+        events = [json.loads(line) for line in data.splitlines()]
+        self.assertEqual(events[0]["type"], "tool")
+        self.assertIn("token", [event["type"] for event in events])
+        self.assertEqual(events[-1]["type"], "done")
+        self.assertIn("Stream please", events[-1]["answer"])
+        self.assertIn("ttft", events[-1])
+
+    async def test_streaming_timeout_before_first_event(self):
+        port = await self.start(agent=FakeAgent(latency=5), timeout=0.05)
+        status, _ = await request(port, "POST", "/chat/stream", {"question": "slow"})
+        self.assertEqual(status, 504)
+        self.assertEqual(self.server.running, 0)
+
+    async def test_metrics_endpoint(self):
+        port = await self.start(agent=FakeAgent(latency=0))
+        await request(port, "POST", "/chat", {"question": "What is in my docs?"})
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nContent-Length: 0\r\n\r\n")
+        await writer.drain()
+        raw = await reader.read()
+        writer.close()
+
+        head, _, data = raw.partition(b"\r\n\r\n")
+        self.assertIn(b"200 OK", head)
+        self.assertIn(b"Content-Type: text/plain; version=0.0.4", head)
+        text = data.decode("utf-8")
+        self.assertIn('rag_stage_seconds_count{stage="chat.agent"}', text)
+        self.assertIn("rag_chat_requests_total", text)
+        self.assertIn("rag_chat_running 0", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
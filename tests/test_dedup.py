@@ -0,0 +1,110 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+from langchain_core.documents import Document
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingest  # noqa: E402
+import tools  # noqa: E402
+from dedup import DedupIndex, minhash, similarity, exact_key  # noqa: E402
+from embedding_backends import HashingEmbeddings, backend_info  # noqa: E402
+
+REPORT = (
+    "Quarterly report for the platform team. Revenue grew by twelve percent while hosting costs stayed flat. "
+    "The hiring plan adds two engineers in the second half, and the migration to the new cluster finished in May."
+)
+REVISED = REPORT.replace("twelve", "thirteen")
+OTHER = "Weekend hiking trip notes: pack water, a map, a rain jacket and snacks for the long ridge walk."
+
+
+class TestDedupIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.dedup = DedupIndex(os.path.join(self.tmp.name, "dedup.sqlite"))
+        self.addCleanup(self.dedup.close)
+
+    def test_signatures_estimate_similarity(self):
+        self.assertEqual(exact_key(REPORT), exact_key("  " + REPORT.upper() + "\n"))
+        self.assertGreater(similarity(minhash(REPORT), minhash(REVISED)), 0.8)
+        self.assertLess(similarity(minhash(REPORT), minhash(OTHER)), 0.2)
+
+    def test_exact_and_near_duplicates_map_to_the_stored_chunk(self):
+        self.assertEqual(self.dedup.check(REPORT, "a-0", "a.pdf"), "a-0")
+        self.assertEqual(self.dedup.check(REPORT.upper(), "b-0", "b.pdf"), "a-0")
+        self.assertEqual(self.dedup.check(OTHER, "b-1", "b.pdf"), "b-1")
+        self.assertEqual(self.dedup.check(REVISED, "c-0", "c.pdf"), "c-0")
+        self.dedup.threshold = 0.8
+        self.assertEqual(self.dedup.check(REPORT.replace("May", "June"), "d-0", "d.pdf"), "a-0")
+
+        self.assertEqual((self.dedup.exact, self.dedup.near), (1, 1))
+        self.assertEqual(self.dedup.sources("a-0"), ["a.pdf", "b.pdf", "d.pdf"])
+        self.assertEqual(self.dedup.shared_chunks(), 1)
+        self.assertIn("skipped 2 duplicate chunks (1 exact, 1 near)", self.dedup.report(dimension=1536))
+
+    def test_shared_chunk_is_released_by_its_last_source(self):
+        self.dedup.check(REPORT, "a-0", "a.pdf")
+        self.dedup.check(REPORT, "b-0", "b.pdf")
+
+        self.assertEqual(self.dedup.release("a.pdf", ["a-0"]), [])
+        self.assertEqual(self.dedup.release("b.pdf", ["a-0", "a-0"]), ["a-0"])
+        # Released chunks no longer match, and IDs the index never saw are returned as is
+        self.assertEqual(self.dedup.check(REPORT, "c-0", "c.pdf"), "c-0")
+        self.assertEqual(self.dedup.release("legacy.pdf", ["old-1"]), ["old-1"])
+
+    def test_records_persist_only_when_committed(self):
+        self.dedup.check(REPORT, "a-0", "a.pdf")
+        self.dedup.commit()
+        self.dedup.check(OTHER, "b-0", "b.pdf")
+        self.dedup.close()
+        self.assertEqual(self.dedup.sources("a-0"), ["a.pdf"])
+        self.assertEqual(self.dedup.sources("b-0"), [])
+
+
+class TestSharedChunkSources(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = os.path.join(self.tmp.name, "faiss_index")
+        self.embeddings = HashingEmbeddings()
+        self.manifest = {}
+        for p in (patch("builtins.print"), patch("ingest.SOURCE_DIR", self.tmp.name),
+                  patch("ingest.TEXT_CACHE_PATH", ":memory:"), patch.dict(os.environ, {"EMBEDDING_BACKEND": "hashing"})):
+            p.start()
+            self.addCleanup(p.stop)
+
+    def update(self, pending=(), removed=(), docstore=None):
+        def split(file_path, digest=None):
+            texts = [REPORT, os.path.basename(file_path)]
+            return [Document(page_content=text, metadata={"source": file_path}) for text in texts], 0.0
+
+        file_info = {os.path.join(self.tmp.name, name): (1.0, name) for name in pending}
+        with patch("ingest.load_and_split", side_effect=split):
+            ingest.update_index(self.root, self.manifest, list(file_info), file_info, list(removed), self.embeddings,
+                                docstore=docstore, manifest_file=os.path.join(self.tmp.name, "manifest.json"),
+                                embedding_info=backend_info("hashing", self.embeddings))
+
+    def cited(self):
+        docs = tools.load_vectorstore(self.root).similarity_search(REPORT, k=1)
+        return os.path.basename(docs[0].metadata["source"])
+
+    def check_deleted_owner_is_not_cited(self, docstore):
+        self.update(["a.pdf", "b.pdf"], docstore=docstore)
+        self.assertEqual(self.cited(), "a.pdf")
+        self.update(removed=["a.pdf"])
+        self.assertEqual(self.cited(), "b.pdf")
+
+    def test_deleted_owner_is_not_cited(self):
+        self.check_deleted_owner_is_not_cited(None)
+
+    def test_deleted_owner_is_not_cited_with_sqlite_docstore(self):
+        self.check_deleted_owner_is_not_cited("sqlite")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import os
+import sys
+import pickle
+import tempfile
+import unittest
+from unittest.mock import patch
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_community.vectorstores import FAISS
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import docstore  # noqa: E402
+from docstore import SQLiteDocstore, bind_docstore, convert_docstore, migrate_folder  # noqa: E402
+from index_versions import current_version, publish_version, resolve_index, stage_version  # noqa: E402
+
+
+class CountingEmbeddings(Embeddings):
+    """Two-dimensional vectors derived from the chunk number in the text."""
+
+    def embed_documents(self, texts):
+        return [[float(t.split()[-1]), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def make_vectorstore(count=20):
+    docs = [Document(page_content=f"chunk {i}", metadata={"source": "a.pdf", "page": i}) for i in range(count)]
+    return FAISS.from_documents(docs, CountingEmbeddings(), ids=[f"id-{i}" for i in range(count)])
+
+
+class TestSQLiteDocstore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_add_search_delete(self):
+        store = SQLiteDocstore(os.path.join(self.folder, "docstore.sqlite"))
+        store.add({"a": Document(page_content="alpha", metadata={"page": 1}), "b": Document(page_content="beta")})
+
+        doc = store.search("a")
+        self.assertEqual((doc.id, doc.page_content, doc.metadata), ("a", "alpha", {"page": 1}))
+        store.delete(["a"])
+        self.assertEqual(store.search("a"), "ID a not found.")
+        self.assertEqual(len(store), 1)
+        store.close()
+
+    def test_uncommitted_writes_are_invisible_to_readers(self):
+        path = os.path.join(self.folder, "docstore.sqlite")
+        writer = SQLiteDocstore(path)
+        writer.add({"a": Document(page_content="alpha")})
+        reader = SQLiteDocstore(path)
+        self.assertEqual(reader.search("a"), "ID a not found.")
+        writer.commit()
+        self.assertEqual(reader.search("a").page_content, "alpha")
+        writer.close()
+        reader.close()
+
+    def test_pickles_as_a_reference_to_its_file(self):
+        store = SQLiteDocstore(os.path.join(self.folder, "docstore.sqlite"))
+        store.add({"a": Document(page_content="alpha")})
+        store.commit()
+
+        restored = pickle.loads(pickle.dumps(store))
+        self.assertIsNone(restored.path)
+        with self.assertRaises(RuntimeError):
+            restored.search("a")
+        self.assertEqual(restored.bind(self.folder).search("a").page_content, "alpha")
+        store.close()
+        restored.close()
+
+    def test_vectorstore_round_trip_with_sqlite_docstore(self):
+        vectorstore = convert_docstore(make_vectorstore(), "sqlite", self.folder)
+        vectorstore.delete(["id-3"])
+        vectorstore.docstore.commit()
+        vectorstore.save_local(self.folder)
+        # Only the ID mapping and a file reference are pickled
+        self.assertLess(os.path.getsize(os.path.join(self.folder, "index.pkl")), 2000)
+
+        loaded = bind_docstore(
+            FAISS.load_local(self.folder, CountingEmbeddings(), allow_dangerous_deserialization=True), self.folder
+        )
+        self.assertIsInstance(loaded.docstore, SQLiteDocstore)
+        hits = loaded.similarity_search("chunk 3", k=2)
+        self.assertEqual(sorted(doc.page_content for doc in hits), ["chunk 2", "chunk 4"])
+        vectorstore.docstore.close()
+        loaded.docstore.close()
+
+    def test_migrate_existing_index(self):
+        staged, _ = stage_version(self.folder)
+        make_vectorstore().save_local(staged)
+        before = publish_version(self.folder, staged)
+        with open(os.path.join(resolve_index(self.folder), "index.pkl"), "rb") as f:
+            pickled = f.read()
+
+        with patch("builtins.print"):
+            docstore.main(["--folder", self.folder, "migrate"])
+        # The migrated copy is a new version; the published one is left as it was, with no backup files
+        folder = resolve_index(self.folder)
+        self.assertNotEqual(current_version(self.folder), before)
+        with open(os.path.join(self.folder, "versions", before, "index.pkl"), "rb") as f:
+            self.assertEqual(f.read(), pickled)
+        self.assertEqual(sorted(os.listdir(folder)), ["docstore.sqlite", "index.faiss", "index.pkl"])
+        # Running it again is a no-op
+        self.assertEqual(migrate_folder(folder), 0)
+
+        loaded = bind_docstore(
+            FAISS.load_local(folder, CountingEmbeddings(), allow_dangerous_deserialization=True), folder
+        )
+        hit = loaded.similarity_search("chunk 7", k=1)[0]
+        self.assertEqual((hit.page_content, hit.metadata["page"]), ("chunk 7", 7))
+        loaded.docstore.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
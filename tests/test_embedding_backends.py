@@ -0,0 +1,93 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+from langchain_core.documents import Document
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingest  # noqa: E402
+import tools  # noqa: E402
+from embedding_backends import HashingEmbeddings, backend_info, check_backend, embedding_backend  # noqa: E402
+
+TEXTS = [
+    "Invoice INV-2024-0042 from Acme Corp, due March 3",
+    "invoice inv 2024 0042 acme corp due march 3rd",
+    "Weekend hiking trip: pack water, a map and a rain jacket",
+]
+
+
+class TestHashingEmbeddings(unittest.TestCase):
+
+    def test_vectors_are_deterministic_unit_vectors(self):
+        embeddings = HashingEmbeddings(dimension=256)
+        vectors = np.array(embeddings.embed_documents(TEXTS))
+
+        self.assertEqual(vectors.shape, (3, 256))
+        np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, rtol=1e-5)
+        # Embedding a text alone or inside a batch gives the same vector
+        np.testing.assert_allclose(embeddings.embed_query(TEXTS[2]), vectors[2], atol=1e-6)
+        np.testing.assert_allclose(HashingEmbeddings(dimension=256).embed_documents(TEXTS), vectors, atol=1e-6)
+
+    def test_shared_wording_scores_higher(self):
+        vectors = np.array(HashingEmbeddings().embed_documents(TEXTS))
+        self.assertGreater(vectors[0] @ vectors[1], 0.6)
+        self.assertLess(vectors[0] @ vectors[2], 0.2)
+
+    def test_empty_input(self):
+        embeddings = HashingEmbeddings(dimension=8)
+        self.assertEqual(embeddings.embed_documents([]), [])
+        self.assertEqual(embeddings.embed_query(""), [0.0] * 8)
+
+
+class TestBackendSelection(unittest.TestCase):
+
+    def test_backend_comes_from_the_environment(self):
+        with patch.dict(os.environ, {"EMBEDDING_BACKEND": "hashing"}):
+            self.assertEqual(embedding_backend(), "hashing")
+        with patch.dict(os.environ, {"EMBEDDING_BACKEND": "word2vec"}), self.assertRaises(ValueError):
+            embedding_backend()
+
+    def test_check_backend(self):
+        hashing = backend_info("hashing", HashingEmbeddings())
+        # Indexes without a recorded backend were built with OpenAI
+        check_backend({}, {"backend": "openai", "model": "text-embedding-ada-002"}, "db")
+        check_backend({"embedding": hashing}, hashing, "db")
+        with self.assertRaises(ValueError):
+            check_backend({}, hashing, "db")
+        with self.assertRaises(ValueError):
+            check_backend({"embedding": hashing}, backend_info("hashing", HashingEmbeddings(dimension=64)), "db")
+
+
+class TestBackendRecordedWithTheIndex(unittest.TestCase):
+
+    def test_index_refuses_another_backend(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = os.path.join(tmp, "index")
+            path = os.path.join(tmp, "offer.pdf")
+            embeddings = HashingEmbeddings()
+            info = backend_info("hashing", embeddings)
+            chunks = [Document(page_content=text, metadata={"source": path}) for text in TEXTS]
+            with patch("ingest.load_and_split", return_value=(chunks, 0.0)), \
+                    patch("ingest.manifest_key", return_value="offer.pdf"), patch("builtins.print"):
+                ingest.update_index(folder, {}, [path], {path: (1.0, "digest")}, [], embeddings,
+                                    manifest_file=os.path.join(tmp, "manifest.json"), embedding_info=info)
+
+                with self.assertRaises(ValueError):
+                    ingest.update_index(folder, {}, [path], {path: (2.0, "digest-2")}, [], embeddings,
+                                        manifest_file=os.path.join(tmp, "manifest.json"),
+                                        embedding_info={"backend": "openai", "model": "text-embedding-ada-002"})
+
+                with patch.dict(os.environ, {"EMBEDDING_BACKEND": "hashing"}):
+                    vectorstore = tools.load_vectorstore(folder)
+                with patch.dict(os.environ, {"EMBEDDING_BACKEND": "openai"}), self.assertRaises(ValueError):
+                    tools.load_vectorstore(folder)
+
+        (doc,) = vectorstore.similarity_search("acme invoice INV-2024-0042", k=1)
+        self.assertIn(doc.page_content, TEXTS[:2])
+
+
+if __name__ == "__main__":
+    unittest.main()
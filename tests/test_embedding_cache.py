@@ -0,0 +1,99 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedding_cache import EmbeddingCache, CachedEmbeddings, PrefetchedQueryEmbeddings, text_key  # noqa: E402
+
+
+def fake_embeddings():
+    """Embeddings mock that returns [len(text), 1.0] for each text."""
+    emb = MagicMock()
+    emb.model = "fake-model"
+    emb.embed_documents.side_effect = lambda texts: [[float(len(t)), 1.0] for t in texts]
+    emb.embed_query.side_effect = lambda text: [float(len(text)), 0.0]
+    return emb
+
+
+class TestEmbeddingCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "cache", "embeddings.sqlite")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_only_new_chunks_reach_the_model(self):
+        emb = fake_embeddings()
+        cache = EmbeddingCache(self.path)
+        cached = CachedEmbeddings(emb, cache)
+
+        first = cached.embed_documents(["alpha", "beta", "alpha"])
+        second = cached.embed_documents(["beta", "gamma"])
+
+        self.assertEqual(first, [[5.0, 1.0], [4.0, 1.0], [5.0, 1.0]])
+        self.assertEqual(second, [[4.0, 1.0], [5.0, 1.0]])
+        # Duplicates within a batch are embedded once; "beta" is served from cache
+        self.assertEqual(emb.embed_documents.call_args_list[0][0][0], ["alpha", "beta"])
+        self.assertEqual(emb.embed_documents.call_args_list[1][0][0], ["gamma"])
+        self.assertEqual((cache.hits, cache.misses), (2, 3))
+        cache.close()
+
+    def test_cache_persists_across_runs(self):
+        emb = fake_embeddings()
+        cache = EmbeddingCache(self.path)
+        CachedEmbeddings(emb, cache).embed_documents(["persisted chunk"])
+        cache.close()
+
+        reopened = EmbeddingCache(self.path)
+        CachedEmbeddings(emb, reopened).embed_documents(["persisted chunk"])
+        self.assertEqual(emb.embed_documents.call_count, 1)
+        self.assertEqual(reopened.hits, 1)
+        reopened.close()
+
+    def test_lru_eviction_keeps_recently_used(self):
+        cache = EmbeddingCache(self.path, max_entries=2)
+        cache.put_many([("a", [1.0])])
+        cache.put_many([("b", [2.0])])
+        cache.get_many(["a"])  # "a" is now more recent than "b"
+        cache.put_many([("c", [3.0])])
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(set(cache.get_many(["a", "b", "c"])), {"a", "c"})
+        cache.close()
+
+    def test_keys_are_namespaced_by_model(self):
+        self.assertNotEqual(text_key("same text", "model-a"), text_key("same text", "model-b"))
+
+    def test_queries_bypass_the_cache(self):
+        emb = fake_embeddings()
+        cache = EmbeddingCache(self.path)
+        cached = CachedEmbeddings(emb, cache)
+        self.assertEqual(cached.embed_query("question"), [8.0, 0.0])
+        self.assertEqual((cache.hits, cache.misses), (0, 0))
+        # The SQLite file is never created for query-only use
+        self.assertFalse(os.path.exists(self.path))
+
+
+class TestPrefetchedQueryEmbeddings(unittest.TestCase):
+
+    def test_prefetched_queries_skip_the_model(self):
+        underlying = fake_embeddings()
+        prefetch = PrefetchedQueryEmbeddings(underlying)
+
+        self.assertEqual(prefetch.prefetch(["a", "bb", "a"]), 2)
+        self.assertEqual(prefetch.prefetch(["bb"]), 0)
+        underlying.embed_documents.assert_called_once_with(["a", "bb"])
+
+        self.assertEqual(prefetch.embed_query("bb"), [2.0, 1.0])
+        self.assertEqual(prefetch.embed_query("ccc"), [3.0, 0.0])
+        underlying.embed_query.assert_called_once_with("ccc")
+        self.assertEqual((prefetch.hits, prefetch.misses), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
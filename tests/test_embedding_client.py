@@ -0,0 +1,162 @@
+import os
+import sys
+import unittest
+from unittest.mock import patch
+import numpy as np
+import openai
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingest  # noqa: E402
+from embedding_backends import HashingEmbeddings, create_embeddings  # noqa: E402
+from embedding_client import ConcurrentEmbeddings, RateLimiter, client_settings, retry_after  # noqa: E402
+from fakes import FakeEmbeddings, FakeEmbeddingServer  # noqa: E402
+
+MODEL = "text-embedding-ada-002"
+TEXTS = [f"Chunk {i}: invoice {i * 7} for project {i % 5}, due in {i % 12 + 1} weeks" for i in range(300)]
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_request_budget(self):
+        clock = FakeClock()
+        # 60 requests per minute with a one-second burst: one request per second
+        limiter = RateLimiter(rpm=60, tpm=None, burst=1.0, clock=clock, sleep=clock.sleep)
+        self.assertEqual(limiter.acquire(), 0.0)
+        self.assertAlmostEqual(limiter.acquire(), 1.0)
+        self.assertAlmostEqual(limiter.acquire(), 1.0)
+        self.assertAlmostEqual(clock.now, 2.0)
+
+    def test_token_budget_allows_debt_for_large_requests(self):
+        clock = FakeClock()
+        limiter = RateLimiter(rpm=None, tpm=600, burst=1.0, clock=clock, sleep=clock.sleep)
+        # The bucket holds 10 tokens; a 40-token request goes through when it is full ...
+        self.assertEqual(limiter.acquire(40), 0.0)
+        # ... and the next request waits until the 30 tokens of debt plus its own 5 are refilled
+        self.assertAlmostEqual(limiter.acquire(5), 3.5)
+
+    def test_settle_and_pause(self):
+        clock = FakeClock()
+        limiter = RateLimiter(rpm=None, tpm=600, burst=1.0, clock=clock, sleep=clock.sleep)
+        limiter.acquire(10)
+        # The server counted fewer tokens than estimated
+        limiter.settle(10, 4)
+        self.assertEqual(limiter.acquire(6), 0.0)
+        limiter.pause(2.0)
+        self.assertGreaterEqual(limiter.acquire(0), 2.0)
+
+    def test_limits_are_only_lowered(self):
+        limiter = RateLimiter(rpm=3000, tpm=None)
+        limiter.limit(rpm=6000, tpm=1000)
+        self.assertEqual((limiter.rpm, limiter.tpm), (3000, 1000))
+        limiter.limit(rpm=500)
+        self.assertEqual(limiter.rpm, 500)
+
+    def test_retry_after(self):
+        self.assertEqual(retry_after({"retry-after-ms": "250", "retry-after": "1"}), 0.25)
+        self.assertEqual(retry_after({"retry-after": "2"}), 2.0)
+        self.assertIsNone(retry_after({}))
+
+
+class TestConcurrentEmbeddings(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.dict(os.environ, {"OPENAI_API_KEY": "sk-test"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def client(self, server, **options):
+        client = ConcurrentEmbeddings(MODEL, base_url=server.url, backoff_base=0.01, **options)
+        self.addCleanup(client.close)
+        return client
+
+    def assertFakeVectors(self, vectors, texts):
+        expected = [FakeEmbeddings()._vector(text) for text in texts]
+        np.testing.assert_allclose(vectors, expected, atol=1e-6)
+
+    def test_batches_run_concurrently_and_stay_in_order(self):
+        with FakeEmbeddingServer(latency=0.01) as server:
+            client = self.client(server, concurrency=4)
+            vectors = client.embed_documents(TEXTS)
+
+        self.assertFakeVectors(vectors, TEXTS)
+        # The call is spread over all four workers
+        self.assertEqual(server.batch_sizes, [75, 75, 75, 75])
+        self.assertEqual(client.stats["texts"], len(TEXTS))
+        self.assertEqual(client.stats["requests"], 4)
+        self.assertGreater(client.stats["tokens"], 0)
+        self.assertIn("texts/s", client.report())
+        self.assertFakeVectors([client.embed_query(TEXTS[3])], [TEXTS[3]])
+
+    def test_batch_size_grows_while_requests_succeed(self):
+        with FakeEmbeddingServer() as server:
+            client = self.client(server, concurrency=1)
+            client.embed_documents(TEXTS * 4)
+
+        self.assertEqual(server.batch_sizes, [128, 256, 512, 304])
+        self.assertEqual(client.batch_texts, 1024)
+
+    def test_rate_limits_are_retried(self):
+        # Two requests per half second: the first wave of four gets two 429s
+        with FakeEmbeddingServer(requests_per_window=2, window=0.5) as server:
+            client = self.client(server, concurrency=4)
+            vectors = client.embed_documents(TEXTS)
+
+        self.assertFakeVectors(vectors, TEXTS)
+        self.assertGreater(server.rejected, 0)
+        self.assertEqual(client.stats["rate_limited"], server.rejected)
+        self.assertEqual(client.stats["retries"], server.rejected)
+        # The limit the server reports (240 requests per minute) replaces the larger budget
+        self.assertEqual(client.limiter.rpm, 240)
+
+    def test_gives_up_after_max_retries(self):
+        with FakeEmbeddingServer(requests_per_window=0, window=0.05) as server:
+            client = self.client(server, concurrency=1, max_retries=2)
+            with self.assertRaises(openai.RateLimitError):
+                client.embed_documents(TEXTS[:5])
+
+        self.assertEqual(server.requests, 3)
+        self.assertEqual(client.stats["retries"], 2)
+
+    def test_other_errors_are_not_retried(self):
+        with FakeEmbeddingServer(max_input_tokens=5) as server:
+            client = self.client(server, concurrency=2)
+            with self.assertRaises(openai.BadRequestError):
+                client.embed_documents(TEXTS[:2])
+
+        self.assertEqual(client.stats["retries"], 0)
+
+
+class TestClientSelection(unittest.TestCase):
+
+    def test_settings_from_environment_and_overrides(self):
+        with patch.dict(os.environ, {"EMBED_CONCURRENCY": "8", "EMBED_TPM": "5000"}):
+            self.assertEqual(client_settings(rpm=100, tpm=None), {"concurrency": 8, "rpm": 100, "tpm": 5000})
+
+    def test_ingest_uses_the_concurrent_client_for_openai(self):
+        with patch.dict(os.environ, {"OPENAI_API_KEY": "sk-test"}):
+            embeddings = create_embeddings("openai", client_options={"concurrency": 2})
+        self.assertIsInstance(embeddings, ConcurrentEmbeddings)
+        self.assertEqual((embeddings.model, embeddings.concurrency), (MODEL, 2))
+        self.assertIsInstance(create_embeddings("hashing", client_options={}), HashingEmbeddings)
+
+        args = ingest.parse_args(["--embed-concurrency", "8", "--embed-tpm", "2000000"])
+        self.assertEqual(args.embed_options, {"concurrency": 8, "tpm": 2000000})
+
+
+if __name__ == "__main__":
+    unittest.main()
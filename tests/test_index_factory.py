@@ -0,0 +1,202 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+import faiss
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_community.vectorstores import FAISS
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import index_factory  # noqa: E402
+import index_versions  # noqa: E402
+from index_factory import (  # noqa: E402
+    DEFAULT_INDEX_CONFIG, factory_string, build_search_index, publish_search_index,
+    load_index_config, load_search_vectorstore, recall_latency_report, save_index_config
+)
+
+DIM = 16
+
+
+class RandomEmbeddings(Embeddings):
+    """Deterministic pseudo-random vectors keyed by the text's number."""
+
+    def embed_documents(self, texts):
+        return [np.random.default_rng(int(t.split()[-1])).standard_normal(DIM).tolist() for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def make_vectorstore(count):
+    docs = [Document(page_content=f"chunk {i}", metadata={"source": "corpus.pdf"}) for i in range(count)]
+    return FAISS.from_documents(docs, RandomEmbeddings())
+
+
+class TestIndexFactory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = os.path.join(self.tmp.name, "faiss_index")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_factory_strings(self):
+        config = dict(DEFAULT_INDEX_CONFIG, nlist=1024, pq_m=8, hnsw_m=16)
+        self.assertEqual(factory_string(dict(config, type="flat"), 100, DIM), "Flat")
+        self.assertEqual(factory_string(dict(config, type="hnsw"), 100, DIM), "HNSW16")
+        # nlist is capped so each centroid still gets enough training points
+        self.assertEqual(factory_string(dict(config, type="ivf-flat"), 3900, DIM), "IVF100,Flat")
+        self.assertEqual(factory_string(dict(config, type="ivf-pq"), 100000, DIM), "IVF1024,PQ8")
+        with self.assertRaises(ValueError):
+            factory_string(dict(config, type="ivf-pq", pq_m=5), 100000, DIM)
+        with self.assertRaises(ValueError):
+            factory_string(dict(config, type="annoy"), 100, DIM)
+
+    def test_compressed_types(self):
+        config = dict(DEFAULT_INDEX_CONFIG, pq_m=4)
+        self.assertEqual(factory_string(dict(config, type="sq8"), 100, DIM), "SQ8")
+        self.assertEqual(factory_string(dict(config, type="pq"), 1000, DIM), "PQ4")
+        with self.assertRaises(ValueError):
+            factory_string(dict(config, type="pq"), 100, DIM)
+
+    def test_publish_reports_compression_and_recall(self):
+        vectorstore = make_vectorstore(600)
+        vectorstore.save_local(self.folder)
+        publish_search_index(vectorstore, self.folder, dict(DEFAULT_INDEX_CONFIG, type="sq8"))
+
+        config = load_index_config(self.folder)
+        # 16 bytes of SQ8 codes plus an 8-byte label per 64-byte vector at this small dimension
+        self.assertGreater(config["compression_ratio"], 2.5)
+        self.assertGreater(config["recall_at_k"], 0.8)
+        self.assertEqual(recall_latency_report(self.folder, k=5, num_queries=10)[1]["setting"], "SQ8")
+
+    def test_search_params_are_applied(self):
+        vectors = np.random.default_rng(0).standard_normal((2000, DIM)).astype(np.float32)
+        ivf = build_search_index(vectors, dict(DEFAULT_INDEX_CONFIG, type="ivf-flat", nlist=16, nprobe=4))
+        self.assertEqual(faiss.extract_index_ivf(ivf).nprobe, 4)
+        self.assertEqual(ivf.ntotal, 2000)
+        hnsw = build_search_index(vectors, dict(DEFAULT_INDEX_CONFIG, type="hnsw", efSearch=99))
+        self.assertEqual(index_factory.base_index(hnsw).hnsw.efSearch, 99)
+
+    def test_publish_and_reuse_training(self):
+        vectorstore = make_vectorstore(1000)
+        config = dict(DEFAULT_INDEX_CONFIG, type="ivf-flat", nlist=8, nprobe=8)
+        vectorstore.save_local(self.folder)
+        first = publish_search_index(vectorstore, self.folder, config)
+        self.assertEqual(load_index_config(self.folder)["factory"], "IVF8,Flat")
+        # The search index shares index.pkl instead of pickling the docstore a second time
+        self.assertFalse(os.path.exists(os.path.join(self.folder, "search.pkl")))
+        self.assertEqual(
+            load_index_config(self.folder)["disk_bytes"],
+            sum(os.path.getsize(os.path.join(self.folder, name)) for name in ("search.faiss", "index.pkl"))
+        )
+
+        # A second publish reuses the trained centroids instead of retraining
+        second = publish_search_index(vectorstore, self.folder, load_index_config(self.folder))
+        np.testing.assert_array_equal(
+            faiss.extract_index_ivf(first).quantizer.reconstruct_n(0, 8),
+            faiss.extract_index_ivf(second).quantizer.reconstruct_n(0, 8)
+        )
+
+        loaded = load_search_vectorstore(self.folder, RandomEmbeddings())
+        # nprobe equals nlist here, so the approximate search is exact
+        hit = loaded.similarity_search("chunk 123", k=1)[0]
+        self.assertEqual(hit.page_content, "chunk 123")
+
+    def test_publish_updates_the_search_index_in_place(self):
+        vectorstore = make_vectorstore(1000)
+        config = dict(DEFAULT_INDEX_CONFIG, type="ivf-flat", nlist=8, nprobe=8)
+        publish_search_index(vectorstore, self.folder, config)
+        vectorstore.delete([vectorstore.index_to_docstore_id[i] for i in range(10)])
+        vectorstore.add_documents([Document(page_content=f"chunk {i}") for i in range(1000, 1020)])
+        vectorstore.save_local(self.folder)
+
+        with patch("index_factory.build_search_index") as mock_build, patch("index_factory.quality_check") as mock_check, \
+                patch("builtins.print") as mock_print:
+            updated = publish_search_index(vectorstore, self.folder, load_index_config(self.folder))
+        mock_build.assert_not_called()
+        mock_check.assert_not_called()
+        self.assertIn("added 20, removed 10 vectors", str(mock_print.call_args_list[0]))
+        self.assertEqual(updated.ntotal, 1010)
+
+        loaded = load_search_vectorstore(self.folder, RandomEmbeddings())
+        self.assertEqual(loaded.similarity_search("chunk 1005", k=1)[0].page_content, "chunk 1005")
+        self.assertNotEqual(loaded.similarity_search("chunk 5", k=1)[0].page_content, "chunk 5")
+
+    def test_ivf_vectors_are_reconstructed_by_label(self):
+        vectorstore = make_vectorstore(1000)
+        ivf = publish_search_index(vectorstore, self.folder, dict(DEFAULT_INDEX_CONFIG, type="ivf-flat", nlist=8))
+        labels = index_factory.search_labels([vectorstore.index_to_docstore_id[i] for i in (3, 7)])
+        with self.assertRaises(RuntimeError):
+            ivf.reconstruct_batch(labels)
+        index_factory.enable_reconstruct(ivf)
+        np.testing.assert_allclose(ivf.reconstruct_batch(labels), vectorstore.index.reconstruct_batch(np.array([3, 7])))
+
+    def test_hnsw_is_rebuilt_when_vectors_are_removed(self):
+        vectorstore = make_vectorstore(600)
+        config = dict(DEFAULT_INDEX_CONFIG, type="hnsw")
+        publish_search_index(vectorstore, self.folder, config)
+        vectorstore.add_documents([Document(page_content="chunk 600")])
+        with patch("builtins.print") as mock_print:
+            publish_search_index(vectorstore, self.folder, load_index_config(self.folder))
+        self.assertIn("added 1, removed 0 vectors", str(mock_print.call_args_list[0]))
+
+        vectorstore.delete([vectorstore.index_to_docstore_id[0]])
+        with patch("builtins.print") as mock_print:
+            rebuilt = publish_search_index(vectorstore, self.folder, load_index_config(self.folder))
+        self.assertIn("built over 600 vectors", str(mock_print.call_args_list[0]))
+        self.assertEqual(rebuilt.ntotal, 600)
+
+    def test_ivf_lists_follow_the_corpus_size_loosely(self):
+        self.assertTrue(index_factory.compatible_factory("IVF10,Flat", "IVF15,Flat"))
+        self.assertFalse(index_factory.compatible_factory("IVF10,Flat", "IVF25,Flat"))
+        self.assertFalse(index_factory.compatible_factory("IVF10,Flat", "IVF10,PQ8"))
+        self.assertFalse(index_factory.compatible_factory(None, "HNSW32"))
+
+    def test_publish_flat_removes_search_index(self):
+        vectorstore = make_vectorstore(600)
+        publish_search_index(vectorstore, self.folder, dict(DEFAULT_INDEX_CONFIG, type="hnsw"))
+        self.assertTrue(os.path.exists(os.path.join(self.folder, "search.faiss")))
+        publish_search_index(vectorstore, self.folder, dict(DEFAULT_INDEX_CONFIG))
+        self.assertFalse(os.path.exists(os.path.join(self.folder, "search.faiss")))
+        self.assertEqual(load_index_config(self.folder)["type"], "flat")
+
+    def test_recall_latency_report(self):
+        vectorstore = make_vectorstore(1000)
+        vectorstore.save_local(self.folder)
+        publish_search_index(vectorstore, self.folder, dict(DEFAULT_INDEX_CONFIG, type="ivf-flat", nlist=8))
+
+        rows = recall_latency_report(self.folder, k=5, num_queries=20, nprobes=[1, 8])
+
+        self.assertEqual([row["setting"] for row in rows], ["exact (Flat)", "IVF8,Flat nprobe=1", "IVF8,Flat nprobe=8"])
+        self.assertLessEqual(rows[1]["recall"], rows[2]["recall"])
+        self.assertAlmostEqual(rows[2]["recall"], 1.0)
+        for row in rows:
+            self.assertGreaterEqual(row["p99_ms"], row["p50_ms"])
+
+    def test_set_command_publishes_a_new_version(self):
+        staged, _ = index_versions.stage_version(self.folder)
+        save_index_config(staged, dict(DEFAULT_INDEX_CONFIG, type="hnsw"))
+        before = index_versions.publish_version(self.folder, staged)
+
+        with patch("builtins.print"):
+            index_factory.main(["--folder", self.folder, "set", "nprobe=32", "efSearch=128"])
+        config = load_index_config(index_versions.resolve_index(self.folder))
+        self.assertEqual((config["type"], config["nprobe"], config["efSearch"]), ("hnsw", 32, 128))
+        # Published files are never changed in place
+        self.assertNotEqual(index_versions.current_version(self.folder), before)
+        self.assertEqual(load_index_config(os.path.join(self.folder, "versions", before))["efSearch"], 64)
+
+        # An ingest run in progress owns the next version
+        index_versions.stage_version(self.folder)
+        with self.assertRaises(RuntimeError):
+            index_factory.main(["--folder", self.folder, "set", "nprobe=8"])
+
+
+if __name__ == "__main__":
+    unittest.main()
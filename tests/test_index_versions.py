@@ -0,0 +1,326 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+from langchain_core.documents import Document
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingest  # noqa: E402
+import main  # noqa: E402
+import tools  # noqa: E402
+from lexical_index import lexical_index_path  # noqa: E402
+from embedding_backends import HashingEmbeddings, backend_info  # noqa: E402
+from index_versions import (  # noqa: E402
+    VERSIONS_DIR, current_version, has_staged_version, mark_checkpoint, publish_version, resolve_index,
+    stage_version
+)
+
+TEXTS = [
+    "Invoice INV-2024-0042 from Acme Corp, due March 3",
+    "Weekend hiking trip: pack water, a map and a rain jacket",
+    "Quarterly report: revenue grew 12% on strong cloud sales",
+]
+
+
+def write(folder, name, text):
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, name), "w") as f:
+        f.write(text)
+
+
+def read(folder, name):
+    with open(os.path.join(folder, name)) as f:
+        return f.read()
+
+
+class TestVersions(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = os.path.join(self.tmp.name, "faiss_index")
+
+    def test_stage_copies_and_publish_swaps(self):
+        # An index written before versioning is served from the root itself
+        write(self.root, "index.faiss", "v1")
+        self.assertEqual(resolve_index(self.root), self.root)
+
+        staging, resumed = stage_version(self.root)
+        self.assertFalse(resumed)
+        self.assertEqual(read(staging, "index.faiss"), "v1")
+        write(staging, "index.faiss", "v2")
+        # Nothing is visible before publishing
+        self.assertEqual(read(resolve_index(self.root), "index.faiss"), "v1")
+
+        version = publish_version(self.root, staging)
+        self.assertEqual(current_version(self.root), version)
+        self.assertEqual(read(resolve_index(self.root), "index.faiss"), "v2")
+        self.assertFalse(has_staged_version(self.root))
+        # The unversioned files are gone once a version is published
+        self.assertEqual(sorted(os.listdir(self.root)), ["CURRENT", VERSIONS_DIR])
+
+    def test_fresh_stage_is_empty(self):
+        write(self.root, "index.faiss", "v1")
+        staging, _ = stage_version(self.root, fresh=True)
+        self.assertEqual(os.listdir(staging), [])
+
+    def test_interrupted_stage_is_resumed(self):
+        staging, _ = stage_version(self.root)
+        write(staging, "index.faiss", "checkpoint")
+        mark_checkpoint(staging)
+        staging, resumed = stage_version(self.root)
+        self.assertTrue(resumed)
+        self.assertEqual(read(staging, "index.faiss"), "checkpoint")
+        publish_version(self.root, staging)
+        self.assertEqual(os.listdir(resolve_index(self.root)), ["index.faiss"])
+
+    def test_stage_without_checkpoint_is_replaced(self):
+        write(self.root, "index.faiss", "v1")
+        staging, _ = stage_version(self.root)
+        write(staging, "index.faiss", "partial")
+        staging, resumed = stage_version(self.root)
+        self.assertFalse(resumed)
+        self.assertEqual(read(staging, "index.faiss"), "v1")
+
+    def test_published_copy_links_unchanged_files(self):
+        working = os.path.join(self.tmp.name, "working")
+        write(working, "index.faiss", "v1")
+        write(working, "docstore.sqlite", "chunks")
+        written = os.path.getmtime(os.path.join(working, "docstore.sqlite")) - 3600
+        os.utime(os.path.join(working, "docstore.sqlite"), (written, written))
+        first = publish_version(self.root, working, copy=True)
+        write(working, "index.faiss", "v2")
+        second = publish_version(self.root, working, copy=True)
+
+        def inode(version, name):
+            return os.stat(os.path.join(self.root, VERSIONS_DIR, version, name)).st_ino
+
+        self.assertEqual(inode(first, "docstore.sqlite"), inode(second, "docstore.sqlite"))
+        self.assertNotEqual(inode(first, "index.faiss"), inode(second, "index.faiss"))
+        self.assertEqual(read(resolve_index(self.root), "index.faiss"), "v2")
+        # The working folder keeps its own files
+        self.assertNotEqual(os.stat(os.path.join(working, "docstore.sqlite")).st_ino, inode(second, "docstore.sqlite"))
+
+    def test_old_versions_are_pruned(self):
+        versions = []
+        for i in range(5):
+            staging, _ = stage_version(self.root)
+            write(staging, "index.faiss", str(i))
+            versions.append(publish_version(self.root, staging))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.root, VERSIONS_DIR))), versions[-3:])
+        self.assertEqual(read(resolve_index(self.root), "index.faiss"), "4")
+
+
+class TestVersionedIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = os.path.join(self.tmp.name, "faiss_index")
+        self.embeddings = HashingEmbeddings()
+        for p in (patch("builtins.print"), patch.dict(os.environ, {"EMBEDDING_BACKEND": "hashing"})):
+            p.start()
+            self.addCleanup(p.stop)
+
+    def ingest(self, manifest, name, texts):
+        path = os.path.join(self.tmp.name, name)
+        chunks = [Document(page_content=text, metadata={"source": path}) for text in texts]
+        with patch("ingest.load_and_split", return_value=(chunks, 0.0)), patch("ingest.manifest_key", return_value=name):
+            ingest.update_index(self.root, manifest, [path], {path: (1.0, name)}, [], self.embeddings,
+                                manifest_file=os.path.join(self.tmp.name, "manifest.json"),
+                                embedding_info=backend_info("hashing", self.embeddings))
+
+    def test_each_run_publishes_a_new_version(self):
+        manifest = {}
+        self.ingest(manifest, "a.pdf", TEXTS[:2])
+        first = current_version(self.root)
+        self.assertEqual(tools.load_vectorstore(self.root).index.ntotal, 2)
+
+        self.ingest(manifest, "b.pdf", TEXTS[2:])
+        self.assertNotEqual(current_version(self.root), first)
+        self.assertEqual(tools.load_vectorstore(self.root).index.ntotal, 3)
+        # The previous version is left intact for readers still using it
+        self.assertEqual(tools.load_vectorstore(os.path.join(self.root, VERSIONS_DIR, first)).index.ntotal, 2)
+
+    def test_failed_run_leaves_the_published_version_alone(self):
+        manifest = {}
+        self.ingest(manifest, "a.pdf", TEXTS[:2])
+        published = current_version(self.root)
+        with patch("ingest.save_checkpoint", side_effect=OSError("disk full")), self.assertRaises(OSError):
+            self.ingest(dict(manifest), "b.pdf", TEXTS[2:])
+        self.assertEqual(current_version(self.root), published)
+        self.assertEqual(tools.load_vectorstore(self.root).index.ntotal, 2)
+        # No manifest checkpoint refers to the staged copy, so it is dropped
+        self.assertFalse(has_staged_version(self.root))
+
+    def test_run_interrupted_after_a_checkpoint_is_resumed(self):
+        manifest = {}
+        self.ingest(manifest, "a.pdf", TEXTS[:2])
+        published = current_version(self.root)
+        with patch("ingest.publish_search_index", side_effect=OSError("disk full")), self.assertRaises(OSError):
+            self.ingest(manifest, "b.pdf", TEXTS[2:])
+        self.assertEqual(current_version(self.root), published)
+        self.assertTrue(has_staged_version(self.root))
+
+        # The next run resumes the staged version and publishes it
+        self.ingest(manifest, "b.pdf", TEXTS[2:])
+        self.assertFalse(has_staged_version(self.root))
+        self.assertEqual(tools.load_vectorstore(self.root).index.ntotal, 3)
+
+    def test_settings_the_index_cannot_be_built_with_change_nothing(self):
+        manifest = {}
+        self.ingest(manifest, "a.pdf", TEXTS[:2])
+        published = current_version(self.root)
+        with self.assertRaisesRegex(ValueError, "at least 256 vectors"):
+            ingest.update_index(self.root, dict(manifest), [], {}, [], self.embeddings,
+                                index_options={"type": "ivf-pq"}, retrain=True,
+                                manifest_file=os.path.join(self.tmp.name, "manifest.json"),
+                                embedding_info=backend_info("hashing", self.embeddings))
+        self.assertEqual(current_version(self.root), published)
+        self.assertFalse(has_staged_version(self.root))
+        # Later runs still read the published settings and backend
+        self.ingest(manifest, "b.pdf", TEXTS[2:])
+        self.assertEqual(tools.load_vectorstore(self.root).index.ntotal, 3)
+
+    def test_build_vector_db_checks_settings_before_loading(self):
+        manifest = {"a.pdf": {"mtime": 1.0, "sha256": "a", "ids": ["1", "2"]}}
+        with patch("ingest.load_manifest", return_value=manifest), \
+                patch("ingest.find_changed_files", return_value=([], {}, {"a.pdf"}, False)), \
+                patch("ingest.FAISS_INDEX_PATH", self.root), patch("ingest.update_index") as mock_update, \
+                self.assertRaisesRegex(ValueError, "found 2"):
+            ingest.build_vector_db(index_options={"type": "ivf-pq"}, embedding_backend="hashing")
+        mock_update.assert_not_called()
+
+
+class TestHotReload(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = os.path.join(self.tmp.name, "faiss_index")
+        for p in (patch("builtins.print"), patch("tools.FAISS_INDEX_PATH", self.root),
+                  patch("tools.SHARDS_PATH", os.path.join(self.tmp.name, "shards")),
+                  patch.dict(os.environ, {"EMBEDDING_BACKEND": "hashing", "INDEX_RELOAD_SECONDS": "0.01"})):
+            p.start()
+            self.addCleanup(p.stop)
+        tools.reset_vectorstore()
+        self.addCleanup(tools.reset_vectorstore)
+        self.embeddings = HashingEmbeddings()
+        self.manifest = {}
+
+    def publish(self, name, texts):
+        TestVersionedIngest.ingest(self, self.manifest, name, texts)
+
+    def start_reload(self, request=tools.refresh_index):
+        """
+        Run a version check as a request would (or run the request); returns (whether a reload
+        started / what the request returned, event set when the reload is done).
+        """
+        reloaded = threading.Event()
+        original = tools._reload
+
+        def reload_and_signal():
+            original()
+            reloaded.set()
+
+        with patch("tools._reload", reload_and_signal), patch("tools._last_check", 0.0):
+            return request(), reloaded
+
+    def reload(self):
+        started, reloaded = self.start_reload()
+        if started:
+            self.assertTrue(reloaded.wait(10))
+        return started
+
+    def test_new_version_is_swapped_in_without_blocking(self):
+        self.publish("a.pdf", TEXTS[:2])
+        before = tools.get_vectorstore()
+        generation = tools.index_generation()
+        self.assertFalse(self.reload())
+
+        self.publish("b.pdf", TEXTS[2:])
+        loading, release = threading.Event(), threading.Event()
+        load = tools._load
+
+        def slow_load():
+            loading.set()
+            release.wait(10)
+            return load()
+
+        with patch("tools._load", slow_load):
+            started, reloaded = self.start_reload()
+            self.assertTrue(started)
+            self.assertTrue(loading.wait(10))
+            # While the new version loads, requests keep getting the loaded one and start no second reload
+            with patch("tools._last_check", 0.0):
+                self.assertIs(tools.get_vectorstore(), before)
+            release.set()
+            self.assertTrue(reloaded.wait(10))
+
+        after = tools.get_vectorstore()
+        self.assertIsNot(after, before)
+        self.assertEqual(after.index.ntotal, 3)
+        self.assertEqual(tools.index_generation(), generation + 1)
+        self.assertIsNotNone(tools.get_lexical_index())
+        # A request that still holds the previous index can finish on it
+        self.assertEqual(len(before.similarity_search("invoice", k=1)), 1)
+
+    def test_replaced_index_is_closed_once_requests_are_done(self):
+        self.publish("a.pdf", TEXTS[:2])
+        tools.get_vectorstore()
+        before = tools.get_lexical_index()
+        self.assertEqual(len(before.search("invoice", k=1)), 1)
+
+        self.publish("b.pdf", TEXTS[2:])
+        with tools.index_lease() as generation:
+            self.assertTrue(self.reload())
+            # A request that started on the previous index can still search it
+            self.assertEqual(len(before.search("invoice", k=1)), 1)
+            self.assertIsNotNone(before._conn)
+        self.assertEqual(tools.index_generation(), generation + 1)
+        self.assertIsNone(before._conn)
+        # The BM25 index comes from the version the vectorstore was loaded from
+        self.assertEqual(tools.get_lexical_index().path, lexical_index_path(resolve_index(self.root)))
+
+    def test_reload_can_be_turned_off(self):
+        self.publish("a.pdf", TEXTS[:2])
+        tools.get_vectorstore()
+        self.publish("b.pdf", TEXTS[2:])
+        with patch.dict(os.environ, {"INDEX_RELOAD_SECONDS": "0"}):
+            self.assertFalse(self.reload())
+
+    @patch.dict(os.environ, {"CHAT_MODE": "agent"})
+    @patch("main.get_agent")
+    def test_cached_questions_pick_up_a_new_version(self, mock_get_agent):
+        mock_get_agent.return_value.invoke.side_effect = lambda inputs: {
+            "messages": [MagicMock(content=f"{tools.get_vectorstore().index.ntotal} chunks")]
+        }
+        self.publish("a.pdf", TEXTS[:2])
+        with patch("main._answer_cache", None):
+            self.assertEqual(main.handle_chat("How many chunks?")["answer"], "2 chunks")
+            self.assertEqual(main.handle_chat("How many chunks?")["answer"], "2 chunks")
+            self.assertEqual(mock_get_agent.return_value.invoke.call_count, 1)
+
+            self.publish("b.pdf", TEXTS[2:])
+            # A cache hit still checks for a newly published version
+            _, reloaded = self.start_reload(lambda: main.handle_chat("How many chunks?"))
+            self.assertTrue(reloaded.wait(10))
+            self.assertEqual(main.handle_chat("How many chunks?")["answer"], "3 chunks")
+
+    @patch("main.create_agent")
+    @patch("main.get_retriever_tool")
+    def test_agent_is_rebuilt_after_a_reload(self, mock_tool, mock_create_agent):
+        mock_create_agent.side_effect = lambda model, tool_list: MagicMock()
+        with patch("main._agent", None):
+            agent = main.get_agent()
+            self.assertIs(main.get_agent(), agent)
+            with patch("tools._generation", tools.index_generation() + 1):
+                self.assertIsNot(main.get_agent(), agent)
+        self.assertEqual(mock_create_agent.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,12 +1,51 @@
 import os
 import sys
+import copy
+import json
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock, mock_open
+from langchain_core.documents import Document
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from ingest import load_manifest, build_vector_db  # noqa: E402
 import ingest  # noqa: E402
+from text_cache import TextCache  # noqa: E402
+
+# Give every ingest run its own in-memory text cache and dedup records, keep the manifest out of
+# the working directory and run summaries out of ./db, do not publish index configs (which record
+# the mocked embeddings) between tests, and update indexes in place instead of publishing versions
+# (see test_index_versions)
+_db_dir = tempfile.TemporaryDirectory()
+_db_patches = [
+    patch("ingest.MANIFEST_FILE", os.path.join(_db_dir.name, "processed_files.json")),
+    patch("ingest.TEXT_CACHE_PATH", ":memory:"),
+    patch("ingest.dedup_path", lambda folder: ":memory:"),
+    patch("ingest.INGEST_METRICS_FILE", os.path.join(_db_dir.name, "ingest_metrics.jsonl")),
+    patch("ingest.publish_search_index"),
+    patch("ingest.stage_version", lambda folder, fresh=False: (folder, False)),
+    patch("ingest.publish_version", return_value="test"),
+    patch("ingest.discard_staged_version"),
+    patch("ingest.save_index_config"),
+    patch("ingest.mark_checkpoint"),
+]
+
+
+def setUpModule():
+    for p in _db_patches:
+        p.start()
+
+
+def tearDownModule():
+    for p in _db_patches:
+        p.stop()
+    _db_dir.cleanup()
+
+
+def source_tree(*names):
+    """What ingest.scan_tree finds for these files: {manifest key: (mtime, size)}."""
+    return {name: (1.0, 1) for name in names}
 
 
 class TestIngest(unittest.TestCase):
@@ -21,24 +60,25 @@ class TestIngest(unittest.TestCase):
         mock_exists.return_value = True
         self.assertEqual(load_manifest()["file.pdf"], 1.0)
 
-    @patch("os.listdir")
-    @patch("os.path.getmtime")
+    @patch("ingest.hash_file", new=lambda path: "digest")
+    @patch("ingest.scan_tree")
     @patch("os.path.exists")
     @patch("ingest.PyPDFLoader")
     @patch("ingest.FAISS")
-    @patch("ingest.OpenAIEmbeddings")
+    @patch("ingest.create_embeddings")
     @patch("ingest.load_manifest")
     @patch("ingest.save_manifest")
     def test_build_vector_db_logic(
         self, mock_save, mock_load, mock_emb, mock_faiss, mock_pdf,
-        mock_exists, mock_mtime, mock_listdir
+        mock_exists, mock_scan
     ):
         # Setup: One new file, one existing file
-        mock_listdir.return_value = ["new.pdf", "old.pdf"]
+        mock_scan.return_value = {"new.pdf": (3000.0, 1), "old.pdf": (2000.0, 1)}
         mock_load.return_value = {"old.pdf": 2000.0}
-        mock_mtime.side_effect = lambda x: 3000.0 if "new.pdf" in x else 2000.0
         mock_exists.return_value = False  # No existing FAISS index
 
+        mock_pdf.return_value.load.return_value = [Document(page_content="New report", metadata={"source": "new.pdf"})]
+
         # Mock FAISS
         mock_db = MagicMock()
         mock_faiss.from_documents.return_value = mock_db
@@ -52,11 +92,12 @@ class TestIngest(unittest.TestCase):
 
 
 class TestNoDataToIngest(unittest.TestCase):
-    @patch("os.listdir")
+    @patch("ingest.load_manifest", new=lambda path=None: {})
+    @patch("ingest.scan_tree")
     @patch("ingest.FAISS")
     @patch("builtins.print")
-    def test_build_vector_db_logic(self, mock_print, mock_faiss, mock_listdir):
-        mock_listdir.return_value = []
+    def test_build_vector_db_logic(self, mock_print, mock_faiss, mock_scan):
+        mock_scan.return_value = {}
 
         build_vector_db()
 
@@ -66,18 +107,18 @@ class TestNoDataToIngest(unittest.TestCase):
 
 class TestIngestExcelFormat(unittest.TestCase):
 
+    @patch("ingest.hash_file", new=lambda path: "digest")
+    @patch("ingest.save_manifest", new=lambda manifest, path=None: None)
     @patch("ingest.UnstructuredExcelLoader")
-    @patch("os.path.getmtime")
     @patch("os.path.exists")
-    @patch("os.listdir")
+    @patch("ingest.scan_tree")
     @patch("ingest.load_manifest")
     @patch("ingest.FAISS")
-    def test_excel_ingestion_path(self, mock_faiss, mock_load, mock_listdir, mock_exists, mock_mtime, mock_excel_loader):
+    def test_excel_ingestion_path(self, mock_faiss, mock_load, mock_scan, mock_exists, mock_excel_loader):
         """Verify that .xlsx files trigger the UnstructuredExcelLoader."""
         # 1. Setup mocks
-        mock_listdir.return_value = ["jobs_2025.xlsx"]
+        mock_scan.return_value = {"jobs_2025.xlsx": (123456789, 1)}
         mock_load.return_value = {}  # Empty manifest
-        mock_mtime.return_value = 123456789
         mock_exists.return_value = False  # No existing FAISS index
 
         # Mock FAISS
@@ -102,18 +143,18 @@ class TestIngestExcelFormat(unittest.TestCase):
 
 class TestIngestPowerpointFormat(unittest.TestCase):
 
+    @patch("ingest.hash_file", new=lambda path: "digest")
+    @patch("ingest.save_manifest", new=lambda manifest, path=None: None)
     @patch("ingest.UnstructuredPowerPointLoader")
-    @patch("os.path.getmtime")
     @patch("os.path.exists")
-    @patch("os.listdir")
+    @patch("ingest.scan_tree")
     @patch("ingest.load_manifest")
     @patch("ingest.FAISS")
-    def test_powerpoint_ingestion_path(self, mock_faiss, mock_load, mock_listdir, mock_exists, mock_mtime, mock_ppt_loader):
+    def test_powerpoint_ingestion_path(self, mock_faiss, mock_load, mock_scan, mock_exists, mock_ppt_loader):
         """Verify that .pptx files trigger the UnstructuredPowerPointLoader."""
         # 1. Setup mocks
-        mock_listdir.return_value = ["jobs_presentation.pptx"]
+        mock_scan.return_value = {"jobs_presentation.pptx": (90909, 1)}
         mock_load.return_value = {}  # Empty manifest
-        mock_mtime.return_value = 90909
         mock_exists.return_value = False  # No existing FAISS index
 
         # Mock FAISS
@@ -163,18 +204,18 @@ class TestIngestPowerpointFormat(unittest.TestCase):
 
 class TestIngestWordFormat(unittest.TestCase):
 
+    @patch("ingest.hash_file", new=lambda path: "digest")
+    @patch("ingest.save_manifest", new=lambda manifest, path=None: None)
     @patch("ingest.Docx2txtLoader")
-    @patch("os.path.getmtime")
     @patch("os.path.exists")
-    @patch("os.listdir")
+    @patch("ingest.scan_tree")
     @patch("ingest.load_manifest")
     @patch("ingest.FAISS")
-    def test_word_ingestion_path(self, mock_faiss, mock_load, mock_listdir, mock_exists, mock_mtime, mock_word_loader):
+    def test_word_ingestion_path(self, mock_faiss, mock_load, mock_scan, mock_exists, mock_word_loader):
         """Verify that .docx files trigger the Docx2txtLoader."""
         # 1. Setup mocks
-        mock_listdir.return_value = ["my_doc.docx"]
+        mock_scan.return_value = {"my_doc.docx": (2222222, 1)}
         mock_load.return_value = {}  # Empty manifest
-        mock_mtime.return_value = 2222222
         mock_exists.return_value = False  # No existing FAISS index
 
         # Mock FAISS
@@ -200,23 +241,22 @@ class TestIngestWordFormat(unittest.TestCase):
 class TestFAISSCreation(unittest.TestCase):
     """Test that FAISS.from_documents is called when vectorstore doesn't exist."""
 
+    @patch("ingest.hash_file", new=lambda path: "digest")
     @patch("ingest.PyPDFLoader")
-    @patch("os.path.getmtime")
     @patch("os.path.exists")
-    @patch("os.listdir")
+    @patch("ingest.scan_tree")
     @patch("ingest.load_manifest")
     @patch("ingest.save_manifest")
     @patch("ingest.FAISS")
-    @patch("ingest.OpenAIEmbeddings")
+    @patch("ingest.create_embeddings")
     def test_faiss_creation_from_documents(
         self, mock_emb, mock_faiss, mock_save, mock_load,
-        mock_listdir, mock_exists, mock_mtime, mock_pdf_loader
+        mock_scan, mock_exists, mock_pdf_loader
     ):
         """Verify that FAISS.from_documents is called when vectorstore is None."""
         # 1. Setup mocks
-        mock_listdir.return_value = ["new_document.pdf"]
+        mock_scan.return_value = {"new_document.pdf": (123456789, 1)}
         mock_load.return_value = {}  # Empty manifest
-        mock_mtime.return_value = 123456789
 
         # Key: os.path.exists returns False for FAISS_INDEX_PATH check
         # This makes vectorstore = None initially
@@ -242,11 +282,244 @@ class TestFAISSCreation(unittest.TestCase):
         # The first argument should be the filtered_chunks
         call_args = mock_faiss.from_documents.call_args
         self.assertIsNotNone(call_args)
-        # Second argument should be embeddings
-        self.assertEqual(call_args[0][1], mock_emb.return_value)
+        # Second argument should be the cache-backed wrapper around the embeddings, timed for the metrics
+        self.assertEqual(call_args[0][1].underlying.underlying, mock_emb.return_value)
         print("FAISS creation from documents verified.")
 
 
+class FakeProcessPool:
+    """Stand-in for ProcessPoolExecutor that maps in-process so mocks still apply."""
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def map(self, fn, *iterables):
+        return map(fn, *[list(iterable) for iterable in iterables])
+
+
+class TestParallelIngest(unittest.TestCase):
+
+    @patch("ingest.hash_file", new=lambda path: "digest")
+    @patch("ingest.ProcessPoolExecutor", FakeProcessPool)
+    @patch("ingest.load_and_split")
+    @patch("os.path.exists")
+    @patch("ingest.scan_tree")
+    @patch("ingest.load_manifest")
+    @patch("ingest.save_manifest")
+    @patch("ingest.FAISS")
+    @patch("ingest.create_embeddings")
+    def test_parallel_results_are_consumed_in_order(
+        self, mock_emb, mock_faiss, mock_save, mock_load,
+        mock_scan, mock_exists, mock_split
+    ):
+        """Worker results are inserted in listing order regardless of worker count."""
+        mock_scan.return_value = {name: (100.0, 1) for name in ["a.pdf", "notes.txt", "b.docx", "c.xlsx"]}
+        mock_load.return_value = {}
+        mock_exists.return_value = False
+        mock_split.side_effect = lambda path, digest=None: ([Document(page_content=os.path.basename(path))], 0.01)
+
+        mock_db = MagicMock()
+        mock_faiss.from_documents.return_value = mock_db
+
+        ingest.build_vector_db(workers=4)
+
+        # Unsupported files are never sent to the pool
+        self.assertEqual(mock_split.call_count, 3)
+        self.assertEqual([d.page_content for d in mock_faiss.from_documents.call_args[0][0]], ["a.pdf"])
+        self.assertEqual(
+            [[d.page_content for d in c[0][0]] for c in mock_db.add_documents.call_args_list],
+            [["b.docx"], ["c.xlsx"]]
+        )
+        saved_manifest = mock_save.call_args[0][0]
+        self.assertEqual(set(saved_manifest), {"a.pdf", "b.docx", "c.xlsx"})
+
+    def test_parse_args_workers(self):
+        self.assertEqual(ingest.parse_args([]).workers, 1)
+        self.assertEqual(ingest.parse_args(["--workers", "8"]).workers, 8)
+
+
+class TestScanTree(unittest.TestCase):
+
+    def test_walks_subdirectories_and_skips_unsupported_files(self):
+        with tempfile.TemporaryDirectory() as root:
+            for name, text in (("a.pdf", "a"), (os.path.join("contracts", "2024", "b.docx"), "bb"), ("notes.txt", "x")):
+                os.makedirs(os.path.dirname(os.path.join(root, name)), exist_ok=True)
+                with open(os.path.join(root, name), "w") as f:
+                    f.write(text)
+            files = ingest.scan_tree(root)
+        self.assertEqual(sorted(files), ["a.pdf", "contracts/2024/b.docx"])
+        self.assertEqual(files["contracts/2024/b.docx"][1], 2)
+        self.assertEqual(ingest.scan_tree(os.path.join(root, "missing")), {})
+
+
+class TestManifestUpdates(unittest.TestCase):
+    """Content-hash manifest: unchanged files are skipped, changed and deleted files drop stale chunks."""
+
+    def setUp(self):
+        patchers = [
+            patch("ingest.create_embeddings"),
+            patch("ingest.FAISS"),
+            patch("ingest.load_manifest"),
+            patch("ingest.save_manifest"),
+            patch("ingest.load_and_split"),
+            patch("ingest.hash_file"),
+            patch("ingest.scan_tree"),
+            patch("os.path.exists"),
+            patch("ingest.sync_lexical_index"),
+        ]
+        (_, self.mock_faiss, self.mock_load, self.mock_save, self.mock_split,
+         self.mock_hash, self.mock_scan, self.mock_exists, self.mock_sync) = [p.start() for p in patchers]
+        for p in patchers:
+            self.addCleanup(p.stop)
+
+        self.mock_exists.return_value = True  # An index already exists
+        self.mock_db = MagicMock()
+        self.mock_db.index_to_docstore_id = {0: "old-1", 1: "old-2", 2: "other"}
+        self.mock_faiss.load_local.return_value = self.mock_db
+        self.mock_split.return_value = ([Document(page_content="chunk a"), Document(page_content="chunk b")], 0.01)
+
+    def test_touch_without_content_change_does_no_work(self):
+        self.mock_scan.return_value = {"report.pdf": (5.0, 1)}
+        self.mock_load.return_value = {"report.pdf": {"mtime": 1.0, "sha256": "same", "ids": ["old-1"]}}
+        self.mock_hash.return_value = "same"
+
+        ingest.build_vector_db()
+
+        self.mock_split.assert_not_called()
+        self.mock_db.delete.assert_not_called()
+        self.mock_db.save_local.assert_not_called()
+        self.assertEqual(self.mock_save.call_args[0][0]["report.pdf"]["mtime"], 5.0)
+
+    def test_modified_file_replaces_its_chunks(self):
+        self.mock_scan.return_value = {"report.pdf": (5.0, 1)}
+        self.mock_load.return_value = {"report.pdf": {"mtime": 1.0, "sha256": "v1", "ids": ["old-1", "old-2"]}}
+        self.mock_hash.return_value = "v2"
+
+        ingest.build_vector_db()
+
+        self.mock_db.delete.assert_called_once_with(["old-1", "old-2"])
+        new_ids = self.mock_db.add_documents.call_args[1]["ids"]
+        self.assertEqual(new_ids, ingest.chunk_ids("report.pdf", "v2", 2))
+        entry = self.mock_save.call_args[0][0]["report.pdf"]
+        self.assertEqual(entry, {"mtime": 5.0, "sha256": "v2", "ids": new_ids})
+        self.mock_db.save_local.assert_called_once()
+
+    def test_deleted_file_is_removed_from_index(self):
+        self.mock_scan.return_value = {}
+        self.mock_load.return_value = {"gone.docx": {"mtime": 1.0, "sha256": "v1", "ids": ["old-1", "missing"]}}
+
+        ingest.build_vector_db()
+
+        # IDs that are no longer in the index are ignored
+        self.mock_db.delete.assert_called_once_with(["old-1"])
+        self.assertEqual(self.mock_save.call_args[0][0], {})
+        self.mock_db.save_local.assert_called_once()
+
+    def test_files_in_subdirectories_are_tracked(self):
+        # The same files --watch indexes: the whole tree, not just the top level
+        self.mock_scan.return_value = {"reports/q1.pdf": (1.0, 1)}
+        self.mock_load.return_value = {"reports/q1.pdf": {"mtime": 1.0, "sha256": "v1", "ids": ["old-1"]}}
+        ingest.build_vector_db()
+        self.mock_db.delete.assert_not_called()
+        self.mock_db.save_local.assert_not_called()
+
+        self.mock_scan.return_value = {}
+        ingest.build_vector_db()
+        self.mock_db.delete.assert_called_once_with(["old-1"])
+        self.assertEqual(self.mock_save.call_args[0][0], {})
+
+    def test_legacy_entry_finds_chunks_by_source(self):
+        docs = {
+            "old-1": MagicMock(metadata={"source": os.path.join("./data", "report.pdf")}),
+            "old-2": MagicMock(metadata={"source": os.path.join("./data", "other.pdf")}),
+            "other": MagicMock(metadata={"source": os.path.join("./data", "report.pdf")}),
+        }
+        self.mock_db.docstore.search.side_effect = docs.get
+        self.mock_scan.return_value = {"report.pdf": (5.0, 1)}
+        self.mock_load.return_value = {"report.pdf": 1.0}
+        self.mock_hash.return_value = "v2"
+
+        ingest.build_vector_db()
+
+        self.mock_db.delete.assert_called_once_with(["old-1", "other"])
+
+
+class TestStreamingIngest(unittest.TestCase):
+    """--stream mode: fixed-size batches, periodic checkpoints and resume after interruption."""
+
+    def setUp(self):
+        patchers = [
+            patch("ingest.create_embeddings"),
+            patch("ingest.FAISS"),
+            patch("ingest.load_manifest"),
+            patch("ingest.save_manifest"),
+            patch("ingest.iter_pages"),
+            patch("ingest.hash_file", new=lambda path: "digest"),
+            patch("ingest.scan_tree", return_value={"big.pdf": (10.0, 1)}),
+            patch("os.path.exists"),
+            patch("ingest.sync_lexical_index"),
+        ]
+        (_, self.mock_faiss, self.mock_load, self.mock_save, self.mock_pages,
+         _, _, self.mock_exists, self.mock_sync) = [p.start() for p in patchers]
+        for p in patchers:
+            self.addCleanup(p.stop)
+
+        self.mock_pages.side_effect = lambda path, digest=None: iter(
+            [Document(page_content=f"page {i}", metadata={"source": path}) for i in range(5)]
+        )
+        # Keep a copy of each saved manifest; the live dict keeps changing after a checkpoint
+        self.saved = []
+        self.mock_save.side_effect = lambda manifest, *args: self.saved.append(copy.deepcopy(manifest))
+        self.mock_db = MagicMock()
+        self.mock_db.index_to_docstore_id = {}
+        self.mock_faiss.from_documents.return_value = self.mock_db
+        self.mock_faiss.load_local.return_value = self.mock_db
+
+    def test_batches_and_checkpoints(self):
+        self.mock_load.return_value = {}
+        self.mock_exists.return_value = False
+
+        ingest.build_vector_db(stream=True, batch_size=2, checkpoint_every=2)
+
+        first_batch = self.mock_faiss.from_documents.call_args[0][0]
+        later_batches = [c[0][0] for c in self.mock_db.add_documents.call_args_list]
+        self.assertEqual([len(b) for b in [first_batch] + later_batches], [2, 2, 1])
+        # One checkpoint after the second batch plus the final save
+        self.assertEqual(self.mock_db.save_local.call_count, 2)
+        # The lexical index follows every saved checkpoint
+        self.assertEqual(self.mock_sync.call_count, 2)
+        checkpoint_entry = self.saved[0]["big.pdf"]
+        self.assertFalse(checkpoint_entry["complete"])
+        self.assertEqual(len(checkpoint_entry["ids"]), 4)
+        final_entry = self.saved[-1]["big.pdf"]
+        self.assertEqual(final_entry["ids"], ingest.chunk_ids("big.pdf", "digest", 5))
+        self.assertNotIn("complete", final_entry)
+
+    def test_resume_skips_already_indexed_chunks(self):
+        done = ingest.chunk_ids("big.pdf", "digest", 3)
+        self.mock_load.return_value = {"big.pdf": {"mtime": 10.0, "sha256": "digest", "ids": done, "complete": False}}
+        self.mock_exists.return_value = True
+        self.mock_db.index_to_docstore_id = dict(enumerate(done))
+
+        ingest.build_vector_db(stream=True, batch_size=2, checkpoint_every=0)
+
+        self.mock_db.delete.assert_not_called()
+        added = [c[1]["ids"] for c in self.mock_db.add_documents.call_args_list]
+        self.assertEqual(added, [ingest.chunk_ids("big.pdf", "digest", 2, start=3)])
+        self.assertEqual(self.saved[-1]["big.pdf"]["ids"], ingest.chunk_ids("big.pdf", "digest", 5))
+
+    def test_stream_rejects_workers(self):
+        with self.assertRaises(SystemExit):
+            with patch("sys.stderr"):
+                ingest.parse_args(["--stream", "--workers", "4"])
+
+
 # TODO: Re-enable in CI/CD pipeline where venv name is consistent
 # class TestIngestMain(unittest.TestCase):
 #     def test_main_entry_point(self):
@@ -273,3 +546,183 @@ class TestFAISSCreation(unittest.TestCase):
 
 if __name__ == "__main__":
     unittest.main()
+
+
+class TestTextCacheRebuild(unittest.TestCase):
+    """Extracted text is cached by content hash, so re-chunking does not parse documents again."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        source = os.path.join(self.tmp.name, "data")
+        os.makedirs(source)
+        with open(os.path.join(source, "report.pdf"), "w") as f:
+            f.write("v1")
+        self.cache_path = os.path.join(self.tmp.name, "text_cache.sqlite")
+        self.saved = {}
+        self.loader = MagicMock()
+        self.loader.load.side_effect = lambda: [
+            Document(page_content=" ".join(f"word{i}" for i in range(120)), metadata={"source": "x", "page": 0})
+        ]
+        patchers = [
+            patch("ingest.SOURCE_DIR", source),
+            patch("ingest.FAISS_INDEX_PATH", os.path.join(self.tmp.name, "index")),
+            patch("ingest.TEXT_CACHE_PATH", self.cache_path),
+            patch("ingest.get_loader", return_value=self.loader),
+            patch("ingest.load_manifest", side_effect=lambda *args: copy.deepcopy(self.saved)),
+            patch("ingest.save_manifest", side_effect=lambda manifest, *args: self.saved.update(copy.deepcopy(manifest))),
+            patch("ingest.create_embeddings"),
+            patch("ingest.FAISS"),
+            patch("ingest.sync_lexical_index"),
+            patch("ingest.publish_search_index"),
+        ]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+        self.mock_faiss = ingest.FAISS
+
+    def test_rebuild_rechunks_from_cache_without_parsing(self):
+        build_vector_db()
+        self.assertEqual(self.loader.load.call_count, 1)
+        first_chunks = self.mock_faiss.from_documents.call_args[0][0]
+        self.assertTrue(TextCache(self.cache_path).contains(self.saved["report.pdf"]["sha256"], "MagicMock"))
+
+        os.makedirs(ingest.FAISS_INDEX_PATH, exist_ok=True)
+        with patch("ingest.CHUNK_SIZE", 200), patch("ingest.CHUNK_OVERLAP", 0):
+            build_vector_db(rebuild_from_cache=True)
+
+        # The text came from the cache, and the index was rebuilt instead of loaded and extended
+        self.assertEqual(self.loader.load.call_count, 1)
+        self.mock_faiss.load_local.assert_not_called()
+        rebuilt_chunks = self.mock_faiss.from_documents.call_args[0][0]
+        self.assertGreater(len(rebuilt_chunks), len(first_chunks))
+        self.assertEqual(rebuilt_chunks[0].metadata["source"], os.path.join(ingest.SOURCE_DIR, "report.pdf"))
+        self.assertEqual(len(self.saved["report.pdf"]["ids"]), len(rebuilt_chunks))
+
+    def test_chunks_record_the_element_they_were_split_from(self):
+        path = os.path.join(ingest.SOURCE_DIR, "report.pdf")
+
+        def elements():
+            return [
+                Document(page_content=text, metadata={"source": path, "page_number": 1})
+                for text in ("Invoice 4471 total 900 EUR", "Contact: Bob")
+            ]
+
+        self.loader.load.side_effect = elements
+        self.loader.lazy_load.side_effect = lambda: iter(elements())
+        chunks, _ = ingest.load_and_split(path, "digest")
+        self.assertEqual([(c.metadata["part"], c.metadata["start_index"]) for c in chunks], [(0, 0), (1, 0)])
+        # Streaming splits the cached pages the same way
+        streamed = list(ingest.iter_chunks(ingest.iter_pages(path, "digest")))
+        self.assertEqual([c.metadata for c in streamed], [c.metadata for c in chunks])
+
+    def test_spreadsheets_are_parsed_again_when_row_batches_change(self):
+        workbook = os.path.join(ingest.SOURCE_DIR, "sales.xlsx")
+        pages = [Document(page_content="Sheet: Q1", metadata={"source": workbook})]
+        with patch("ingest.get_loader", side_effect=lambda path: ingest.XlsxLoader(path, max_chars=ingest.CHUNK_SIZE)), \
+                patch.object(ingest.XlsxLoader, "load", return_value=pages) as mock_load:
+            self.assertEqual(list(ingest.extracted_pages(workbook, "digest")), pages)
+            self.assertTrue(ingest.is_text_cached(workbook, "digest"))
+            list(ingest.extracted_pages(workbook, "digest"))
+            self.assertEqual(mock_load.call_count, 1)
+
+            # Rows are batched by CHUNK_SIZE, so cached pages from another chunk size do not apply
+            with patch("ingest.CHUNK_SIZE", 200):
+                self.assertFalse(ingest.is_text_cached(workbook, "digest"))
+                list(ingest.extracted_pages(workbook, "digest"))
+            self.assertEqual(mock_load.call_count, 2)
+
+
+class TestDedupStage(unittest.TestCase):
+    """Duplicate chunks across files are embedded once and kept until no file uses them."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        patchers = [
+            patch("ingest.dedup_path", lambda folder: os.path.join(self.tmp.name, "dedup.sqlite")),
+            patch("ingest.create_embeddings"),
+            patch("ingest.FAISS"),
+            patch("ingest.load_manifest"),
+            patch("ingest.save_manifest"),
+            patch("ingest.load_and_split"),
+            patch("ingest.hash_file", new=lambda path: "digest-" + os.path.basename(path)),
+            patch("ingest.scan_tree"),
+            patch("os.path.exists", return_value=False),
+            patch("ingest.sync_lexical_index"),
+            patch("ingest.publish_search_index"),
+        ]
+        (_, _, self.mock_faiss, self.mock_load, self.mock_save, self.mock_split,
+         *_) = [p.start() for p in patchers]
+        for p in patchers:
+            self.addCleanup(p.stop)
+        self.mock_db = MagicMock()
+        self.mock_db.index.d = 1536
+        self.mock_faiss.from_documents.return_value = self.mock_db
+        self.mock_faiss.load_local.return_value = self.mock_db
+        self.mock_split.side_effect = lambda path, digest=None: ([
+            Document(page_content="Standard terms and conditions of the consulting template apply to this engagement."),
+            Document(page_content=f"Specific scope of work for {os.path.basename(path)}."),
+        ], 0.0)
+
+    def test_duplicates_share_one_chunk(self):
+        self.mock_load.return_value = {}
+        ingest.scan_tree.return_value = source_tree("a.docx", "b.docx")
+
+        with patch("builtins.print") as mock_print:
+            build_vector_db()
+
+        inserted = [d.page_content for d in self.mock_faiss.from_documents.call_args[0][0]]
+        inserted += [d.page_content for c in self.mock_db.add_documents.call_args_list for d in c[0][0]]
+        self.assertEqual(len(inserted), 3)
+        manifest = self.mock_save.call_args[0][0]
+        self.assertEqual(manifest["b.docx"]["ids"][0], manifest["a.docx"]["ids"][0])
+        self.assertTrue(any("skipped 1 duplicate chunks (1 exact, 0 near)" in str(c) for c in mock_print.call_args_list))
+
+        # Removing a.docx keeps the shared chunk for b.docx; removing b.docx as well drops it
+        self.mock_db.index_to_docstore_id = dict(enumerate(
+            manifest["a.docx"]["ids"] + manifest["b.docx"]["ids"][1:]
+        ))
+        ingest.os.path.exists.return_value = True
+        self.mock_load.return_value = copy.deepcopy(manifest)
+        ingest.scan_tree.return_value = source_tree("b.docx")
+        build_vector_db()
+        self.mock_db.delete.assert_called_once_with([manifest["a.docx"]["ids"][1]])
+
+        self.mock_load.return_value = {"b.docx": manifest["b.docx"]}
+        ingest.scan_tree.return_value = source_tree()
+        build_vector_db()
+        self.assertEqual(self.mock_db.delete.call_args[0][0], manifest["b.docx"]["ids"])
+
+    def test_no_dedup_run_keeps_shared_chunks(self):
+        self.mock_load.return_value = {}
+        ingest.scan_tree.return_value = source_tree("a.docx", "b.docx")
+        with patch("builtins.print"):
+            build_vector_db()
+        manifest = self.mock_save.call_args[0][0]
+        self.mock_db.index_to_docstore_id = dict(enumerate(
+            manifest["a.docx"]["ids"] + manifest["b.docx"]["ids"][1:]
+        ))
+
+        # Chunks are no longer deduplicated, but those b.docx shares with a deleted file are still kept
+        ingest.os.path.exists.return_value = True
+        self.mock_load.return_value = copy.deepcopy(manifest)
+        ingest.scan_tree.return_value = source_tree("b.docx")
+        build_vector_db(dedup_threshold=None)
+        self.mock_db.delete.assert_called_once_with([manifest["a.docx"]["ids"][1]])
+
+    def test_run_summary_records_stages(self):
+        self.mock_load.return_value = {}
+        ingest.scan_tree.return_value = source_tree("a.docx", "b.docx")
+        path = os.path.join(self.tmp.name, "ingest_metrics.jsonl")
+
+        with patch("ingest.INGEST_METRICS_FILE", path), patch("builtins.print"):
+            build_vector_db()
+        with open(path) as f:
+            (summary,) = [json.loads(line) for line in f]
+
+        self.assertEqual((summary["files_ingested"], summary["chunks_embedded"]), (2, 3))
+        self.assertEqual(summary["settings"], {"workers": 1, "stream": False, "shard_by": None})
+        for stage in ("ingest.hash", "ingest.dedup", "ingest.index_add", "ingest.save", "ingest.publish"):
+            self.assertIn(stage, summary["stages"])
+        self.assertEqual(summary["counters"]["ingest.duplicate_chunks"], 1)
@@ -0,0 +1,95 @@
+import os
+import sys
+import tempfile
+import unittest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_community.vectorstores import FAISS
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lexical_index import LexicalIndex, tokenize, sync_lexical_index, lexical_index_path  # noqa: E402
+
+
+class ConstantEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+    def embed_query(self, text):
+        return [1.0, 0.0]
+
+
+TEXTS = {
+    "a": "Invoice INV-2024-0042 for consulting services, due March 3.",
+    "b": "Invoice INV-2024-0043 for hosting services.",
+    "c": "Job lead: Google, job code GOOG-77, onsite interview scheduled.",
+    "d": "Notes about the weekend hiking trip.",
+}
+
+
+class TestLexicalIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = self.tmp.name
+        self.index = LexicalIndex(lexical_index_path(self.folder))
+
+    def tearDown(self):
+        self.index.close()
+        self.tmp.cleanup()
+
+    def test_tokenize_keeps_identifiers_whole(self):
+        self.assertEqual(tokenize("Ref INV-2024-0042!"), ["ref", "inv-2024-0042", "inv", "2024", "0042"])
+
+    def test_exact_identifier_ranks_first(self):
+        self.index.add(TEXTS)
+        self.assertEqual(self.index.search("INV-2024-0042", 2)[0][0], "a")
+        self.assertEqual(self.index.search("what is job code goog-77?", 1)[0][0], "c")
+        self.assertEqual(self.index.search("???", 3), [])
+
+    def test_delete_and_replace(self):
+        self.index.add(TEXTS)
+        self.index.delete(["a"])
+        self.assertNotIn("a", [doc_id for doc_id, _ in self.index.search("INV-2024-0042", 4)])
+        self.index.add({"b": "now about hiking"})
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.search("hosting", 4), [])
+
+    def test_corpus_stats_are_kept_with_the_chunks(self):
+        self.index.add(TEXTS)
+        self.index.delete(["a", "missing"])
+        self.index.add({"b": "now about hiking"})
+        conn = self.index._connect()
+        queries = []
+        conn.set_trace_callback(queries.append)
+        self.index.search("hiking", 4)
+        conn.set_trace_callback(None)
+        # Searching reads the stats row instead of summing every chunk
+        self.assertFalse([q for q in queries if "FROM docs" in q and "postings" not in q])
+        self.assertEqual(
+            conn.execute("SELECT docs, length FROM stats").fetchone(),
+            conn.execute("SELECT COUNT(*), SUM(length) FROM docs").fetchone()
+        )
+
+        # An index written before the stats table is summed when opened
+        conn.execute("DROP TABLE stats")
+        self.index.close()
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.search("hiking", 4)[0][0], "b")
+
+    def test_sync_follows_the_vectorstore(self):
+        docs = [Document(page_content=text) for text in TEXTS.values()]
+        vectorstore = FAISS.from_documents(docs, ConstantEmbeddings(), ids=list(TEXTS))
+
+        self.assertEqual(sync_lexical_index(vectorstore, self.folder), (4, 0))
+        self.assertEqual(sync_lexical_index(vectorstore, self.folder), (0, 0))
+        vectorstore.delete(["c"])
+        vectorstore.add_documents([Document(page_content="Offer letter from Meta")], ids=["e"])
+        self.assertEqual(sync_lexical_index(vectorstore, self.folder), (1, 1))
+
+        self.assertEqual(self.index.ids(), {"a", "b", "d", "e"})
+        self.assertEqual(self.index.search("meta offer", 1)[0][0], "e")
+
+
+if __name__ == "__main__":
+    unittest.main()
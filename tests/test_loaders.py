@@ -0,0 +1,118 @@
+import os
+import sys
+import zipfile
+import datetime
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+from openpyxl import Workbook
+from langchain_core.documents import Document
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingest  # noqa: E402
+from loaders import XlsxLoader, PptxLoader  # noqa: E402
+
+SLIDE = (
+    '<p:sld xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main" '
+    'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main"><p:cSld><p:spTree>{}</p:spTree></p:cSld></p:sld>'
+)
+
+
+def paragraph(*runs):
+    return "<p:sp><p:txBody><a:p>" + "".join(f"<a:r><a:t>{run}</a:t></a:r>" for run in runs) + "</a:p></p:txBody></p:sp>"
+
+
+def write_deck(path, slides, order):
+    """Minimal .pptx package: slide parts plus the presentation part that orders them."""
+    with zipfile.ZipFile(path, "w") as archive:
+        for number, body in slides.items():
+            archive.writestr(f"ppt/slides/slide{number}.xml", SLIDE.format(body))
+        archive.writestr("ppt/_rels/presentation.xml.rels", (
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + "".join(f'<Relationship Id="rId{n}" Target="slides/slide{n}.xml"/>' for n in slides)
+            + "</Relationships>"
+        ))
+        archive.writestr("ppt/presentation.xml", (
+            '<p:presentation xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><p:sldIdLst>'
+            + "".join(f'<p:sldId r:id="rId{n}"/>' for n in order)
+            + "</p:sldIdLst></p:presentation>"
+        ))
+
+
+class TestXlsxLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "jobs.xlsx")
+        workbook = Workbook()
+        jobs = workbook.active
+        jobs.title = "Jobs"
+        jobs.append([])
+        jobs.append(["Company", "Role", "Applied", "Salary"])
+        for i in range(10):
+            jobs.append([f"Company {i}", "Engineer", datetime.datetime(2025, 1, i + 1), 1000.0 + i])
+        workbook.create_sheet("Notes").append(["Only a title"])
+        workbook.save(self.path)
+
+    def test_rows_are_batched_with_the_header(self):
+        docs = XlsxLoader(self.path, max_chars=120).load()
+        jobs = [doc for doc in docs if doc.metadata["sheet"] == "Jobs"]
+        self.assertGreater(len(jobs), 1)
+        for doc in jobs:
+            self.assertTrue(doc.page_content.startswith("Sheet: Jobs\nCompany | Role | Applied | Salary\n"))
+            self.assertLessEqual(len(doc.page_content), 120)
+        self.assertIn("Company 0 | Engineer | 2025-01-01 | 1000", jobs[0].page_content)
+        self.assertEqual(jobs[0].metadata["first_row"], 3)
+        self.assertEqual(jobs[-1].metadata["last_row"], 12)
+        rows = sum(doc.page_content.count("\n") - 1 for doc in jobs)
+        self.assertEqual(rows, 10)
+        # Distinct pages keep retrieval from merging separate row batches
+        self.assertEqual([doc.metadata["page"] for doc in docs], list(range(1, len(docs) + 1)))
+        self.assertEqual(docs[-1].page_content, "Sheet: Notes\nOnly a title")
+
+    def test_unreadable_file_uses_fallback(self):
+        path = os.path.join(self.tmp.name, "broken.xlsx")
+        with open(path, "w") as f:
+            f.write("not a workbook")
+        fallback = MagicMock()
+        fallback.return_value.lazy_load.return_value = iter([Document(page_content="from fallback")])
+
+        docs = XlsxLoader(path, fallback=fallback).load()
+
+        self.assertEqual([doc.page_content for doc in docs], ["from fallback"])
+
+
+class TestPptxLoader(unittest.TestCase):
+
+    def test_slides_follow_presentation_order(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "deck.pptx")
+            write_deck(path, {
+                1: paragraph("Closing ", "thoughts"),
+                2: paragraph("Pipeline") + paragraph("Networking is the best avenue"),
+                3: "",
+            }, order=[2, 3, 1])
+
+            docs = PptxLoader(path).load()
+
+        self.assertEqual([doc.page_content for doc in docs], ["Pipeline\nNetworking is the best avenue", "Closing thoughts"])
+        # Slides without text are skipped but keep their numbers
+        self.assertEqual([doc.metadata["page"] for doc in docs], [1, 3])
+
+
+class TestLoaderSelection(unittest.TestCase):
+
+    def test_fast_loaders_can_be_disabled(self):
+        self.assertIsInstance(ingest.get_loader("a.xlsx"), XlsxLoader)
+        self.assertIsInstance(ingest.get_loader("a.pptx"), PptxLoader)
+        with patch.dict(os.environ, {"FAST_LOADERS": "0"}), patch("ingest.UnstructuredExcelLoader") as legacy:
+            self.assertIs(ingest.get_loader("a.xlsx"), legacy.return_value)
+        with patch("ingest.UnstructuredExcelLoader") as legacy:
+            self.assertIs(ingest.get_loader("old.xls"), legacy.return_value)
+
+
+if __name__ == "__main__":
+    unittest.main()
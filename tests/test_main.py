@@ -1,15 +1,23 @@
 import os
 import sys
+import asyncio
 import subprocess
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from langchain_core.documents import Document  # noqa: E402
+from langchain_core.messages import AIMessageChunk, ToolMessage  # noqa: E402
+from fakes import FakeAgent  # noqa: E402
 import main  # noqa: E402
+import tools  # noqa: E402
 
 
 class TestMain(unittest.TestCase):
+    def setUp(self):
+        main._answer_cache = None
+        self.addCleanup(setattr, main, "_answer_cache", None)
 
     @patch("main.get_agent")
     def test_handle_chat_unified(self, mock_get_agent):
@@ -30,6 +38,149 @@ class TestMain(unittest.TestCase):
         self.assertEqual(result["sources"], ["Retrieved from: search_personal_docs"])
         mock_agent.invoke.assert_called_once()
 
+    @patch.dict(os.environ, {"CHAT_MODE": "agent"})
+    @patch("main.get_agent")
+    def test_repeated_question_is_answered_from_cache(self, mock_get_agent):
+        mock_ai_message = MagicMock()
+        mock_ai_message.content = "Cached answer."
+        mock_agent = MagicMock()
+        mock_agent.invoke.return_value = {"messages": [mock_ai_message]}
+        mock_get_agent.return_value = mock_agent
+
+        first = main.handle_chat("What is in my documents?")
+        second = main.handle_chat("what is in my documents")
+
+        self.assertEqual(first, second)
+        mock_agent.invoke.assert_called_once()
+
+    @patch.dict(os.environ, {"CHAT_MODE": "agent"})
+    @patch("main.get_agent")
+    def test_answers_are_cached_for_the_loaded_index(self, mock_get_agent):
+        mock_agent = MagicMock()
+        mock_get_agent.return_value = mock_agent
+
+        def reload_mid_request(inputs):
+            # ingest published a version and the hot reload swapped it in while this answer was computed
+            tools._generation += 1
+            return {"messages": [MagicMock(content="Answer from the previous index")]}
+
+        with patch("tools._generation", 0):
+            mock_agent.invoke.side_effect = reload_mid_request
+            main.handle_chat("Hello")
+            mock_agent.invoke.side_effect = None
+            mock_agent.invoke.return_value = {"messages": [MagicMock(content="Answer")]}
+            self.assertEqual(main.handle_chat("Hello")["answer"], "Answer")
+            self.assertEqual(main.handle_chat("Hello")["answer"], "Answer")
+            # A reload drops every cached answer
+            tools._generation += 1
+            main.handle_chat("Hello")
+        self.assertEqual(mock_agent.invoke.call_count, 3)
+
+    @patch.dict(os.environ, {"ANSWER_CACHE_SIZE": "0"})
+    @patch("main.get_agent")
+    def test_answer_cache_can_be_disabled(self, mock_get_agent):
+        mock_agent = MagicMock()
+        mock_agent.invoke.return_value = {"messages": [MagicMock(content="Answer")]}
+        mock_get_agent.return_value = mock_agent
+
+        main.handle_chat("Hello")
+        main.handle_chat("Hello")
+
+        self.assertEqual(mock_agent.invoke.call_count, 2)
+
+    @patch("main.get_agent")
+    def test_handle_chat_async_uses_ainvoke(self, mock_get_agent):
+        mock_ai_message = MagicMock()
+        mock_ai_message.content = "Async answer."
+        mock_ai_message.name = "search_personal_docs"
+        mock_agent = MagicMock()
+        mock_agent.ainvoke = AsyncMock(return_value={"messages": [mock_ai_message]})
+        mock_get_agent.return_value = mock_agent
+
+        result = asyncio.run(main.handle_chat_async("Hello"))
+
+        self.assertEqual(result, {"answer": "Async answer.", "sources": ["Retrieved from: search_personal_docs"]})
+        mock_agent.ainvoke.assert_awaited_once_with({"messages": [("user", "Hello")]})
+        mock_agent.invoke.assert_not_called()
+
+    @patch("main.get_agent")
+    def test_agent_sources_come_from_retrieved_chunks(self, mock_get_agent):
+        tool_message = MagicMock()
+        tool_message.name = "search_personal_docs"
+        tool_message.artifact = [
+            Document(page_content="a", metadata={"source": "./data/resume.pdf"}),
+            Document(page_content="b", metadata={"source": "./data/leads.xlsx"}),
+            Document(page_content="c", metadata={"source": "./data/resume.pdf"}),
+        ]
+        mock_agent = MagicMock()
+        mock_agent.invoke.return_value = {"messages": [tool_message, MagicMock(content="Answer", name=None)]}
+        mock_get_agent.return_value = mock_agent
+
+        result = main.handle_chat("Compare my resume with the job leads")
+
+        self.assertEqual(result["sources"], ["resume.pdf", "leads.xlsx"])
+
+    @patch("rag.retrieve")
+    @patch("main.get_vectorstore")
+    @patch("main.get_agent")
+    def test_document_questions_skip_the_agent(self, mock_get_agent, mock_get_vectorstore, mock_retrieve):
+        mock_retrieve.return_value = [Document(page_content="Google, Meta", metadata={"source": "./data/leads.xlsx"})]
+        with patch.object(main, "model") as mock_model:
+            mock_model.invoke.return_value = MagicMock(content="Google and Meta.")
+            result = main.handle_chat("What are my job leads?")
+
+        self.assertEqual(result, {"answer": "Google and Meta.", "sources": ["leads.xlsx"]})
+        mock_get_agent.assert_not_called()
+        mock_model.invoke.assert_called_once()
+
+    @patch.dict(os.environ, {"CHAT_MODE": "agent"})
+    @patch("main.get_agent")
+    def test_stream_chat_yields_tokens_tool_events_and_done(self, mock_get_agent):
+        mock_get_agent.return_value.stream.return_value = iter([
+            (AIMessageChunk(content="", tool_call_chunks=[
+                {"name": "search_personal_docs", "args": "", "id": "call-1", "index": 0}
+            ]), {}),
+            (ToolMessage(content="...", name="search_personal_docs", tool_call_id="call-1",
+                         artifact=[Document(page_content="x", metadata={"source": "./data/leads.xlsx"})]), {}),
+            (AIMessageChunk(content="Google"), {}),
+            (AIMessageChunk(content=" and Meta."), {}),
+        ])
+
+        events = list(main.stream_chat("What are my job leads?"))
+
+        self.assertEqual([e["type"] for e in events], ["tool_call", "tool", "token", "token", "done"])
+        done = events[-1]
+        self.assertEqual((done["answer"], done["sources"]), ("Google and Meta.", ["leads.xlsx"]))
+        self.assertGreaterEqual(done["latency"], done["ttft"])
+        # The streamed answer is cached like handle_chat's
+        cached = list(main.stream_chat("what are my job leads"))
+        self.assertEqual([e["type"] for e in cached], ["token", "done"])
+        self.assertEqual(cached[-1]["answer"], "Google and Meta.")
+        mock_get_agent.return_value.stream.assert_called_once()
+
+    @patch("main.get_lexical_index")
+    @patch("main.get_vectorstore")
+    @patch("main.stream_direct")
+    def test_stream_chat_direct_path(self, mock_stream_direct, mock_get_vectorstore, mock_get_lexical_index):
+        mock_stream_direct.return_value = iter([
+            {"type": "retrieval", "sources": ["resume.pdf"]},
+            {"type": "token", "text": "Acme."},
+        ])
+
+        done = list(main.stream_chat("Where do I work?"))[-1]
+
+        self.assertEqual((done["answer"], done["sources"]), ("Acme.", ["resume.pdf"]))
+
+    def test_stream_chat_async_with_fake_agent(self):
+        async def collect():
+            return [event async for event in main.stream_chat_async("Hello", agent=FakeAgent(latency=0))]
+
+        events = asyncio.run(collect())
+
+        self.assertEqual(events[0]["type"], "tool")
+        self.assertEqual(events[-1]["answer"], "This is a fake answer. (question: Hello)")
+        self.assertEqual(events[-1]["sources"], ["Retrieved from: search_personal_docs"])
+
     @patch('builtins.input', side_effect=['exit'])
     @patch('builtins.print')
     @patch('main.handle_chat')
@@ -0,0 +1,93 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+import uuid
+from unittest.mock import patch
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics  # noqa: E402
+from metrics import Metrics, LLMMetricsHandler  # noqa: E402
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_timers_and_counters(self):
+        registry = Metrics()
+        for seconds in (0.5, 1.5):
+            registry.observe("ingest.embed", seconds)
+        with registry.timer("ingest.load"):
+            pass
+        registry.count("ingest.chunks_added", 3)
+        registry.count("chat.requests")
+
+        snapshot = registry.snapshot("ingest.")
+        self.assertEqual(snapshot["stages"]["ingest.embed"], {"calls": 2, "seconds": 2.0, "max_seconds": 1.5})
+        self.assertEqual(snapshot["stages"]["ingest.load"]["calls"], 1)
+        self.assertEqual(snapshot["counters"], {"ingest.chunks_added": 3})
+
+        registry.reset("ingest.")
+        self.assertEqual(registry.snapshot(), {"stages": {}, "counters": {"chat.requests": 1}})
+
+    def test_disabled_registry_records_nothing(self):
+        registry = Metrics(enabled=False)
+        with registry.timer("ingest.load"):
+            registry.count("ingest.chunks_added")
+        registry.observe("ingest.embed", 1.0)
+        self.assertEqual(registry.snapshot(), {"stages": {}, "counters": {}})
+        self.assertIs(registry.timer("a"), registry.timer("b"))
+
+    def test_worker_metrics_are_captured_and_merged(self):
+        with patch("metrics.registry", Metrics()) as parent:
+            parent.count("ingest.chunks_added", 1)
+            with metrics.capture() as recorded:
+                list(metrics.timed(iter(["page 1", "page 2"]), "ingest.load"))
+                metrics.count("ingest.chunks_added", 2)
+            # The worker's records did not leak into the parent until merged
+            self.assertNotIn("ingest.load", parent.snapshot()["stages"])
+            parent.merge(recorded.snapshot())
+
+            snapshot = parent.snapshot()
+        self.assertEqual(snapshot["stages"]["ingest.load"]["calls"], 3)
+        self.assertEqual(snapshot["counters"]["ingest.chunks_added"], 3)
+
+    def test_prometheus_format(self):
+        registry = Metrics()
+        registry.observe("chat.retrieval", 0.25)
+        registry.count("chat.prompt_tokens", 120)
+
+        text = registry.prometheus(gauges={"chat.running": 2})
+
+        self.assertIn("# TYPE rag_stage_seconds summary", text)
+        self.assertIn('rag_stage_seconds_count{stage="chat.retrieval"} 1', text)
+        self.assertIn('rag_stage_seconds_sum{stage="chat.retrieval"} 0.25', text)
+        self.assertIn("rag_chat_prompt_tokens_total 120", text)
+        self.assertIn("rag_chat_running 2", text)
+
+    def test_llm_handler_times_calls_and_counts_tokens(self):
+        message = AIMessage(content="Answer", usage_metadata={"input_tokens": 30, "output_tokens": 7, "total_tokens": 37})
+        handler = LLMMetricsHandler()
+        run_id = uuid.uuid4()
+        with patch("metrics.registry", Metrics()) as registry:
+            handler.on_chat_model_start({}, [[]], run_id=run_id)
+            handler.on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]), run_id=run_id)
+            snapshot = registry.snapshot()
+        self.assertEqual(snapshot["stages"]["chat.llm"]["calls"], 1)
+        self.assertEqual(snapshot["counters"], {"chat.prompt_tokens": 30, "chat.completion_tokens": 7})
+
+    def test_write_summary_appends_json_lines(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "runs", "ingest_metrics.jsonl")
+            metrics.write_summary({"files_ingested": 1}, path)
+            metrics.write_summary({"files_ingested": 2}, path)
+            with open(path) as f:
+                runs = [json.loads(line) for line in f]
+        self.assertEqual([run["files_ingested"] for run in runs], [1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import sys
+import asyncio
+import unittest
+from unittest.mock import patch, MagicMock, AsyncMock
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessageChunk
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rag  # noqa: E402
+
+
+def retrieved_docs():
+    return [
+        Document(page_content="Senior engineer at Acme.", metadata={"source": "./data/resume.pdf", "page": 0}),
+        Document(page_content="Google - onsite scheduled", metadata={"source": "./data/leads.xlsx"}),
+        Document(page_content="Skills: Python", metadata={"source": "./data/resume.pdf", "page": 1}),
+    ]
+
+
+class TestRouter(unittest.TestCase):
+
+    def test_plain_document_questions_go_direct(self):
+        for question in ["What are my job leads?", "When did I start at Acme?", "Summarize my resume"]:
+            self.assertEqual(rag.route_question(question), "direct", question)
+
+    def test_small_talk_and_multi_step_questions_use_the_agent(self):
+        for question in ["Hello", "thanks!", "Compare my resume with the Google job",
+                         "What is the difference between my two offers?", "Where do I live? Where do I work?"]:
+            self.assertEqual(rag.route_question(question), "agent", question)
+
+    def test_chat_mode_override(self):
+        with patch.dict(os.environ, {"CHAT_MODE": "agent"}):
+            self.assertEqual(rag.chat_mode("What are my job leads?"), "agent")
+        self.assertEqual(rag.chat_mode("Hello", mode="direct"), "direct")
+        with self.assertRaises(ValueError):
+            rag.chat_mode("Hello", mode="fast")
+
+
+class TestDirectAnswer(unittest.TestCase):
+
+    def test_sources_are_unique_file_names_in_rank_order(self):
+        self.assertEqual(rag.chunk_sources(retrieved_docs()), ["resume.pdf", "leads.xlsx"])
+
+    def test_sources_in_subfolders_keep_their_path(self):
+        docs = [
+            Document(page_content="a", metadata={"source": "./data/sub/report.pdf"}),
+            Document(page_content="b", metadata={"source": "./data/report.pdf"}),
+            Document(page_content="c", metadata={"source": "/elsewhere/notes.txt"}),
+        ]
+        self.assertEqual(rag.chunk_sources(docs), ["sub/report.pdf", "report.pdf", "notes.txt"])
+        self.assertIn("[sub/report.pdf]\na", rag.format_context(docs))
+
+    @patch("rag.retrieve", return_value=retrieved_docs())
+    def test_one_retrieval_and_one_llm_call(self, mock_retrieve):
+        vectorstore = MagicMock()
+        model = MagicMock()
+        model.invoke.return_value = MagicMock(content="You work at Acme.")
+
+        result = rag.answer_direct("Where do I work?", vectorstore, model)
+
+        self.assertEqual(result, {"answer": "You work at Acme.", "sources": ["resume.pdf", "leads.xlsx"]})
+        mock_retrieve.assert_called_once()
+        self.assertEqual(mock_retrieve.call_args[0], (vectorstore, "Where do I work?"))
+        system, user = model.invoke.call_args[0][0]
+        self.assertIn("[resume.pdf]\nSenior engineer at Acme.", system[1])
+        self.assertEqual(user, ("user", "Where do I work?"))
+
+    @patch("rag.retrieve", return_value=retrieved_docs()[:1])
+    def test_async_direct_answer(self, mock_retrieve):
+        vectorstore = MagicMock()
+        model = MagicMock()
+        model.ainvoke = AsyncMock(return_value=MagicMock(content="Acme."))
+
+        result = asyncio.run(rag.answer_direct_async("Where do I work?", vectorstore, model))
+
+        self.assertEqual(result, {"answer": "Acme.", "sources": ["resume.pdf"]})
+
+    @patch("rag.retrieve", return_value=retrieved_docs())
+    def test_stream_direct(self, mock_retrieve):
+        model = MagicMock()
+        model.stream.return_value = iter([AIMessageChunk(content="You work"), AIMessageChunk(content=" at Acme.")])
+
+        events = list(rag.stream_direct("Where do I work?", MagicMock(), model))
+
+        self.assertEqual(events, [
+            {"type": "retrieval", "sources": ["resume.pdf", "leads.xlsx"]},
+            {"type": "token", "text": "You work"},
+            {"type": "token", "text": " at Acme."},
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock
+import numpy as np
+import faiss
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_community.vectorstores import FAISS
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import retrieval  # noqa: E402
+from retrieval import mmr, merge_adjacent, pack_context, retrieve, PackedRetriever  # noqa: E402
+from lexical_index import LexicalIndex  # noqa: E402
+from index_factory import enable_reconstruct  # noqa: E402
+
+
+class TableEmbeddings(Embeddings):
+    """Looks each text up in a fixed table of 3-d vectors."""
+
+    def __init__(self, table):
+        self.table = table
+
+    def embed_documents(self, texts):
+        return [self.table[text] for text in texts]
+
+    def embed_query(self, text):
+        return self.table[text]
+
+
+TABLE = {
+    "query": [1.0, 0.0, 0.0],
+    "best": [0.99, 0.14, 0.0],
+    "best copy": [0.99, 0.14, 0.01],
+    "different": [0.8, 0.0, 0.6],
+    "unrelated": [0.0, 1.0, 0.0],
+}
+
+
+def make_vectorstore():
+    texts = [text for text in TABLE if text != "query"]
+    docs = [Document(page_content=text, metadata={"source": f"./data/{text}.txt"}) for text in texts]
+    return FAISS.from_documents(docs, TableEmbeddings(TABLE), ids=texts)
+
+
+def chunk(text, start, source="a.pdf", page=0):
+    return Document(page_content=text, metadata={"source": source, "page": page, "start_index": start})
+
+
+class FakeLexicalIndex(LexicalIndex):
+    """Returns fixed (text, score) hits, mapped to the docstore IDs of make_vectorstore()."""
+
+    def __init__(self, hits):
+        super().__init__(path=None)
+        self.hits = hits
+
+    def search(self, query, k):
+        return self.hits[:k]
+
+
+class TestRetrieval(unittest.TestCase):
+
+    def test_mmr_prefers_diverse_candidates(self):
+        query = np.array([1.0, 0.0, 0.0])
+        candidates = retrieval._unit(np.array([TABLE["best"], TABLE["best copy"], TABLE["different"]]))
+        self.assertEqual(mmr(query, candidates, 2, lambda_mult=0.5), [0, 2])
+        self.assertEqual(mmr(query, candidates, 2, lambda_mult=1.0), [0, 1])
+
+    def test_retrieve_diversifies_and_applies_threshold(self):
+        vectorstore = make_vectorstore()
+        docs = retrieve(vectorstore, "query", k=2, fetch_k=4, score_threshold=0.5)
+        self.assertEqual([doc.page_content for doc in docs], ["best", "different"])
+
+        docs = retrieve(vectorstore, "query", k=4, fetch_k=4, score_threshold=0.95)
+        self.assertEqual(sorted(doc.page_content for doc in docs), ["best", "best copy"])
+
+    def test_retrieve_reconstructs_from_ivf_indexes(self):
+        vectorstore = make_vectorstore()
+        quantizer = faiss.IndexFlatL2(3)
+        ivf = faiss.IndexIVFFlat(quantizer, 3, 1)
+        vectors = vectorstore.index.reconstruct_n(0, vectorstore.index.ntotal)
+        ivf.train(vectors)
+        ivf.add(vectors)
+        # As tools.load_vectorstore does before sharing the index
+        enable_reconstruct(ivf)
+        vectorstore.index = ivf
+
+        docs = retrieve(vectorstore, "query", k=2, fetch_k=4)
+        self.assertEqual([doc.page_content for doc in docs], ["best", "different"])
+
+    def test_merge_adjacent_chunks_removes_overlap(self):
+        text = "abcdefghijklmnopqrstuvwxyz"
+        docs = [
+            chunk(text[10:20], 10),
+            chunk("other page", 0, page=1),
+            chunk(text[0:12], 0),
+            chunk(text[20:26], 20),
+            chunk("far away", 500),
+        ]
+        merged = merge_adjacent(docs)
+
+        self.assertEqual([doc.page_content for doc in merged], [text, "other page", "far away"])
+        self.assertEqual(merged[0].metadata["start_index"], 0)
+
+    def test_elements_are_not_merged_with_each_other(self):
+        # Unstructured elements: no page, and start_index restarts at 0 in each element
+        docs = [
+            Document(page_content=text, metadata={"source": "a.xls", "page_number": 1, "start_index": 0})
+            for text in ("Invoice 4471 total 900 EUR", "Contact: Bob")
+        ]
+        self.assertEqual(merge_adjacent(docs), docs)
+        numbered = [Document(page_content=doc.page_content, metadata=dict(doc.metadata, part=part))
+                    for part, doc in enumerate(docs)]
+        self.assertEqual(merge_adjacent(numbered), numbered)
+
+    def test_chunks_without_offsets_are_kept_as_is(self):
+        docs = [Document(page_content="x", metadata={"source": "a.pdf"}), chunk("y", 0)]
+        self.assertEqual([doc.page_content for doc in merge_adjacent(docs)], ["x", "y"])
+
+    def test_pack_context_stays_within_budget(self):
+        docs = [Document(page_content="a" * 40), Document(page_content="b" * 80), Document(page_content="c" * 20)]
+        packed = pack_context(docs, token_budget=60, count=len)
+        self.assertEqual([doc.page_content[0] for doc in packed], ["a", "c"])
+
+        truncated = pack_context(docs[1:2], token_budget=30, count=len)
+        self.assertEqual(truncated[0].page_content, "b" * 30)
+
+    def test_hybrid_fuses_lexical_hits(self):
+        vectorstore = make_vectorstore()
+        lexical = FakeLexicalIndex([("unrelated", 9.0)])
+        docs = retrieve(vectorstore, "query", k=2, fetch_k=4, mode="hybrid", lexical_index=lexical)
+        # "unrelated" is last by vector but first lexically; it ties with the best vector hit
+        self.assertEqual([doc.page_content for doc in docs], ["best", "unrelated"])
+
+    def test_lexical_mode_makes_no_embedding_call(self):
+        vectorstore = make_vectorstore()
+        vectorstore.embedding_function = MagicMock()
+        docs = retrieve(vectorstore, "query", k=2, mode="lexical", lexical_index=FakeLexicalIndex([("different", 1.0)]))
+
+        self.assertEqual([doc.page_content for doc in docs], ["different"])
+        vectorstore.embedding_function.embed_query.assert_not_called()
+
+    def test_missing_lexical_index(self):
+        vectorstore = make_vectorstore()
+        with self.assertRaises(FileNotFoundError):
+            retrieve(vectorstore, "query", mode="lexical")
+        # hybrid quietly falls back to dense retrieval
+        self.assertEqual(len(retrieve(vectorstore, "query", k=1, mode="hybrid")), 1)
+
+    def test_packed_retriever(self):
+        retriever = PackedRetriever(vectorstore=make_vectorstore(), settings={"k": 1})
+        self.assertEqual([doc.page_content for doc in retriever.invoke("query")], ["best"])
+
+
+if __name__ == "__main__":
+    unittest.main()
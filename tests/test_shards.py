@@ -0,0 +1,194 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_community.vectorstores import FAISS
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingest  # noqa: E402
+from embedding_cache import EmbeddingCache  # noqa: E402
+from shards import (  # noqa: E402
+    ShardedIndex, collection_of, load_catalog, save_catalog, select_shards, ROOT_COLLECTION
+)
+from retrieval import retrieve  # noqa: E402
+from lexical_index import LexicalIndex, lexical_index_path, sync_lexical_index  # noqa: E402
+
+
+class CountingEmbeddings(Embeddings):
+    """2-d vectors from a fixed table; counts query embeddings."""
+
+    TABLE = {
+        "revenue": [1.0, 0.0],
+        "q3 revenue sheet": [0.95, 0.3],
+        "budget sheet": [0.7, 0.7],
+        "revenue slide": [0.98, 0.2],
+        "team photo slide": [0.0, 1.0],
+    }
+
+    def __init__(self):
+        self.queries = 0
+
+    def embed_documents(self, texts):
+        return [self.TABLE[text] for text in texts]
+
+    def embed_query(self, text):
+        self.queries += 1
+        return self.TABLE[text.split(" in ")[0]]
+
+
+SHARD_TEXTS = {
+    "spreadsheets": ["q3 revenue sheet", "budget sheet"],
+    "slides": ["revenue slide", "team photo slide"],
+}
+
+
+def build_shards(root, embeddings):
+    catalog = {"shard_by": "type", "shards": {}}
+    for name, texts in SHARD_TEXTS.items():
+        docs = [Document(page_content=text, metadata={"source": f"./data/{text}"}) for text in texts]
+        vectorstore = FAISS.from_documents(docs, embeddings, ids=texts)
+        folder = os.path.join(root, name)
+        vectorstore.save_local(folder)
+        sync_lexical_index(vectorstore, folder)
+        catalog["shards"][name] = {"folder": name, "files": len(texts), "vectors": len(texts)}
+    save_catalog(catalog, root)
+    return catalog
+
+
+def load_shard(folder, embeddings):
+    return FAISS.load_local(folder, embeddings, allow_dangerous_deserialization=True), None
+
+
+def load_with_lexical(folder, embeddings):
+    return load_shard(folder, embeddings)[0], LexicalIndex(lexical_index_path(folder))
+
+
+class TestShardSelection(unittest.TestCase):
+
+    def test_collection_of(self):
+        self.assertEqual(collection_of("work/report.pdf", "dir"), "work")
+        self.assertEqual(collection_of("report.pdf", "dir"), ROOT_COLLECTION)
+        self.assertEqual(collection_of("work/deck.PPTX", "type"), "slides")
+        self.assertEqual(collection_of("notes.xls", "type"), "spreadsheets")
+
+    def test_select_shards_by_name_or_all(self):
+        names = ["pdf", "slides", "spreadsheets"]
+        self.assertEqual(select_shards("revenue in my spreadsheets", names), ["spreadsheets"])
+        self.assertEqual(select_shards("which slide shows revenue?", names), ["slides"])
+        self.assertEqual(select_shards("what is the revenue?", names), names)
+        with patch.dict(os.environ, {"RETRIEVAL_SHARDS": "pdf, slides"}):
+            self.assertEqual(select_shards("revenue in my spreadsheets", names), ["pdf", "slides"])
+
+    def test_only_explicit_collection_names_narrow_the_search(self):
+        names = ["documents", "pdf", "slides", "spreadsheets"]
+        self.assertEqual(select_shards("What do my documents say about invoice INV-1?", names), names)
+        self.assertEqual(select_shards("Which files mention the budget?", names), names)
+        self.assertEqual(select_shards("summarize my pdfs", names), ["pdf"])
+        self.assertEqual(select_shards("totals in the Excel workbook", names), ["spreadsheets"])
+        self.assertEqual(select_shards("the roadmap deck", names), ["slides"])
+        self.assertEqual(select_shards("anything in my .docx files?", names), ["documents"])
+        # Folder names (--shard-by dir) match as well, except the generic root collection
+        names = [ROOT_COLLECTION, "contracts", "documents"]
+        self.assertEqual(select_shards("termination clause in my contracts", names), ["contracts"])
+        self.assertEqual(select_shards("root cause of the outage in my documents", names), names)
+
+    def test_catalog_round_trip(self):
+        with tempfile.TemporaryDirectory() as root:
+            self.assertIsNone(load_catalog(root))
+            catalog = {"shard_by": "dir", "shards": {"work": {"folder": "work", "files": 2}}}
+            save_catalog(catalog, root)
+            self.assertEqual(load_catalog(root), catalog)
+
+
+class TestShardedIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.embeddings = CountingEmbeddings()
+        self.catalog = build_shards(self.tmp.name, self.embeddings)
+
+    def make_index(self):
+        index = ShardedIndex(self.catalog, load_shard, self.embeddings, root=self.tmp.name)
+        self.addCleanup(index.close)
+        return index
+
+    def test_fan_out_merges_top_k_across_shards(self):
+        index = self.make_index()
+        docs = retrieve(index, "revenue", k=2, fetch_k=4, lambda_mult=1.0, token_budget=1000)
+        self.assertEqual([doc.page_content for doc in docs], ["revenue slide", "q3 revenue sheet"])
+        self.assertEqual(index.loaded(), ["slides", "spreadsheets"])
+        # One query embedding shared by every shard
+        self.assertEqual(self.embeddings.queries, 1)
+
+    def test_unselected_shards_are_not_loaded(self):
+        index = self.make_index()
+        docs = retrieve(index, "revenue in my spreadsheets", k=1, token_budget=1000)
+        self.assertEqual([doc.page_content for doc in docs], ["q3 revenue sheet"])
+        self.assertEqual(index.loaded(), ["spreadsheets"])
+
+    def test_named_collection_without_results_falls_back_to_all_shards(self):
+        index = ShardedIndex(self.catalog, load_with_lexical, self.embeddings, root=self.tmp.name)
+        self.addCleanup(index.close)
+        docs = retrieve(index, "team photo in my spreadsheets", k=1, token_budget=1000, mode="lexical")
+        self.assertEqual([doc.page_content for doc in docs], ["team photo slide"])
+
+    def test_lexical_and_hybrid_modes_use_shard_indexes(self):
+        index = ShardedIndex(self.catalog, load_with_lexical, self.embeddings, root=self.tmp.name)
+        self.addCleanup(index.close)
+        docs = retrieve(index, "budget", k=1, token_budget=1000, mode="lexical")
+        self.assertEqual([doc.page_content for doc in docs], ["budget sheet"])
+        self.assertTrue(retrieve(index, "revenue", k=2, token_budget=1000, mode="hybrid"))
+
+
+class TestShardedIngest(unittest.TestCase):
+
+    def test_files_are_indexed_per_collection(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "data")
+            for key in ("work/report.pdf", "work/plan.docx", "home/list.xlsx"):
+                os.makedirs(os.path.dirname(os.path.join(source, key)), exist_ok=True)
+                with open(os.path.join(source, key), "w") as f:
+                    f.write(key)
+            root = os.path.join(tmp, "shards")
+
+            def split(path, digest=None):
+                return [Document(page_content=ingest.manifest_key(path), metadata={"source": path})], 0.0
+
+            with patch("ingest.SOURCE_DIR", source), patch("ingest.SHARDS_PATH", root), \
+                    patch("ingest.TEXT_CACHE_PATH", os.path.join(tmp, "text_cache.sqlite")), \
+                    patch("ingest.INGEST_METRICS_FILE", os.path.join(tmp, "ingest_metrics.jsonl")), \
+                    patch("ingest.create_embeddings"), \
+                    patch("ingest.EmbeddingCache", return_value=EmbeddingCache(os.path.join(tmp, "cache.sqlite"))), \
+                    patch("ingest.CachedEmbeddings", return_value=CountingEmbeddings()), \
+                    patch("ingest.load_and_split", side_effect=split), \
+                    patch("ingest.publish_search_index"), \
+                    patch.dict(CountingEmbeddings.TABLE, {
+                        "work/report.pdf": [1.0, 0.0], "work/plan.docx": [0.0, 1.0], "home/list.xlsx": [0.6, 0.8]
+                    }):
+                ingest.build_vector_db(shard_by="dir")
+                catalog = load_catalog(root)
+                self.assertEqual(catalog["shard_by"], "dir")
+                self.assertEqual(catalog["shards"]["work"], {"folder": "work", "files": 2, "vectors": 2})
+                self.assertEqual(catalog["shards"]["home"]["vectors"], 1)
+                self.assertEqual(set(ingest.load_manifest(os.path.join(root, "manifest.json"))),
+                                 {"work/report.pdf", "work/plan.docx", "home/list.xlsx"})
+
+                # Removing a collection's last file drops its shard; other shards are untouched
+                os.remove(os.path.join(source, "home/list.xlsx"))
+                with patch("ingest.update_index", wraps=ingest.update_index) as update:
+                    ingest.build_vector_db()
+                self.assertEqual([c[0][0] for c in update.call_args_list], [os.path.join(root, "home")])
+                self.assertEqual(list(load_catalog(root)["shards"]), ["work"])
+                self.assertFalse(os.path.exists(os.path.join(root, "home")))
+
+                with self.assertRaises(ValueError):
+                    ingest.build_vector_db(shard_by="type")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import sys
+import tempfile
+import unittest
+from langchain_core.documents import Document
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_cache import TextCache  # noqa: E402
+
+PAGES = [
+    Document(page_content="First page text", metadata={"source": "./data/old.pdf", "page": 0}),
+    Document(page_content="Second page: ünïcode", metadata={"source": "./data/old.pdf", "page": 1}),
+]
+
+
+class TestTextCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "text_cache.sqlite")
+        self.cache = TextCache(self.path)
+        self.addCleanup(self.cache.close)
+
+    def test_lookup_does_not_create_the_cache(self):
+        self.assertFalse(self.cache.contains("digest", "PyPDFLoader"))
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_pages_round_trip_under_the_current_path(self):
+        calls = []
+
+        def extract():
+            calls.append(1)
+            return PAGES
+
+        first = list(self.cache.load("digest", "PyPDFLoader", "./data/old.pdf", extract))
+        again = list(self.cache.load("digest", "PyPDFLoader", "./data/renamed.pdf", extract))
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(first, PAGES)
+        self.assertEqual([doc.page_content for doc in again], [doc.page_content for doc in PAGES])
+        self.assertEqual(again[1].metadata, {"source": "./data/renamed.pdf", "page": 1})
+        # A different loader extracts different text, so it has its own entry
+        self.assertFalse(self.cache.contains("digest", "UnstructuredPDFLoader"))
+
+    def test_partially_recorded_file_is_not_served(self):
+        pages = self.cache.record("digest", "PyPDFLoader", iter(PAGES))
+        next(pages)
+        pages.close()
+        self.assertFalse(self.cache.contains("digest", "PyPDFLoader"))
+
+    def test_prune_keeps_listed_hashes(self):
+        list(self.cache.record("keep", "PyPDFLoader", PAGES))
+        list(self.cache.record("drop", "PyPDFLoader", PAGES))
+        self.assertEqual(self.cache.prune({"keep"}), 1)
+        self.assertTrue(self.cache.contains("keep", "PyPDFLoader"))
+        self.assertFalse(self.cache.contains("drop", "PyPDFLoader"))
+
+
+if __name__ == "__main__":
+    unittest.main()
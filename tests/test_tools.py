@@ -1,16 +1,25 @@
 import os
 import sys
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from tools import get_retriever_tool  # noqa: E402
+import tools  # noqa: E402
+from lexical_index import LexicalIndex, lexical_index_path  # noqa: E402
+from shards import ShardedIndex, save_catalog, shard_folder  # noqa: E402
+from index_versions import publish_version, stage_version  # noqa: E402
 
 
 class TestTools(unittest.TestCase):
+    def setUp(self):
+        tools.reset_vectorstore()
+        self.addCleanup(tools.reset_vectorstore)
+
     @patch("tools.FAISS")
-    @patch("tools.OpenAIEmbeddings")
+    @patch("tools.create_embeddings")
     @patch("os.path.exists")
     def test_tool_definition(self, mock_exists, mock_embeddings, mock_faiss):
         # Mock path exists
@@ -31,6 +40,93 @@ class TestTools(unittest.TestCase):
         # Verify FAISS was loaded
         mock_faiss.load_local.assert_called_once()
 
+    @patch("tools.enable_reconstruct")
+    @patch("tools.apply_search_params")
+    @patch("tools.load_index_config")
+    @patch("tools.load_search_vectorstore")
+    @patch("tools.FAISS")
+    @patch("tools.create_embeddings")
+    @patch("os.path.exists")
+    def test_loads_published_search_index(self, mock_exists, mock_embeddings, mock_faiss, mock_load_search, mock_config,
+                                          mock_apply, mock_reconstruct):
+        """An approximate index published by ingest is loaded instead of the exact one."""
+        mock_exists.return_value = True
+        mock_config.return_value = {"type": "ivf-flat", "nprobe": 8}
+        mock_db = MagicMock()
+        mock_load_search.return_value = mock_db
+
+        get_retriever_tool()
+
+        mock_faiss.load_local.assert_not_called()
+        self.assertIn("io_flags", mock_load_search.call_args[1])
+        mock_apply.assert_called_once_with(mock_db.index, mock_config.return_value)
+        # The IVF direct map is built at load, not by concurrent retrievals
+        mock_reconstruct.assert_called_once_with(mock_db.index)
+
+    @patch("tools.FAISS")
+    @patch("tools.create_embeddings")
+    @patch("os.path.exists")
+    def test_vectorstore_is_loaded_once_per_process(self, mock_exists, mock_embeddings, mock_faiss):
+        mock_exists.return_value = True
+
+        get_retriever_tool()
+        get_retriever_tool()
+
+        mock_faiss.load_local.assert_called_once()
+        self.assertIn("io_flags", mock_faiss.load_local.call_args[1])
+
+    @patch("tools.FAISS")
+    @patch("tools.create_embeddings")
+    @patch("os.path.exists")
+    def test_falls_back_when_index_cannot_be_mapped(self, mock_exists, mock_embeddings, mock_faiss):
+        mock_exists.return_value = True
+        mock_db = MagicMock()
+        mock_faiss.load_local.side_effect = [RuntimeError("mmap not supported"), mock_db]
+
+        self.assertIs(tools.get_vectorstore(), mock_db)
+        self.assertNotIn("io_flags", mock_faiss.load_local.call_args[1])
+
+    def test_lexical_index_is_optional(self):
+        with tempfile.TemporaryDirectory() as folder:
+            self.assertIsNone(tools.get_lexical_index(folder))
+            built = LexicalIndex(lexical_index_path(folder))
+            built.add({"id-1": "invoice INV-1"})
+            built.close()
+            index = tools.get_lexical_index(folder)
+            self.assertIsInstance(index, LexicalIndex)
+            self.assertIs(tools.get_lexical_index(folder), index)
+            tools.reset_vectorstore()
+
+    @patch("tools.load_vectorstore")
+    @patch("tools.create_embeddings")
+    def test_sharded_layout_loads_shards_lazily(self, mock_embeddings, mock_load):
+        with tempfile.TemporaryDirectory() as root:
+            save_catalog({"shard_by": "type", "shards": {"pdf": {"folder": "pdf"}, "slides": {"folder": "slides"}}}, root)
+            with patch("tools.SHARDS_PATH", root):
+                vectorstore = tools.get_vectorstore()
+                self.assertIsInstance(vectorstore, ShardedIndex)
+                self.assertIsNone(tools.get_lexical_index())
+            mock_load.assert_not_called()
+            vectorstore.shard("slides")
+            mock_load.assert_called_once_with(os.path.join(root, "slides"), mock_embeddings.return_value)
+
+    def test_published_version_tracks_single_and_sharded_indexes(self):
+        with tempfile.TemporaryDirectory() as folder:
+            shards = os.path.join(folder, "shards")
+            with patch("tools.FAISS_INDEX_PATH", os.path.join(folder, "faiss_index")), \
+                    patch("tools.SHARDS_PATH", shards):
+                before = tools.published_version()
+                publish_version(os.path.join(folder, "faiss_index"), stage_version(os.path.join(folder, "faiss_index"))[0])
+                single = tools.published_version()
+                self.assertNotEqual(single, before)
+                self.assertEqual(single, tools.published_version())
+
+                # A sharded ingest changes it through any shard's version
+                save_catalog({"shard_by": "dir", "shards": {"root": {"folder": "root"}}}, shards)
+                sharded = tools.published_version()
+                publish_version(shard_folder("root", shards), stage_version(shard_folder("root", shards))[0])
+                self.assertNotEqual(tools.published_version(), sharded)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,186 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+from langchain_core.documents import Document
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingest  # noqa: E402
+import tools  # noqa: E402
+from embedding_backends import HashingEmbeddings, backend_info  # noqa: E402
+from index_versions import current_version, has_staged_version  # noqa: E402
+from shards import load_catalog  # noqa: E402
+from watch import Watcher  # noqa: E402
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def write(folder, name, text):
+    path = os.path.join(folder, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+    return path
+
+
+def load_text(file_path, digest=None):
+    """Stand-in for parsing: each line of a file is one chunk."""
+    with open(file_path) as f:
+        lines = f.read().splitlines()
+    return [Document(page_content=line, metadata={"source": file_path}) for line in lines], 0.0
+
+
+class TestWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.data = os.path.join(self.tmp.name, "data")
+        self.root = os.path.join(self.tmp.name, "faiss_index")
+        self.shards = os.path.join(self.tmp.name, "shards")
+        self.manifest_file = os.path.join(self.tmp.name, "manifest.json")
+        os.makedirs(self.data)
+        for p in (patch("builtins.print"), patch("ingest.SOURCE_DIR", self.data),
+                  patch("ingest.FAISS_INDEX_PATH", self.root), patch("ingest.SHARDS_PATH", self.shards),
+                  patch("ingest.TEXT_CACHE_PATH", ":memory:"),
+                  patch("ingest.INGEST_METRICS_FILE", os.path.join(self.tmp.name, "ingest_metrics.jsonl")),
+                  patch.dict(os.environ, {"EMBEDDING_BACKEND": "hashing"})):
+            p.start()
+            self.addCleanup(p.stop)
+        load = patch("ingest.load_and_split", side_effect=load_text)
+        self.mock_load = load.start()
+        self.addCleanup(load.stop)
+        self.clock = FakeClock()
+
+    def watcher(self, shard_by=None):
+        embeddings = HashingEmbeddings()
+        watcher = Watcher(
+            embeddings, self.manifest_file, backend_info("hashing", embeddings), shard_by, poll_seconds=1.0,
+            max_poll_seconds=8.0, debounce_seconds=5.0, persist_seconds=60.0, clock=self.clock
+        )
+        watcher.start()
+        self.addCleanup(watcher.close)
+        return watcher
+
+    def advance(self, watcher, seconds):
+        self.clock.now += seconds
+        return watcher.poll()
+
+    def published_vectors(self, root=None):
+        return tools.load_vectorstore(root or self.root).index.ntotal
+
+    def test_burst_is_applied_once_and_published_on_schedule(self):
+        watcher = self.watcher()
+        write(self.data, "a.pdf", "invoice INV-1\ninvoice INV-2")
+        self.assertEqual(self.advance(watcher, 1), 1.0)
+        write(self.data, os.path.join("reports", "q1.pdf"), "revenue grew 12%")
+        self.advance(watcher, 2)
+        # Still within the debounce window of the last change
+        self.advance(watcher, 3)
+        self.mock_load.assert_not_called()
+
+        self.advance(watcher, 3)
+        self.assertEqual(self.mock_load.call_count, 2)
+        self.assertEqual(watcher.residents[None].vectorstore.index.ntotal, 3)
+        # Applied in memory, published once persist_seconds have passed
+        self.assertIsNone(current_version(self.root))
+        self.assertEqual(self.advance(watcher, 1), 2.0)
+        self.advance(watcher, 60)
+        self.assertIsNotNone(current_version(self.root))
+        self.assertEqual(self.published_vectors(), 3)
+        with open(self.manifest_file) as f:
+            self.assertEqual(sorted(json.load(f)), ["a.pdf", "reports/q1.pdf"])
+
+    def test_modified_and_deleted_files(self):
+        watcher = self.watcher()
+        write(self.data, "a.pdf", "invoice INV-1\ninvoice INV-2")
+        write(self.data, os.path.join("reports", "q1.pdf"), "revenue grew 12%")
+        self.advance(watcher, 1)
+        self.advance(watcher, 5)
+        self.assertEqual(watcher.residents[None].vectorstore.index.ntotal, 3)
+
+        # An older mtime, as from a restored backup, is a change too
+        mtime = os.path.getmtime(write(self.data, "a.pdf", "invoice INV-3")) - 3600
+        os.utime(os.path.join(self.data, "a.pdf"), (mtime, mtime))
+        os.remove(os.path.join(self.data, "reports", "q1.pdf"))
+        self.advance(watcher, 1)
+        self.advance(watcher, 5)
+        self.assertEqual(watcher.residents[None].vectorstore.index.ntotal, 1)
+
+        # Stopping publishes what was applied and drops the working copy
+        watcher.close()
+        self.assertEqual(self.published_vectors(), 1)
+        self.assertFalse(has_staged_version(self.root))
+
+    def test_idle_polls_back_off_without_touching_the_index(self):
+        write(self.data, "a.pdf", "invoice INV-1")
+        watcher = self.watcher()
+        # Changes made while nobody was watching are applied at once
+        self.advance(watcher, 1)
+        self.assertEqual(self.mock_load.call_count, 1)
+        watcher.close()
+
+        watcher = self.watcher()
+        self.assertEqual(watcher.dirty, set())
+        with patch("ingest.open_vectorstore") as mock_open, patch("ingest.hash_file") as mock_hash:
+            waits = [self.advance(watcher, 0) for _ in range(5)]
+        self.assertEqual(waits, [2.0, 4.0, 8.0, 8.0, 8.0])
+        mock_open.assert_not_called()
+        mock_hash.assert_not_called()
+        self.assertEqual(self.mock_load.call_count, 1)
+        self.assertIsNotNone(watcher.residents[None].vectorstore)
+
+    def test_one_shot_runs_follow_the_same_tree(self):
+        watcher = self.watcher()
+        write(self.data, "a.pdf", "invoice INV-1")
+        write(self.data, os.path.join("sub", "c.docx"), "contract C-7")
+        self.advance(watcher, 1)
+        self.advance(watcher, 5)
+        watcher.close()
+
+        os.remove(os.path.join(self.data, "sub", "c.docx"))
+        write(self.data, os.path.join("sub", "d.docx"), "contract D-9\nsigned")
+        with patch("ingest.MANIFEST_FILE", self.manifest_file):
+            ingest.build_vector_db()
+        with open(self.manifest_file) as f:
+            self.assertEqual(sorted(json.load(f)), ["a.pdf", "sub/d.docx"])
+        self.assertEqual(self.published_vectors(), 3)
+
+    def test_sharded_layout(self):
+        watcher = self.watcher(shard_by="dir")
+        write(self.data, "a.pdf", "invoice INV-1")
+        write(self.data, os.path.join("reports", "q1.pdf"), "revenue grew 12%\nmargins held")
+        self.advance(watcher, 1)
+        self.advance(watcher, 5)
+        self.advance(watcher, 60)
+        catalog = load_catalog(self.shards)
+        self.assertEqual({name: shard["vectors"] for name, shard in catalog["shards"].items()}, {"root": 1, "reports": 2})
+        self.assertEqual(self.published_vectors(os.path.join(self.shards, "reports")), 2)
+
+        os.remove(os.path.join(self.data, "reports", "q1.pdf"))
+        self.advance(watcher, 1)
+        self.advance(watcher, 5)
+        watcher.close()
+        self.assertEqual(sorted(load_catalog(self.shards)["shards"]), ["root"])
+        self.assertFalse(os.path.exists(os.path.join(self.shards, "reports")))
+
+    def test_parse_args(self):
+        args = ingest.parse_args(["--watch", "--debounce-seconds", "1.5"])
+        self.assertTrue(args.watch)
+        self.assertEqual((args.debounce_seconds, args.persist_seconds), (1.5, ingest.WATCH_PERSIST_SECONDS))
+        with patch("sys.stderr"), self.assertRaises(SystemExit):
+            ingest.parse_args(["--watch", "--rebuild-from-cache"])
+
+
+if __name__ == "__main__":
+    unittest.main()
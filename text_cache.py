@@ -0,0 +1,114 @@
+import os
+import json
+import zlib
+import sqlite3
+from langchain_core.documents import Document
+
+TEXT_CACHE_PATH = "./db/text_cache.sqlite"
+# Pages are written in transactions of this many, so a huge file does not hold one open transaction
+_COMMIT_EVERY = 200
+
+
+def _pack(doc):
+    return zlib.compress(doc.page_content.encode("utf-8")), json.dumps(doc.metadata, default=str)
+
+
+class TextCache:
+    """
+    On-disk cache of the text a loader extracted from a file, one row per page/element,
+    keyed by the file's SHA-256 and the loader that produced it. Page text is zlib-compressed.
+    A file only counts as cached once all of its pages were written, so a run interrupted
+    mid-file never serves a partial document. Like EmbeddingCache, the SQLite file is only
+    opened on first use, and lookups on a cache that does not exist yet do not create it.
+    """
+
+    def __init__(self, path=TEXT_CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Worker processes may write to the cache at the same time
+            self._conn = sqlite3.connect(self.path, timeout=60)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files (sha256 TEXT NOT NULL, extractor TEXT NOT NULL, "
+                "pages INTEGER NOT NULL, PRIMARY KEY (sha256, extractor))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages (sha256 TEXT NOT NULL, extractor TEXT NOT NULL, "
+                "position INTEGER NOT NULL, text BLOB NOT NULL, metadata TEXT NOT NULL, "
+                "PRIMARY KEY (sha256, extractor, position)) WITHOUT ROWID"
+            )
+        return self._conn
+
+    def contains(self, digest, extractor):
+        if self._conn is None and not os.path.isfile(self.path):
+            return False
+        row = self._connect().execute(
+            "SELECT 1 FROM files WHERE sha256 = ? AND extractor = ?", (digest, extractor)
+        ).fetchone()
+        return row is not None
+
+    def iter_pages(self, digest, extractor, source):
+        """Yield the cached pages of a file in order, with their source set to its current path."""
+        rows = self._connect().execute(
+            "SELECT text, metadata FROM pages WHERE sha256 = ? AND extractor = ? ORDER BY position",
+            (digest, extractor)
+        )
+        for text, metadata in rows:
+            metadata = json.loads(metadata)
+            metadata["source"] = source
+            yield Document(page_content=zlib.decompress(text).decode("utf-8"), metadata=metadata)
+
+    def record(self, digest, extractor, pages):
+        """Pass pages through while writing them; the file is marked cached once they are exhausted."""
+        conn = self._connect()
+        conn.execute("DELETE FROM pages WHERE sha256 = ? AND extractor = ?", (digest, extractor))
+        count = 0
+        for doc in pages:
+            conn.execute(
+                "INSERT INTO pages (sha256, extractor, position, text, metadata) VALUES (?, ?, ?, ?, ?)",
+                (digest, extractor, count, *_pack(doc))
+            )
+            count += 1
+            if count % _COMMIT_EVERY == 0:
+                conn.commit()
+            yield doc
+        conn.execute(
+            "INSERT OR REPLACE INTO files (sha256, extractor, pages) VALUES (?, ?, ?)", (digest, extractor, count)
+        )
+        conn.commit()
+
+    def load(self, digest, extractor, source, extract):
+        """
+        Pages of a file, from the cache when present, else from `extract()` (an iterable of
+        Documents) while recording them. Returns a generator, so streaming callers stay lazy.
+        """
+        if self.contains(digest, extractor):
+            self.hits += 1
+            return self.iter_pages(digest, extractor, source)
+        self.misses += 1
+        return self.record(digest, extractor, extract())
+
+    def prune(self, keep):
+        """Drop the text of every file whose hash is not in `keep`; returns the number of files dropped."""
+        if self._conn is None and not os.path.isfile(self.path):
+            return 0
+        conn = self._connect()
+        stale = [row[0] for row in conn.execute("SELECT DISTINCT sha256 FROM files") if row[0] not in keep]
+        for digest in stale:
+            conn.execute("DELETE FROM pages WHERE sha256 = ?", (digest,))
+            conn.execute("DELETE FROM files WHERE sha256 = ?", (digest,))
+        conn.commit()
+        return len(stale)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -1,21 +1,279 @@
 from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
 from langchain_core.tools import create_retriever_tool
+from embedding_backends import backend_info, check_backend, create_embeddings
+from index_factory import (
+    load_index_config, load_search_vectorstore, apply_search_params, enable_reconstruct, mmap_io_flags
+)
+from docstore import bind_docstore, close_docstore
+from retrieval import PackedRetriever, retrieval_settings
+from lexical_index import LexicalIndex, lexical_index_path
+from shards import SHARDS_PATH, ShardedIndex, load_catalog, shard_folder
+from index_versions import current_version, resolve_index, version_folder
+from contextlib import contextmanager
+import metrics
 import os
+import time
+import threading
 
+FAISS_INDEX_PATH = "./db/faiss_index"
+# Seconds between checks for an index version published by ingest; 0 turns hot reload off
+INDEX_RELOAD_SECONDS = 2.0
 
-def get_retriever_tool():
-    # Load the existing database
-    embeddings = OpenAIEmbeddings()
-    faiss_path = "./db/faiss_index"
+# One vectorstore per process, shared by every retriever tool built in it
+_vectorstore = None
+_vectorstore_lock = threading.Lock()
+_lexical_index = None
+# Published version the loaded index came from, bumped generation on every hot reload
+_loaded_version = None
+_generation = 0
+_last_check = 0.0
+_reloading = False
+# Requests using each generation (see index_lease), and the (vectorstore, lexical index) of the
+# generations a reload replaced, closed once no request uses them
+_leases = {}
+_retired = {}
+
+
+def load_vectorstore(faiss_path=FAISS_INDEX_PATH, embeddings=None):
+    """
+    Load the published index (the current version under faiss_path, see index_versions),
+    memory-mapping the FAISS file where the index type allows it so several worker processes
+    share one copy through the OS page cache.
+    Queries are embedded by the configured backend (EMBEDDING_BACKEND); an index built by
+    another backend is refused, since its vectors are not comparable with the query's.
+    """
+    embeddings = embeddings or create_embeddings()
     if not os.path.exists(faiss_path):
         raise FileNotFoundError(f"FAISS index not found at {faiss_path}. Run ingest.py first.")
-    vectorstore = FAISS.load_local(faiss_path, embeddings, allow_dangerous_deserialization=True)
-    retriever = vectorstore.as_retriever()
+    faiss_path = resolve_index(faiss_path)
+    # ingest publishes either the exact index or an approximate "search" index next to it
+    index_config = load_index_config(faiss_path)
+    check_backend(index_config, backend_info(None, embeddings), faiss_path)
+
+    start = time.perf_counter()
+    try:
+        vectorstore = _open_index(faiss_path, embeddings, index_config, io_flags=mmap_io_flags(index_config))
+        mode = "memory-mapped"
+    except RuntimeError:
+        vectorstore = _open_index(faiss_path, embeddings, index_config)
+        mode = "in memory"
+    # An SQLite docstore only fetches the chunks a query hits
+    bind_docstore(vectorstore, faiss_path)
+    if index_config["type"] != "flat":
+        apply_search_params(vectorstore.index, index_config)
+    if index_config["type"].startswith("ivf"):
+        # Retrieval reconstructs candidate vectors for MMR from threads sharing this index
+        enable_reconstruct(vectorstore.index)
+    print(
+        f"Loaded {index_config['type']} index ({vectorstore.index.ntotal} vectors, {mode}) "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+    return vectorstore
+
+
+def _open_index(folder, embeddings, index_config, **kwargs):
+    if index_config["type"] == "flat":
+        return FAISS.load_local(folder, embeddings, allow_dangerous_deserialization=True, **kwargs)
+    # The search index shares the exact index's docstore rather than pickling its own
+    return load_search_vectorstore(folder, embeddings, **kwargs)
+
+
+def load_shard(folder, embeddings):
+    """(vectorstore, lexical index or None) of one shard of a sharded layout."""
+    folder = resolve_index(folder)
+    lexical_index = LexicalIndex(lexical_index_path(folder)) if os.path.isfile(lexical_index_path(folder)) else None
+    return load_vectorstore(folder, embeddings), lexical_index
+
+
+def published_version():
+    """
+    What ingest last published, from the CURRENT pointers alone: the version of the single
+    index, or the versions of all shards. Cheap enough to compare on every request.
+    """
+    catalog = load_catalog(SHARDS_PATH)
+    if catalog is not None:
+        return tuple(
+            (name, current_version(shard_folder(shard["folder"], SHARDS_PATH)))
+            for name, shard in sorted(catalog["shards"].items())
+        )
+    return current_version(FAISS_INDEX_PATH)
+
+
+def _load():
+    """
+    (vectorstore, lexical index or None, published version) of the layout on disk. The FAISS and
+    BM25 indexes of a single index come from the one version CURRENT named when it was read;
+    shards carry their own lexical indexes.
+    """
+    catalog = load_catalog(SHARDS_PATH)
+    if catalog is not None:
+        version = published_version()
+        vectorstore = ShardedIndex(catalog, load_shard, create_embeddings(), SHARDS_PATH)
+        print(f"Found {len(catalog['shards'])} shards in {SHARDS_PATH}: {', '.join(vectorstore.names)}")
+        return vectorstore, None, version
+    version = current_version(FAISS_INDEX_PATH)
+    folder = version_folder(FAISS_INDEX_PATH, version)
+    return load_vectorstore(folder), _open_lexical_index(folder), version
+
+
+def get_vectorstore():
+    """
+    Process-wide vectorstore, loaded on first use. When ingest built a sharded layout
+    (--shard-by), this is a ShardedIndex whose shards load when a question first needs them.
+    Once loaded, a newer published version is picked up in the background (see refresh_index).
+    """
+    global _vectorstore, _lexical_index, _loaded_version
+    if _vectorstore is None:
+        with _vectorstore_lock:
+            if _vectorstore is None:
+                _vectorstore, lexical_index, _loaded_version = _load()
+                if _lexical_index is None:
+                    _lexical_index = lexical_index
+    else:
+        refresh_index()
+    return _vectorstore
+
+
+def reload_interval():
+    return float(os.getenv("INDEX_RELOAD_SECONDS", INDEX_RELOAD_SECONDS))
+
+
+def refresh_index():
+    """
+    If ingest has published a new index version since the loaded one, start loading it in a
+    background thread. Checks run at most every INDEX_RELOAD_SECONDS and only read the CURRENT
+    pointers. Requests keep using the loaded index while the new one loads, and the ones in flight
+    during the swap finish on it. Returns True if a reload was started.
+    """
+    global _last_check, _reloading
+    interval = reload_interval()
+    now = time.monotonic()
+    if _vectorstore is None or interval <= 0 or _reloading or now - _last_check < interval:
+        return False
+    _last_check = now
+    version = published_version()
+    if version == _loaded_version:
+        return False
+    with _vectorstore_lock:
+        if _reloading:
+            return False
+        _reloading = True
+    threading.Thread(target=_reload, name="index-reload", daemon=True).start()
+    return True
+
+
+def _reload():
+    global _vectorstore, _lexical_index, _loaded_version, _generation, _reloading
+    start = time.perf_counter()
+    version = published_version()
+    try:
+        vectorstore, lexical_index, version = _load()
+    except Exception as error:
+        print(f"Could not load the new index version, still serving the previous one: {error}")
+        # Retried once ingest publishes again
+        _loaded_version = version
+    else:
+        # Only the references are swapped: requests holding the previous index finish on it,
+        # and its files stay readable until ingest prunes old versions
+        with _vectorstore_lock:
+            _retired[_generation] = (_vectorstore, _lexical_index)
+            _vectorstore, _lexical_index, _loaded_version = vectorstore, lexical_index, version
+            _generation += 1
+            _close_retired()
+        metrics.observe("chat.index_reload", time.perf_counter() - start)
+        print(f"Reloaded the index, now serving version {version}")
+    finally:
+        _reloading = False
+
+
+def index_generation():
+    """Number of hot reloads so far; objects built around the vectorstore are rebuilt when it changes."""
+    return _generation
+
+
+def loaded_index():
+    """
+    (generation, published version) of the index requests are answered from. Unlike
+    published_version it changes only once a reload has swapped the new version in.
+    """
+    return _generation, _loaded_version
+
+
+@contextmanager
+def index_lease():
+    """
+    Hold the loaded index for the length of one request: when a reload replaces it, its SQLite
+    docstore and lexical index are closed only once every request holding it is done.
+    Yields the index generation the request started on.
+    """
+    with _vectorstore_lock:
+        generation = _generation
+        _leases[generation] = _leases.get(generation, 0) + 1
+    try:
+        yield generation
+    finally:
+        with _vectorstore_lock:
+            _leases[generation] -= 1
+            if not _leases[generation]:
+                del _leases[generation]
+            _close_retired()
+
+
+def _close_retired():
+    # Called with _vectorstore_lock held
+    for generation in [generation for generation in _retired if generation not in _leases]:
+        _close_index(*_retired.pop(generation))
+
+
+def _close_index(vectorstore, lexical_index):
+    if isinstance(vectorstore, ShardedIndex):
+        vectorstore.close()
+    elif vectorstore is not None:
+        close_docstore(vectorstore)
+    if lexical_index is not None:
+        lexical_index.close()
+
+
+def _open_lexical_index(faiss_path):
+    path = lexical_index_path(resolve_index(faiss_path))
+    return LexicalIndex(path) if os.path.isfile(path) else None
+
+
+def get_lexical_index(faiss_path=FAISS_INDEX_PATH):
+    """
+    Process-wide BM25 index published next to the FAISS index, or None if ingest has not built one.
+    Shards carry their own lexical indexes, so this is None for a sharded layout.
+    """
+    global _lexical_index
+    if _lexical_index is None and load_catalog(SHARDS_PATH) is None:
+        with _vectorstore_lock:
+            if _lexical_index is None:
+                _lexical_index = _open_lexical_index(faiss_path)
+    return _lexical_index
+
+
+def reset_vectorstore():
+    """Drop the cached vectorstore and lexical index so the next call reloads them from disk."""
+    global _vectorstore, _lexical_index, _loaded_version
+    with _vectorstore_lock:
+        _close_index(_vectorstore, _lexical_index)
+        for retired in _retired.values():
+            _close_index(*retired)
+        _retired.clear()
+        _vectorstore = _lexical_index = _loaded_version = None
+
+
+def get_retriever_tool():
+    # Load the existing database; the retriever diversifies, merges and packs the chunks it returns
+    retriever = PackedRetriever(
+        vectorstore=get_vectorstore(), settings=retrieval_settings(), lexical_index=get_lexical_index()
+    )
 
     # Wrap it as a tool
     return create_retriever_tool(
         retriever,
         "search_personal_docs",
-        "Use this tool to find information from the user's uploaded files and notes."
+        "Use this tool to find information from the user's uploaded files and notes.",
+        # Keep the retrieved chunks on the tool message so answers can cite their sources
+        response_format="content_and_artifact"
     )
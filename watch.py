@@ -0,0 +1,308 @@
+import os
+import time
+import shutil
+import signal
+import threading
+import metrics
+import ingest
+from dedup import NEAR_DUP_THRESHOLD, DedupIndex, dedup_path
+from docstore import close_docstore
+from embedding_backends import check_backend
+from embedding_client import ConcurrentEmbeddings
+from index_factory import load_index_config, publish_search_index, save_index_config
+from index_versions import discard_staged_version, has_staged_version, mark_checkpoint, publish_version, stage_version
+from shards import collection_of, load_catalog, save_catalog, shard_folder
+
+
+class ResidentIndex:
+    """
+    One index root held open by the watcher: a staged working copy of its published version (see
+    index_versions) with the vectorstore and dedup records loaded from it. apply() changes them in
+    memory; save() writes them to the working copy and publish() publishes a copy of it, so the
+    index is never loaded again while the watcher runs.
+    """
+
+    def __init__(self, folder, embeddings, embedding_info=None, dedup_threshold=NEAR_DUP_THRESHOLD):
+        self.folder = folder
+        self.embeddings = embeddings
+        self.working, self.changed = stage_version(folder)
+        if self.changed:
+            print(f"Resuming the unpublished index version left in {self.working} by an interrupted run")
+        self.index_config = load_index_config(self.working)
+        self.vectorstore = ingest.open_vectorstore(self.working, embeddings)
+        if embedding_info is not None:
+            if self.vectorstore is not None:
+                try:
+                    check_backend(self.index_config, embedding_info, folder)
+                except ValueError:
+                    close_docstore(self.vectorstore)
+                    if not self.changed:
+                        discard_staged_version(folder)
+                    raise
+            self.index_config["embedding"] = embedding_info
+        save_index_config(self.working, self.index_config)
+        self.dedup = None
+        if dedup_threshold is not None or os.path.isfile(dedup_path(self.working)):
+            self.dedup = DedupIndex(dedup_path(self.working), dedup_threshold)
+
+    def apply(self, manifest, pending, file_info, removed, **options):
+        """Apply one set of changes in memory (see ingest.apply_changes); returns the chunks embedded."""
+        def add(current, chunks, ids):
+            return ingest.add_chunks(current, chunks, ids, self.embeddings, folder=self.working)
+
+        self.vectorstore, chunks, _ = ingest.apply_changes(
+            self.vectorstore, manifest, pending, file_info, removed, add, self.dedup, **options
+        )
+        self.changed = True
+        return chunks
+
+    def save(self):
+        if self.vectorstore is not None:
+            ingest.save_checkpoint(self.vectorstore, None, self.working, dedup=self.dedup)
+            mark_checkpoint(self.working)
+
+    def publish(self):
+        """
+        Publish a copy of the saved working folder: the search index is updated in place (see
+        index_factory.publish_search_index) and files unchanged since the published version are
+        hard-linked rather than copied. Returns the version, or None while there is no index yet.
+        """
+        version = None
+        if self.vectorstore is not None:
+            with metrics.timer("ingest.publish"):
+                publish_search_index(self.vectorstore, self.working, self.index_config)
+                version = publish_version(self.folder, self.working, copy=True)
+        self.changed = False
+        return version
+
+    def close(self):
+        """Release the open files; the working copy is kept only if it holds unpublished changes."""
+        if self.dedup is not None:
+            self.dedup.close()
+        if self.vectorstore is not None:
+            close_docstore(self.vectorstore)
+        if not self.changed:
+            discard_staged_version(self.folder)
+
+
+class Watcher:
+    """
+    ingest --watch: keeps the index (or, for a sharded layout, the shards changed so far) open
+    and applies changes to SOURCE_DIR and its subdirectories as they happen.
+
+    Each poll rescans the tree (see ingest.scan_tree) and compares it with the previous scan; nothing is
+    hashed, loaded or embedded while the tree is idle, and the poll interval doubles from
+    poll_seconds up to max_poll_seconds. Changed files are applied once the tree has been quiet
+    for debounce_seconds, so a burst (a copy in progress, a folder of new files) becomes one
+    update. Applied changes are published as a new index version (see index_versions) at most
+    persist_seconds later, and when the watcher stops. A batch that fails is retried whole.
+    `options` (workers, stream, batch_size) are passed to ingest.apply_changes.
+    """
+
+    def __init__(self, embeddings, manifest_file, embedding_info=None, shard_by=None, embedding_cache=None,
+                 poll_seconds=ingest.WATCH_POLL_SECONDS, max_poll_seconds=ingest.WATCH_MAX_POLL_SECONDS,
+                 debounce_seconds=ingest.WATCH_DEBOUNCE_SECONDS, persist_seconds=ingest.WATCH_PERSIST_SECONDS,
+                 dedup_threshold=NEAR_DUP_THRESHOLD, clock=time.monotonic, **options):
+        self.embeddings = embeddings
+        self.manifest_file = manifest_file
+        self.embedding_info = embedding_info
+        self.shard_by = shard_by
+        self.embedding_cache = embedding_cache
+        self.poll_seconds = poll_seconds
+        self.max_poll_seconds = max(max_poll_seconds, poll_seconds)
+        self.debounce_seconds = debounce_seconds
+        self.persist_seconds = persist_seconds
+        self.dedup_threshold = dedup_threshold
+        self.clock = clock
+        self.options = options
+        self.manifest = ingest.load_manifest(manifest_file)
+        self.residents = {}
+        self.snapshot = {}
+        # Changed manifest keys not applied yet, and when the tree last changed
+        self.dirty = set()
+        self.last_change = float("-inf")
+        # When the oldest change not published yet was applied
+        self.unpublished_since = None
+        self.interval = poll_seconds
+
+    def _folder(self, name):
+        return ingest.FAISS_INDEX_PATH if name is None else shard_folder(name, ingest.SHARDS_PATH)
+
+    def _resident(self, name):
+        if name not in self.residents:
+            self.residents[name] = ResidentIndex(
+                self._folder(name), self.embeddings, self.embedding_info, self.dedup_threshold
+            )
+        return self.residents[name]
+
+    def _scan(self):
+        with metrics.timer("ingest.scan"):
+            return ingest.scan_tree(ingest.SOURCE_DIR)
+
+    def start(self):
+        """
+        First scan: files whose mtime differs from the manifest are queued (an older mtime, as
+        from a restored backup, counts too), and the index (or the shards an interrupted run left
+        unpublished) is opened.
+        """
+        self.snapshot = self._scan()
+        for key, (mtime, _) in self.snapshot.items():
+            entry = self.manifest.get(key)
+            if entry is None or not ingest.is_complete(entry) or ingest.manifest_mtime(entry) != mtime:
+                self.dirty.add(key)
+        self.dirty.update(set(self.manifest) - set(self.snapshot))
+        if self.shard_by:
+            shards = os.listdir(ingest.SHARDS_PATH) if os.path.isdir(ingest.SHARDS_PATH) else []
+            names = [name for name in shards if has_staged_version(self._folder(name))]
+        else:
+            names = [None]
+        for name in names:
+            if self._resident(name).changed:
+                self.unpublished_since = self.clock()
+
+    def poll(self):
+        """Rescan, apply changes that have settled and publish when due; returns the seconds to wait until the next poll."""
+        snapshot = self._scan()
+        changed = {key for key in snapshot.keys() | self.snapshot.keys() if snapshot.get(key) != self.snapshot.get(key)}
+        self.snapshot = snapshot
+        now = self.clock()
+        if changed:
+            self.dirty |= changed
+            self.last_change = now
+            self.interval = self.poll_seconds
+        elif not self.dirty:
+            self.interval = min(self.interval * 2, self.max_poll_seconds)
+        if self.dirty and now - self.last_change >= self.debounce_seconds:
+            self.apply()
+        now = self.clock()
+        if self.unpublished_since is not None and now - self.unpublished_since >= self.persist_seconds:
+            self.persist()
+
+        wait = self.interval
+        if self.dirty:
+            wait = min(wait, self.last_change + self.debounce_seconds - now)
+        if self.unpublished_since is not None:
+            wait = min(wait, self.unpublished_since + self.persist_seconds - now)
+        return max(wait, 0.0)
+
+    def apply(self):
+        """Apply the queued changes to the open indexes; they are written to disk by persist()."""
+        keys, self.dirty = self.dirty, set()
+        run_start = time.perf_counter()
+        files = {key: self.snapshot[key][0] for key in keys if key in self.snapshot}
+        removed = sorted(key for key in keys if key not in self.snapshot and key in self.manifest)
+        try:
+            pending, file_info, _, manifest_changed = ingest.find_changed_files(self.manifest, files=files)
+            groups = {}
+            for file_path in pending:
+                groups.setdefault(self._collection(ingest.manifest_key(file_path)), ([], []))[0].append(file_path)
+            for key in removed:
+                groups.setdefault(self._collection(key), ([], []))[1].append(key)
+            total_chunks = 0
+            for name in sorted(groups, key=str):
+                shard_pending, shard_removed = groups[name]
+                if self.shard_by:
+                    print(f"--- Shard {name} ---")
+                total_chunks += self._resident(name).apply(
+                    self.manifest, shard_pending, file_info, shard_removed, **self.options
+                )
+        except Exception:
+            # The manifest entries of the files already applied make them skipped on the retry
+            self.dirty |= keys
+            raise
+
+        if (pending or removed or manifest_changed) and self.unpublished_since is None:
+            self.unpublished_since = self.clock()
+        if pending or removed:
+            print(f"Applied {len(pending)} changed and {len(removed)} removed files ({total_chunks} chunks) "
+                  f"in {time.perf_counter() - run_start:.2f}s")
+            if metrics.registry.enabled:
+                metrics.write_summary(ingest.ingest_summary(
+                    run_start, pending, removed, total_chunks, self.embedding_cache, watch=True,
+                    shard_by=self.shard_by, **self.options
+                ), ingest.INGEST_METRICS_FILE)
+            metrics.registry.reset("ingest.")
+
+    def _collection(self, key):
+        return collection_of(key, self.shard_by) if self.shard_by else None
+
+    def persist(self):
+        """
+        Save every changed index, then the manifest (so it never references unsaved chunks), then
+        publish each changed index as a new version.
+        """
+        changed = {name: resident for name, resident in self.residents.items() if resident.changed}
+        for resident in changed.values():
+            resident.save()
+        ingest.save_manifest(self.manifest, self.manifest_file)
+        for resident in changed.values():
+            version = resident.publish()
+            if version is not None:
+                print(f"Database updated and saved to {resident.folder} (version {version})")
+        if self.shard_by and changed:
+            self._update_catalog(changed)
+        ingest.prune_text_cache(self.manifest)
+        self.unpublished_since = None
+
+    def _update_catalog(self, changed):
+        """Record the changed shards in the catalog, deleting shards left without files (see ingest.update_shards)."""
+        catalog = load_catalog(ingest.SHARDS_PATH) or {"shard_by": self.shard_by, "shards": {}}
+        for name, resident in changed.items():
+            files = sum(1 for key in self.manifest if collection_of(key, self.shard_by) == name)
+            if files:
+                shard = catalog["shards"].setdefault(name, {"folder": name})
+                shard["files"] = files
+                if resident.vectorstore is not None:
+                    shard["vectors"] = resident.vectorstore.index.ntotal
+            else:
+                print(f"Shard {name} is empty, deleting it...")
+                catalog["shards"].pop(name, None)
+                self.residents.pop(name).close()
+                shutil.rmtree(resident.folder, ignore_errors=True)
+        save_catalog(catalog, ingest.SHARDS_PATH)
+
+    def close(self):
+        """Publish what is left and release the open indexes."""
+        try:
+            if self.unpublished_since is not None or any(resident.changed for resident in self.residents.values()):
+                self.persist()
+        finally:
+            for resident in self.residents.values():
+                resident.close()
+            self.residents = {}
+
+    def run(self, stop):
+        """Poll until `stop` (a threading.Event) is set, then publish what is left."""
+        self.start()
+        try:
+            while not stop.is_set():
+                try:
+                    wait = self.poll()
+                except Exception as error:
+                    print(f"Applying changes failed ({error}); retrying in {self.max_poll_seconds:.0f}s")
+                    wait = self.max_poll_seconds
+                stop.wait(wait)
+        finally:
+            self.close()
+
+
+def watch(shard_by=None, embedding_backend=None, embed_options=None, **settings):
+    """
+    `python ingest.py --watch`: watch SOURCE_DIR until Ctrl-C or SIGTERM, with the layout and
+    embedding setup of ingest.build_vector_db. `settings` are passed to Watcher.
+    """
+    shard_by, manifest_file = ingest.index_layout(shard_by)
+    model, embeddings, embedding_info, embedding_cache = ingest.open_embeddings(embedding_backend, embed_options)
+    watcher = Watcher(embeddings, manifest_file, embedding_info, shard_by, embedding_cache, **settings)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    print(f"Watching {ingest.SOURCE_DIR} for changes (Ctrl-C to stop)...")
+    try:
+        watcher.run(stop)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        embedding_cache.close()
+        if isinstance(model, ConcurrentEmbeddings):
+            model.close()
+    print("Stopped watching.")